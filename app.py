@@ -10,12 +10,21 @@ from flask_mail import Mail
 
 from dotenv import load_dotenv
 from bson import ObjectId
+from pymongo.errors import PyMongoError
 
 # Import modules
+from commands import register_commands
 from config import Config
 from models.user import User
 from extensions import mail, login_manager, serializer
 from extensions import mongo_client, db, users, layouts
+from utils.fragment_cache import fragment_cache
+from utils.indexes import ensure_indexes
+from utils.live_updates import layout_events
+from utils.mail_queue import mail_worker
+from utils.metrics import CommandMetrics, instrument_app, metrics
+from utils.mongo_client import mongo
+from utils.user_cache import user_cache
 
 # Import blueprints
 from routes.auth import auth_bp
@@ -32,8 +41,44 @@ def create_app(config_class=Config):
     app.config.from_object(config_class)
 
     # Initialize extensions
+    if app.config["METRICS_ENABLED"] and not app.config["METRICS_TOKEN"]:
+        raise ValueError("METRICS_ENABLED requires METRICS_TOKEN to protect /metrics")
+    metrics.configure(
+        app.config["METRICS_ENABLED"],
+        app.config["METRICS_DIR"],
+        app.config["METRICS_FLUSH_SECONDS"],
+    )
+    mongo.configure(
+        app.config["MONGODB_URI"],
+        app.config["MONGODB_DATABASE"],
+        maxPoolSize=app.config["MONGODB_MAX_POOL_SIZE"],
+        minPoolSize=app.config["MONGODB_MIN_POOL_SIZE"],
+        maxIdleTimeMS=app.config["MONGODB_MAX_IDLE_TIME_MS"] or None,
+        waitQueueTimeoutMS=app.config["MONGODB_WAIT_QUEUE_TIMEOUT_MS"] or None,
+        connectTimeoutMS=app.config["MONGODB_CONNECT_TIMEOUT_MS"],
+        socketTimeoutMS=app.config["MONGODB_SOCKET_TIMEOUT_MS"] or None,
+        serverSelectionTimeoutMS=app.config["MONGODB_SERVER_SELECTION_TIMEOUT_MS"],
+        compressors=[c for c in app.config["MONGODB_COMPRESSORS"].split(",") if c],
+        retryWrites=app.config["MONGODB_RETRY_WRITES"],
+        event_listeners=[CommandMetrics()] if metrics.enabled else [],
+    )
     login_manager.init_app(app)
     mail.init_app(app)
+    user_cache.configure(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+    fragment_cache.configure(
+        app.config["FRAGMENT_CACHE_BACKEND"],
+        app.config["FRAGMENT_CACHE_MAX_BYTES"],
+        app.config["FRAGMENT_CACHE_PATH"],
+    )
+    layout_events.configure(
+        app.config["LIVE_UPDATES_BACKEND"],
+        app.config["LIVE_UPDATES_QUEUE_SIZE"],
+        app.config["LIVE_UPDATES_CAPPED_BYTES"],
+        app.config["LIVE_UPDATES_MAX_STREAMS"],
+    )
+
+    if metrics.enabled:
+        instrument_app(app)
 
     # Register blueprints
     app.register_blueprint(auth_bp)
@@ -41,6 +86,23 @@ def create_app(config_class=Config):
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
 
+    # Deliver queued email from a thread in each worker process
+    if app.config["MAIL_QUEUE_WORKER"]:
+
+        @app.before_request
+        def start_mail_worker():
+            mail_worker.start(app)
+
+    # Register CLI commands
+    register_commands(app)
+
+    # Apply the index registry (idempotent)
+    if app.config["MONGODB_ENSURE_INDEXES"]:
+        try:
+            ensure_indexes(db)
+        except PyMongoError as e:
+            app.logger.warning(f"Could not ensure MongoDB indexes: {e}")
+
     # Setup error handlers
     @app.errorhandler(404)
     def page_not_found(e):
@@ -74,8 +136,17 @@ def safe_json(obj):
 def load_user(user_id):
     from bson import ObjectId
 
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
     user_data = users.find_one({"_id": ObjectId(user_id)})
-    return User(user_data) if user_data else None
+    if not user_data:
+        return None
+
+    user = User(user_data)
+    user_cache.set(user_id, user)
+    return user
 
 
 if __name__ == "__main__":
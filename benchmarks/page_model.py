@@ -0,0 +1,202 @@
+"""Benchmark the Page model against the plain dicts it replaced.
+
+Builds a large layout from a flatplan JSON file (repeating its pages and
+mixing in pages with fractional ads) and compares, for the same pages:
+
+- memory held by the parsed pages (dicts from the JSON decoder vs ``Page``);
+- analytics (the previous per-page dict implementation vs ``compute_analytics``);
+- preparing the spread grid (the previous dict preprocessing vs
+  ``layout_display_items`` on a canonical and on a legacy layout).
+
+The dict baselines below are the implementations the model replaced.
+
+Run from the repository root:
+
+    python -m benchmarks.page_model [--pages 2000] [--file uploads/203.json]
+"""
+
+import argparse
+import copy
+import gc
+import json
+import timeit
+import tracemalloc
+from typing import Dict, List, Any, Callable
+
+from models.page import (
+    LAYOUT_SCHEMA_VERSION,
+    FRACTIONAL_SIZES,
+    canonical_pages,
+    page_type_name,
+    parse_pages,
+)
+from utils.analytics import compute_analytics, empty_analytics, section_key
+from utils.layout_helpers import layout_display_items
+
+
+def build_layout(path: str, page_count: int) -> List[Dict[str, Any]]:
+    """Repeat a flatplan's pages until the layout has ``page_count`` pages."""
+    with open(path, encoding="utf-8") as f:
+        source = json.load(f)
+
+    pages = []
+    while len(pages) < page_count:
+        for page in source:
+            page = dict(page)
+            if len(pages) % 7 == 3:
+                page["type"] = "mixed"
+                page["fractional_ads"] = [
+                    {"size": "1/2", "section": "Paid", "name": "Advertiser"},
+                    {"size": "1/4", "section": "Paid"},
+                ]
+            page["page_number"] = len(pages) + 1
+            pages.append(page)
+            if len(pages) == page_count:
+                break
+    return pages
+
+
+def dict_analytics(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The dict-based analytics the Page model replaced."""
+
+    def contribution(page):
+        counts = {"total_pages": 1}
+        if page.get("page_number") == 0:
+            return counts
+
+        def add(path, amount):
+            counts[path] = counts.get(path, 0) + amount
+
+        page_type = page_type_name(page.get("type"))
+        section = section_key(page.get("section", "Uncategorized"))
+        add(f"page_types.{page_type}.total", 1)
+        add(f"page_types.{page_type}.sections.{section}", 1)
+        if page_type == "edit":
+            add("total_editorial", 1)
+        elif page_type == "ad":
+            add("total_ads", 1)
+        elif page_type == "mixed":
+            total_ad_space = 0.0
+            for ad in page.get("fractional_ads", []):
+                ad_size = ad.get("size", "1/4")
+                ad_decimal_size = FRACTIONAL_SIZES.get(ad_size, 0.0)
+                total_ad_space += ad_decimal_size
+                if ad_size in FRACTIONAL_SIZES:
+                    add(f"fractionalAdSizes.{ad_size}", 1)
+                ad_section = section_key(ad.get("section", "Uncategorized"))
+                add(f"page_types.ad.sections.{ad_section}", ad_decimal_size)
+            add("total_ads", total_ad_space)
+            add("total_editorial", max(0, 1 - total_ad_space))
+            add("mixed_ad_space", total_ad_space)
+        return counts
+
+    analytics = empty_analytics()
+    for page in pages:
+        for path, amount in contribution(page).items():
+            *parents, leaf = path.split(".")
+            target = analytics
+            for part in parents:
+                target = target.setdefault(part, {})
+            target[leaf] = target.get(leaf, 0) + amount
+    return analytics
+
+
+def dict_preprocess(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The dict-based spread grid preprocessing done on every read.
+
+    It edited the stored pages in place, so callers had to copy them first.
+    """
+    items = [dict(item) for item in items]
+    if items and items[0].get("page_number") == 1:
+        items.insert(
+            0,
+            {"name": "—", "type": "placeholder", "section": "Start", "page_number": 0},
+        )
+    for item in items:
+        if "name" in item:
+            item["name"] = item.get("name", "").strip()
+    start_index = 1 if items[0].get("page_number") == 0 else 0
+    for i in range(start_index, len(items)):
+        items[i]["page_number"] = i
+    return items
+
+
+def retained_bytes(build: Callable[[], Any]) -> int:
+    """Measure the memory still allocated by the object ``build`` returns."""
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del value
+    return size
+
+
+def best_time(func: Callable[[], Any], number: int) -> float:
+    """Best per-call time in milliseconds over five runs."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--file", default="uploads/203.json")
+    parser.add_argument("--number", type=int, default=20)
+    args = parser.parse_args()
+
+    layout = build_layout(args.file, args.pages)
+    encoded = json.dumps(layout)
+    pages = parse_pages(layout)
+    canonical = {
+        "layout": canonical_pages(layout),
+        "schema_version": LAYOUT_SCHEMA_VERSION,
+    }
+    legacy = {"layout": layout}
+
+    # Both engines must agree before their speed is worth comparing
+    assert compute_analytics(pages) == dict_analytics(layout)
+
+    dict_bytes = retained_bytes(lambda: json.loads(encoded))
+    page_bytes = retained_bytes(lambda: parse_pages(json.loads(encoded)))
+
+    rows = [
+        ("memory, dicts (KB)", dict_bytes / 1024),
+        ("memory, Page (KB)", page_bytes / 1024),
+        (
+            "analytics, dicts (ms)",
+            best_time(lambda: dict_analytics(layout), args.number),
+        ),
+        (
+            "analytics, Page incl. parse (ms)",
+            best_time(lambda: compute_analytics(layout), args.number),
+        ),
+        (
+            "analytics, parsed Page (ms)",
+            best_time(lambda: compute_analytics(pages), args.number),
+        ),
+        (
+            "preprocess, dicts (ms)",
+            best_time(lambda: dict_preprocess(copy.copy(layout)), args.number),
+        ),
+        (
+            "display items, canonical (ms)",
+            best_time(lambda: layout_display_items(canonical), args.number),
+        ),
+        (
+            "display items, legacy (ms)",
+            best_time(lambda: layout_display_items(legacy), args.number),
+        ),
+        ("parse to Page (ms)", best_time(lambda: parse_pages(layout), args.number)),
+        (
+            "serialize Page (ms)",
+            best_time(lambda: [page.to_bson() for page in pages], args.number),
+        ),
+    ]
+
+    print(f"{len(layout)} pages from {args.file}")
+    for label, value in rows:
+        print(f"  {label:<34} {value:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""Benchmark request throughput of the development server against gunicorn.
+
+Starts the app under each server on a free local port, sends the same
+requests from concurrent clients (one keep-alive connection each) and
+reports requests per second and latency percentiles:
+
+- ``dev``: ``python wsgi.py``, the Werkzeug development server the Procfile
+  used to run;
+- ``gunicorn``: ``gunicorn wsgi:app`` with ``gunicorn.conf.py`` (worker
+  and thread counts can be overridden with WEB_CONCURRENCY and
+  GUNICORN_THREADS).
+
+The default path, the home page, renders a template without touching
+MongoDB, so the benchmark runs without a database. Pass ``--url`` to
+measure a server that is already running instead.
+
+Run from the repository root:
+
+    python -m benchmarks.serving [--servers dev,gunicorn] [--path /]
+        [--requests 2000] [--concurrency 16]
+"""
+
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Any
+from urllib.parse import urlsplit
+
+SERVERS = {
+    "dev": [sys.executable, "wsgi.py"],
+    "gunicorn": [sys.executable, "-m", "gunicorn", "wsgi:app"],
+}
+
+
+def free_port() -> int:
+    """Find a local port nothing is listening on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(port: int, process: subprocess.Popen, timeout: float) -> None:
+    """Wait for a server to accept connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"Server did not start within {timeout} seconds")
+
+
+def run_load(
+    host: str, port: int, path: str, requests: int, concurrency: int
+) -> Dict[str, Any]:
+    """Send ``requests`` GETs from ``concurrency`` clients.
+
+    Returns:
+        The request rate, latency percentiles in milliseconds and error count
+    """
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def client() -> None:
+        nonlocal errors
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        own: List[float] = []
+        failed = 0
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            started = time.perf_counter()
+            try:
+                connection.request("GET", path)
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    failed += 1
+                if response.will_close:
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                connection.close()
+            own.append(time.perf_counter() - started)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+            errors += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    cuts = statistics.quantiles(latencies, n=100)
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": cuts[49] * 1000,
+        "p95": cuts[94] * 1000,
+        "p99": cuts[98] * 1000,
+        "errors": errors,
+    }
+
+
+def benchmark_server(
+    name: str, args: argparse.Namespace, env: Dict[str, str]
+) -> Dict[str, Any]:
+    """Start one of ``SERVERS``, load it and stop it."""
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    process = subprocess.Popen(
+        SERVERS[name], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_up(port, process, timeout=30)
+        run_load("127.0.0.1", port, args.path, args.warmup, args.concurrency)
+        return run_load("127.0.0.1", port, args.path, args.requests, args.concurrency)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--servers", default="dev,gunicorn")
+    parser.add_argument("--url", help="measure a running server instead")
+    parser.add_argument("--path", default="/")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    if args.url:
+        url = urlsplit(args.url)
+        path = url.path or args.path
+        results[args.url] = run_load(
+            url.hostname, url.port or 80, path, args.requests, args.concurrency
+        )
+    else:
+        env = dict(os.environ, DEBUG="False", MAIL_QUEUE_WORKER="False")
+        for name in args.servers.split(","):
+            results[name] = benchmark_server(name, args, env)
+
+    print(
+        f"{args.requests} requests for {args.path}, "
+        f"{args.concurrency} concurrent clients, {os.cpu_count()} CPUs"
+    )
+    print(f"  {'server':<10} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, result in results.items():
+        print(
+            f"  {name:<10} {result['rps']:9.1f} {result['p50']:8.1f} "
+            f"{result['p95']:8.1f} {result['p99']:8.1f}"
+            + (f"  ({result['errors']} errors)" if result["errors"] else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,534 @@
+"""Flask CLI commands for the Flatplan application."""
+
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional
+
+import click
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask import Flask, current_app
+from pymongo import UpdateOne
+
+from extensions import db, layout_versions, layouts, mail_queue, users
+from models.page import LAYOUT_SCHEMA_VERSION, canonical_pages
+from utils.analytics import aggregate_analytics, compute_analytics, format_analytics
+from utils.indexes import check_indexes, ensure_indexes
+from utils.layout_export import (
+    EXPORT_FORMATS,
+    iter_export_documents,
+    iter_ndjson,
+    iter_zip,
+    parse_since,
+)
+from utils.layout_clones import NOT_BASED, collect_bases
+from utils.layout_import import parse_layout_file
+from utils.layout_versions import compact_versions
+from utils.mail_queue import FAILED, PENDING, deliver_batch, queue_stats
+from utils.revisions import revision_query
+
+# Layouts compared per aggregation by ``flask analytics check``
+ANALYTICS_CHECK_BATCH_SIZE = 100
+
+# Layouts written per bulk_write by ``flask layouts import`` and ``normalize``
+IMPORT_BATCH_SIZE = 200
+
+
+def _analytics_differences(
+    expected: Dict[str, Any], actual: Dict[str, Any], path: str = ""
+) -> List[str]:
+    """List the values that differ between two formatted analytics results.
+
+    Numbers are compared with a small tolerance, since MongoDB may add
+    fractional ad space up in a different order.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            differences.extend(
+                _analytics_differences(
+                    expected.get(key),
+                    actual.get(key),
+                    f"{path}.{key}" if path else str(key),
+                )
+            )
+        return differences
+
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        if abs(expected - actual) <= 1e-6:
+            return []
+    elif expected == actual:
+        return []
+    return [f"{path}: python={expected!r} aggregation={actual!r}"]
+
+
+def _check_analytics_batch(
+    collection, layout_docs: List[Dict[str, Any]]
+) -> Dict[Any, List[str]]:
+    """Compare both analytics engines for a batch of layouts with their pages."""
+    aggregated = {
+        layout_doc["_id"]: layout_doc["analytics"]
+        for layout_doc in aggregate_analytics(
+            {"_id": {"$in": [layout_doc["_id"] for layout_doc in layout_docs]}},
+            collection,
+        )
+    }
+
+    failures = {}
+    for layout_doc in layout_docs:
+        if layout_doc["_id"] not in aggregated:
+            failures[layout_doc["_id"]] = ["missing from the aggregation result"]
+            continue
+        differences = _analytics_differences(
+            format_analytics(
+                {"analytics": compute_analytics(layout_doc.get("layout") or [])}
+            ),
+            format_analytics({"analytics": aggregated[layout_doc["_id"]]}),
+        )
+        if differences:
+            failures[layout_doc["_id"]] = differences
+    return failures
+
+
+def _import_paths(sources: List[str]) -> List[str]:
+    """Expand directories (to their JSON files) and glob patterns to file paths."""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = glob.glob(os.path.join(source, "*.json"))
+        else:
+            matches = glob.glob(source, recursive=True)
+        paths.extend(match for match in matches if os.path.isfile(match))
+    return sorted(set(paths))
+
+
+def _find_account(account: str) -> Optional[ObjectId]:
+    """Look up an account by email or ID."""
+    query = {"email": account}
+    try:
+        query = {"$or": [query, {"_id": ObjectId(account)}]}
+    except (InvalidId, TypeError):
+        pass
+    user = users.find_one(query, {"_id": 1})
+    return user["_id"] if user else None
+
+
+def _import_write(
+    account_id: ObjectId,
+    publication: str,
+    publication_date: Optional[str],
+    path: str,
+    pages: List[Dict[str, Any]],
+    analytics: Dict[str, Any],
+) -> UpdateOne:
+    """Build the upsert storing one imported file as a layout.
+
+    The issue name is the file name without its extension. Re-importing a
+    file replaces the pages of the existing issue and bumps its revision,
+    like any other layout write. An issue that was a clone stores its pages
+    in full again.
+    """
+    fields = {
+        "layout": pages,
+        "schema_version": LAYOUT_SCHEMA_VERSION,
+        "analytics": analytics,
+        "modified_date": datetime.now(timezone.utc),
+    }
+    if publication_date:
+        fields["publication_date"] = publication_date
+    return UpdateOne(
+        {
+            "account_id": account_id,
+            "publication_name": publication,
+            "issue_name": os.path.splitext(os.path.basename(path))[0],
+        },
+        {
+            "$set": fields,
+            "$unset": {"base": "", "overrides": ""},
+            "$inc": {"revision": 1},
+        },
+        upsert=True,
+    )
+
+
+def _normalize_write(layout_doc: Dict[str, Any]) -> UpdateOne:
+    """Build the update rewriting one layout's pages in canonical form.
+
+    The update only applies if the layout has not been saved since it was
+    read, so a concurrent edit is never overwritten; the next run picks the
+    layout up again.
+    """
+    pages = canonical_pages(layout_doc.get("layout"))
+    return UpdateOne(
+        {
+            "_id": layout_doc["_id"],
+            **revision_query(layout_doc.get("revision", 0)),
+            **NOT_BASED,
+        },
+        {
+            "$set": {
+                "layout": pages,
+                "schema_version": LAYOUT_SCHEMA_VERSION,
+                "analytics": compute_analytics(pages),
+            },
+            "$inc": {"revision": 1},
+        },
+    )
+
+
+def register_commands(app: Flask) -> None:
+    """Register the application's CLI commands.
+
+    Args:
+        app: The Flask application
+    """
+
+    @app.cli.group("indexes")
+    def indexes_group():
+        """Manage the MongoDB indexes declared in utils/indexes.py."""
+
+    @indexes_group.command("ensure")
+    def ensure_indexes_command():
+        """Create any declared index that does not exist yet."""
+        for name in ensure_indexes(db):
+            click.echo(f"ensured {name}")
+
+    @indexes_group.command("check")
+    def check_indexes_command():
+        """Report missing, undeclared and unused indexes."""
+        report = check_indexes(db)
+
+        for label, key in (
+            ("Missing", "missing"),
+            ("Undeclared", "undeclared"),
+            ("Unused", "unused"),
+        ):
+            click.echo(f"{label}: {len(report[key])}")
+            for name in report[key]:
+                click.echo(f"  {name}")
+
+        if report["missing"]:
+            raise SystemExit(1)
+
+    @app.cli.group("analytics")
+    def analytics_group():
+        """Inspect the layout analytics engines."""
+
+    @analytics_group.command("check")
+    @click.argument("files", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+    def check_analytics_command(files):
+        """Check that both analytics engines agree.
+
+        With FILES, each flatplan JSON file is loaded into a scratch
+        collection; otherwise every stored layout is checked, except clones
+        stored as overrides, which the aggregation engine never counts.
+        """
+        failures = {}
+        checked = 0
+
+        if files:
+            scratch = db["analytics_check"]
+            scratch.drop()
+            try:
+                names = {}
+                for path in files:
+                    with open(path, "r", encoding="utf-8") as f:
+                        layout_id = ObjectId()
+                        scratch.insert_one({"_id": layout_id, "layout": json.load(f)})
+                        names[layout_id] = path
+                layout_docs = list(scratch.find())
+                results = _check_analytics_batch(scratch, layout_docs)
+                for layout_id, differences in results.items():
+                    failures[names[layout_id]] = differences
+                checked = len(layout_docs)
+            finally:
+                scratch.drop()
+        else:
+            batch = []
+            for layout_doc in layouts.find(NOT_BASED, {"layout": 1}):
+                batch.append(layout_doc)
+                if len(batch) == ANALYTICS_CHECK_BATCH_SIZE:
+                    failures.update(_check_analytics_batch(layouts, batch))
+                    checked += len(batch)
+                    batch = []
+            if batch:
+                failures.update(_check_analytics_batch(layouts, batch))
+                checked += len(batch)
+
+        for name, differences in failures.items():
+            click.echo(f"{name}:")
+            for difference in differences:
+                click.echo(f"  {difference}")
+        click.echo(f"Checked {checked} layouts, {len(failures)} mismatched")
+
+        if failures:
+            raise SystemExit(1)
+
+    @app.cli.group("layouts")
+    def layouts_group():
+        """Bulk operations on stored layouts."""
+
+    @layouts_group.command("import")
+    @click.argument("sources", nargs=-1, required=True)
+    @click.option("--account", required=True, help="Owner's email or account ID.")
+    @click.option("--publication", required=True, help="Publication name.")
+    @click.option("--publication-date", help="Publication date for every issue.")
+    @click.option("--workers", type=int, help="Parser processes (default: CPUs).")
+    @click.option("--dry-run", is_flag=True, help="Parse and validate only.")
+    def import_layouts_command(
+        sources, account, publication, publication_date, workers, dry_run
+    ):
+        """Import flatplan JSON files as layouts.
+
+        SOURCES are directories (every *.json file in them) or glob
+        patterns. Each file becomes the issue named after the file, and
+        existing issues of the publication are replaced. Files are parsed
+        and validated in a process pool and written in batches.
+        """
+        paths = _import_paths(sources)
+        if not paths:
+            raise click.ClickException("No JSON files found")
+
+        account_id = _find_account(account)
+        if account_id is None:
+            raise click.ClickException(f"No account found for {account}")
+
+        max_bytes = current_app.config["LAYOUT_IMPORT_MAX_BYTES"]
+        max_pages = current_app.config["LAYOUT_IMPORT_MAX_PAGES"]
+
+        errors = {}
+        imported = upserted = pages_read = 0
+        batch = []
+        started = time.perf_counter()
+
+        def flush():
+            nonlocal upserted
+            if batch and not dry_run:
+                result = layouts.bulk_write(batch, ordered=False)
+                upserted += result.upserted_count
+            batch.clear()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor, click.progressbar(
+            length=len(paths), label="Importing", show_pos=True
+        ) as progress:
+            results = executor.map(
+                parse_layout_file,
+                paths,
+                [max_bytes] * len(paths),
+                [max_pages] * len(paths),
+                chunksize=4,
+            )
+            for path, pages, analytics, error in results:
+                progress.update(1)
+                if error:
+                    errors[path] = error
+                    continue
+
+                batch.append(
+                    _import_write(
+                        account_id,
+                        publication,
+                        publication_date,
+                        path,
+                        pages,
+                        analytics,
+                    )
+                )
+                imported += 1
+                pages_read += len(pages)
+                if len(batch) == IMPORT_BATCH_SIZE:
+                    flush()
+            flush()
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+
+        for path, error in errors.items():
+            click.echo(f"{path}: {error}", err=True)
+
+        if dry_run:
+            click.echo(f"Dry run: {imported} files valid, nothing written")
+        else:
+            click.echo(
+                f"Imported {imported} files "
+                f"({upserted} new, {imported - upserted} replaced)"
+            )
+        click.echo(
+            f"{len(errors)} failed, {pages_read} pages in {elapsed:.1f}s "
+            f"({imported / elapsed:.1f} files/s, {pages_read / elapsed:.0f} pages/s)"
+        )
+
+        if errors:
+            raise SystemExit(1)
+
+    @layouts_group.command("export")
+    @click.option("--account", required=True, help="Owner's email or account ID.")
+    @click.option(
+        "--format",
+        "export_format",
+        type=click.Choice(EXPORT_FORMATS),
+        default="ndjson",
+        show_default=True,
+    )
+    @click.option("--since", help="Only layouts modified after this ISO 8601 time.")
+    @click.option(
+        "--output",
+        type=click.File("wb"),
+        default="-",
+        help="Output file (default: stdout).",
+    )
+    def export_layouts_command(account, export_format, since, output):
+        """Export every layout of an account as NDJSON or a zip archive.
+
+        Layouts are streamed from the database oldest change first. The
+        modified date of the last one is printed so it can be passed as
+        --since to the next incremental export.
+        """
+        account_id = _find_account(account)
+        if account_id is None:
+            raise click.ClickException(f"No account found for {account}")
+
+        try:
+            since = parse_since(since)
+        except ValueError:
+            raise click.BadParameter(
+                "must be an ISO 8601 timestamp", param_hint="--since"
+            )
+
+        exported = 0
+        checkpoint = None
+
+        def documents():
+            nonlocal exported, checkpoint
+            for document in iter_export_documents(account_id, since):
+                exported += 1
+                checkpoint = document["modified_date"] or checkpoint
+                yield document
+
+        encode = iter_zip if export_format == "zip" else iter_ndjson
+        for chunk in encode(documents()):
+            output.write(chunk)
+        output.flush()
+
+        click.echo(f"Exported {exported} layouts", err=True)
+        if checkpoint:
+            click.echo(f"Next incremental export: --since {checkpoint}", err=True)
+
+    @layouts_group.command("normalize")
+    @click.option("--dry-run", is_flag=True, help="Count layouts only.")
+    def normalize_layouts_command(dry_run):
+        """Rewrite layouts stored before the current canonical page form.
+
+        Pages are renumbered, names stripped and types lowercased as on
+        every write, so reads can render stored pages without preprocessing.
+        Layouts edited while the command runs are skipped and picked up by
+        the next run.
+        """
+        query = {"schema_version": {"$ne": LAYOUT_SCHEMA_VERSION}, **NOT_BASED}
+        if dry_run:
+            pending = layouts.count_documents(query)
+            click.echo(f"Dry run: {pending} layouts to normalize, nothing written")
+            return
+
+        normalized = skipped = 0
+        batch = []
+
+        def flush():
+            nonlocal normalized, skipped
+            if batch:
+                result = layouts.bulk_write(batch, ordered=False)
+                normalized += result.modified_count
+                skipped += len(batch) - result.matched_count
+            batch.clear()
+
+        cursor = layouts.find(
+            query, {"layout": 1, "revision": 1}, batch_size=IMPORT_BATCH_SIZE
+        )
+        for layout_doc in cursor:
+            batch.append(_normalize_write(layout_doc))
+            if len(batch) == IMPORT_BATCH_SIZE:
+                flush()
+        flush()
+
+        click.echo(f"Normalized {normalized} layouts, {skipped} changed concurrently")
+
+    @layouts_group.command("compact-versions")
+    def compact_versions_command():
+        """Drop layout versions past the retention settings.
+
+        Versions older than LAYOUT_VERSION_RETENTION_DAYS are deleted, keeping
+        at least LAYOUT_VERSION_KEEP per layout. Layouts that are still edited
+        are also compacted whenever a snapshot is written; this covers the
+        ones that are not.
+        """
+        compacted = deleted = 0
+        for group in layout_versions.aggregate([{"$group": {"_id": "$layout_id"}}]):
+            removed = compact_versions(group["_id"])
+            if removed:
+                compacted += 1
+                deleted += removed
+        click.echo(f"Deleted {deleted} versions of {compacted} layouts")
+
+    @layouts_group.command("gc-bases")
+    def gc_bases_command():
+        """Delete clone bases that no layout or version references.
+
+        A base stays referenced while any clone of it (or the original
+        layout) still stores overrides of it, or while a version in the
+        history does. Bases created in the last hour are kept.
+        """
+        deleted = collect_bases()
+        click.echo(f"Deleted {deleted} unreferenced layout bases")
+
+    @app.cli.group("mail")
+    def mail_group():
+        """Inspect and deliver the outbound mail queue."""
+
+    @mail_group.command("status")
+    def mail_status_command():
+        """Count queued messages by status and list recent failures."""
+        for status, count in queue_stats().items():
+            click.echo(f"{status}: {count}")
+        for message in (
+            mail_queue.find({"status": FAILED}).sort("created_at", -1).limit(10)
+        ):
+            click.echo(
+                f"  {message['_id']} to {', '.join(message['recipients'])}: "
+                f"{message.get('last_error')}"
+            )
+
+    @mail_group.command("drain")
+    def mail_drain_command():
+        """Deliver every message that is due now, then exit."""
+        claimed = 0
+        while True:
+            batch = deliver_batch()
+            if not batch:
+                break
+            claimed += batch
+        click.echo(f"Processed {claimed} messages")
+        for status, count in queue_stats().items():
+            click.echo(f"{status}: {count}")
+
+    @mail_group.command("retry")
+    def mail_retry_command():
+        """Queue failed messages for another round of delivery attempts.
+
+        Only messages that still have their body can be sent again; the body
+        is removed when a message fails for good.
+        """
+        result = mail_queue.update_many(
+            {"status": FAILED, "body": {"$exists": True}},
+            {
+                "$set": {
+                    "status": PENDING,
+                    "attempts": 0,
+                    "next_attempt_at": datetime.now(timezone.utc),
+                },
+                "$unset": {"finished_at": ""},
+            },
+        )
+        click.echo(f"Requeued {result.modified_count} messages")
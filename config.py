@@ -10,17 +10,156 @@ class Config:
 
     # MongoDB settings
     MONGODB_URI = os.environ.get("MONGODB_URI", "mongodb://localhost:27017/")
+    MONGODB_DATABASE = os.environ.get("MONGODB_DATABASE", "flatplan")
+    # Connection pool of each worker process: connections kept at most and at
+    # least, and milliseconds an idle connection is kept (0 keeps it) and a
+    # request waits for a free connection before failing (0 waits forever)
+    MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", 100))
+    MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", 0))
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(
+        os.environ.get("MONGODB_WAIT_QUEUE_TIMEOUT_MS", 0)
+    )
+    # Milliseconds to open a connection, to wait for a reply (0 waits
+    # forever) and to find a usable server before an operation fails
+    MONGODB_CONNECT_TIMEOUT_MS = int(
+        os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", 10000)
+    )
+    MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", 0))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(
+        os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 10000)
+    )
+    # Wire compression, in order of preference (e.g. "zstd,zlib"; zstd and
+    # snappy need the zstandard and python-snappy packages); worth enabling
+    # when MongoDB is not on the same network as the app
+    MONGODB_COMPRESSORS = os.environ.get("MONGODB_COMPRESSORS", "")
+    MONGODB_RETRY_WRITES = os.environ.get("MONGODB_RETRY_WRITES", "True").lower() in [
+        "true",
+        "1",
+        "t",
+    ]
+    # Create the indexes declared in utils/indexes.py when the app starts
+    MONGODB_ENSURE_INDEXES = os.environ.get(
+        "MONGODB_ENSURE_INDEXES", "False"
+    ).lower() in ["true", "1", "t"]
+
+    # Flask-Login user cache: entries kept per worker and seconds each is served.
+    # A change to a user (e.g. a password reset) only clears the cache of the
+    # worker that made it; other workers may serve the old user for up to
+    # USER_CACHE_TTL seconds. The default still absorbs the burst of requests
+    # a page load makes (0 disables the cache)
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 1024))
+    USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", 5))
+
+    # Rendered spread grid cache: "memory" (per worker), "sqlite" (shared by
+    # the workers on a host, stored at FRAGMENT_CACHE_PATH) or "none"
+    FRAGMENT_CACHE_BACKEND = os.environ.get("FRAGMENT_CACHE_BACKEND", "memory")
+    FRAGMENT_CACHE_MAX_BYTES = int(
+        os.environ.get("FRAGMENT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+    )
+    FRAGMENT_CACHE_PATH = os.environ.get(
+        "FRAGMENT_CACHE_PATH", "instance/fragment_cache.sqlite3"
+    )
+
+    # Live layout events for connected editors: "memory" (within a worker),
+    # "mongodb" (shared by the workers on a host through a capped collection
+    # of LIVE_UPDATES_CAPPED_BYTES) or "none"
+    LIVE_UPDATES_BACKEND = os.environ.get("LIVE_UPDATES_BACKEND", "memory")
+    LIVE_UPDATES_QUEUE_SIZE = int(os.environ.get("LIVE_UPDATES_QUEUE_SIZE", 100))
+    LIVE_UPDATES_CAPPED_BYTES = int(
+        os.environ.get("LIVE_UPDATES_CAPPED_BYTES", 16 * 1024 * 1024)
+    )
+    # Seconds between keep-alive comments, and before a stream is closed for
+    # the browser to reconnect (which frees the worker thread it holds)
+    LIVE_UPDATES_KEEPALIVE = float(os.environ.get("LIVE_UPDATES_KEEPALIVE", 15))
+    LIVE_UPDATES_STREAM_SECONDS = float(
+        os.environ.get("LIVE_UPDATES_STREAM_SECONDS", 55)
+    )
+    # Streams each worker process keeps open at once; further editors are
+    # refused and retry, so half of the worker's threads stay free for
+    # normal requests (0 for no limit, e.g. with an async worker class)
+    LIVE_UPDATES_MAX_STREAMS = int(
+        os.environ.get(
+            "LIVE_UPDATES_MAX_STREAMS",
+            max(1, int(os.environ.get("GUNICORN_THREADS", 8)) // 2),
+        )
+    )
+
+    # Request, MongoDB and mail metrics served at /metrics (utils/metrics.py).
+    # Enabling them requires METRICS_TOKEN, which scrapers send as
+    # "Authorization: Bearer <token>". With several workers, set METRICS_DIR
+    # to a directory on the host where each worker writes its values every
+    # METRICS_FLUSH_SECONDS
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "False").lower() in [
+        "true",
+        "1",
+        "t",
+    ]
+    METRICS_DIR = os.environ.get("METRICS_DIR", "")
+    METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", 10))
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 
-    # Flask-Mail settings
-    MAIL_SERVER = "smtppro.zoho.com"
-    MAIL_PORT = 465
-    MAIL_USE_SSL = True
+    # Layout editor settings
+    LAYOUT_PATCH_MAX_OPS = int(os.environ.get("LAYOUT_PATCH_MAX_OPS", 200))
+    # Limits for uploaded flatplan JSON files
+    LAYOUT_IMPORT_MAX_BYTES = int(
+        os.environ.get("LAYOUT_IMPORT_MAX_BYTES", 10 * 1024 * 1024)
+    )
+    LAYOUT_IMPORT_MAX_PAGES = int(os.environ.get("LAYOUT_IMPORT_MAX_PAGES", 2000))
+    # Layout version history (utils/layout_versions.py): deltas stored
+    # between full snapshots, days versions are kept, and versions always
+    # kept per layout however old they are
+    LAYOUT_VERSION_SNAPSHOT_INTERVAL = int(
+        os.environ.get("LAYOUT_VERSION_SNAPSHOT_INTERVAL", 25)
+    )
+    LAYOUT_VERSION_RETENTION_DAYS = float(
+        os.environ.get("LAYOUT_VERSION_RETENTION_DAYS", 90)
+    )
+    LAYOUT_VERSION_KEEP = int(os.environ.get("LAYOUT_VERSION_KEEP", 20))
+    # Versions returned per page by the version history endpoint
+    LAYOUT_VERSIONS_PER_PAGE = int(os.environ.get("LAYOUT_VERSIONS_PER_PAGE", 50))
+    # Share of a clone's pages that may differ from its source before the
+    # clone stores its own copy (utils/layout_clones.py)
+    CLONE_MATERIALIZE_RATIO = float(os.environ.get("CLONE_MATERIALIZE_RATIO", 0.5))
+    # Pixels per point of PNG proofs (2 gives about 144 dpi)
+    PROOF_PNG_SCALE = float(os.environ.get("PROOF_PNG_SCALE", 2))
+
+    # Account page settings
+    ACCOUNT_LAYOUTS_PER_PAGE = int(os.environ.get("ACCOUNT_LAYOUTS_PER_PAGE", 25))
+    # Maximum number of layout IDs accepted by the batch analytics endpoint,
+    # and of layouts on each page it returns for GET
+    ANALYTICS_BATCH_LIMIT = int(os.environ.get("ANALYTICS_BATCH_LIMIT", 500))
+    # How stale analytics are rebuilt: "python" loads the pages and counts
+    # them in the app, "aggregation" counts them inside MongoDB
+    ANALYTICS_ENGINE = os.environ.get("ANALYTICS_ENGINE", "python")
+
+    # Flask-Mail settings (point MAIL_SERVER at a local debugging SMTP
+    # server, with MAIL_USE_SSL=false, to test delivery)
+    MAIL_SERVER = os.environ.get("MAIL_SERVER", "smtppro.zoho.com")
+    MAIL_PORT = int(os.environ.get("MAIL_PORT", 465))
+    MAIL_USE_SSL = os.environ.get("MAIL_USE_SSL", "True").lower() in ["true", "1", "t"]
+    MAIL_USE_TLS = os.environ.get("MAIL_USE_TLS", "False").lower() in ["true", "1", "t"]
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME", "your-email@example.com")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD", "your-email-password")
     MAIL_DEFAULT_SENDER = os.environ.get(
         "MAIL_DEFAULT_SENDER", "your-email@example.com"
     )
 
+    # Outbound mail queue (utils/mail_queue.py): run the delivery thread in
+    # each web worker, messages per SMTP connection, attempts before a
+    # message is marked failed, base retry delay (doubled per attempt),
+    # seconds between polls, and seconds before a stuck claim is retried
+    MAIL_QUEUE_WORKER = os.environ.get("MAIL_QUEUE_WORKER", "True").lower() in [
+        "true",
+        "1",
+        "t",
+    ]
+    MAIL_QUEUE_BATCH_SIZE = int(os.environ.get("MAIL_QUEUE_BATCH_SIZE", 20))
+    MAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get("MAIL_QUEUE_MAX_ATTEMPTS", 6))
+    MAIL_QUEUE_RETRY_DELAY = float(os.environ.get("MAIL_QUEUE_RETRY_DELAY", 30))
+    MAIL_QUEUE_POLL_INTERVAL = float(os.environ.get("MAIL_QUEUE_POLL_INTERVAL", 15))
+    MAIL_QUEUE_LEASE_SECONDS = float(os.environ.get("MAIL_QUEUE_LEASE_SECONDS", 300))
+
 
 class DevelopmentConfig(Config):
     """Development configuration."""
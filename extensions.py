@@ -1,10 +1,12 @@
 """Shared extensions for the Flatplan application."""
 
 import os
-import pymongo
 from flask_login import LoginManager
 from flask_mail import Mail
 from itsdangerous import URLSafeTimedSerializer
+from werkzeug.local import LocalProxy
+
+from utils.mongo_client import mongo
 
 # Flask-Login setup
 login_manager = LoginManager()
@@ -16,10 +18,13 @@ mail = Mail()
 # Token serializer for password reset
 serializer = URLSafeTimedSerializer(os.environ.get("SECRET_KEY", "default-dev-key"))
 
-# MongoDB setup
-mongo_client = pymongo.MongoClient(
-    os.environ.get("MONGODB_URI", "mongodb://localhost:27017/")
-)
-db = mongo_client.get_database("flatplan")
-users = db.users
-layouts = db.layouts
+# MongoDB setup: configured by create_app and connected on first use (see
+# utils/mongo_client.py)
+mongo_client = LocalProxy(mongo.get_client)
+db = LocalProxy(mongo.get_database)
+users = mongo.collection("users")
+layouts = mongo.collection("layouts")
+layout_versions = mongo.collection("layout_versions")
+layout_bases = mongo.collection("layout_bases")
+publication_rollups = mongo.collection("publication_rollups")
+mail_queue = mongo.collection("mail_queue")
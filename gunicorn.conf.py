@@ -0,0 +1,86 @@
+"""Gunicorn settings for serving Flatplan in production.
+
+Run with ``gunicorn wsgi:app`` (gunicorn reads this file from the working
+directory). Each worker process imports the app after it is forked, so it
+gets its own MongoDB client, caches and background threads, and
+``kill -HUP <master pid>`` reloads the code: new workers are started and the
+old ones finish their requests (up to ``graceful_timeout``) before exiting.
+
+Workers use threads (``gthread``); WEB_CONCURRENCY and GUNICORN_THREADS
+override the defaults below. An open layout editor holds a thread for its
+live update stream, so each worker only accepts LIVE_UPDATES_MAX_STREAMS
+streams (half its threads by default) and keeps the rest for normal
+requests. For many concurrent editors, set GUNICORN_WORKER_CLASS=gevent
+(after ``pip install gevent``) and LIVE_UPDATES_MAX_STREAMS=0: a stream then
+only holds a greenlet. With more than one worker, LIVE_UPDATES_BACKEND
+defaults to mongodb so editors connected to different workers see each
+other's changes, and gunicorn refuses to start with the memory backend.
+"""
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+
+# Two processes per CPU keeps every CPU busy while requests wait on MongoDB
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+# Concurrent connections per worker with an async worker class
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+
+# Seconds a worker may go without reporting in before it is restarted, and
+# that a worker finishing its requests is given on reload or shutdown
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = 5
+
+# Restart each worker after this many requests (0 never does), staggered so
+# the workers do not all restart together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG") or None
+errorlog = "-"
+
+
+def on_starting(server):
+    """Check the settings that depend on the number of workers.
+
+    Events published by one worker must reach editors connected to the
+    others, so several workers default to the mongodb live updates backend
+    and refuse the memory one. Workers load the app after this runs, so they
+    see the default.
+    """
+    if server.cfg.workers > 1:
+        if os.environ.setdefault("LIVE_UPDATES_BACKEND", "mongodb") == "memory":
+            raise RuntimeError(
+                "LIVE_UPDATES_BACKEND=memory only reaches editors on the same "
+                "worker; use mongodb (or none) when running several workers"
+            )
+
+
+def post_worker_init(worker):
+    """Open the worker's resources before it accepts requests."""
+    from utils.mail_queue import mail_worker
+    from utils.mongo_client import mongo
+
+    app = worker.wsgi
+    mongo.get_client()
+    if app.config["MAIL_QUEUE_WORKER"]:
+        mail_worker.start(app)
+    if workers > 1 and app.config["METRICS_ENABLED"] and not app.config["METRICS_DIR"]:
+        worker.log.warning(
+            "/metrics only reports the worker that answers it; set METRICS_DIR "
+            "when running several workers"
+        )
+
+
+def worker_exit(server, worker):
+    """Save the worker's metrics and close its MongoDB connections."""
+    from utils.metrics import metrics
+    from utils.mongo_client import mongo
+
+    if metrics.enabled and metrics.directory:
+        metrics.flush()
+    mongo.close()
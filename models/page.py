@@ -0,0 +1,473 @@
+"""Page model shared by the layout views, analytics and API.
+
+Pages are stored as plain subdocuments in ``layouts.layout``, and files in
+the wild differ slightly (string page numbers, a ``"page number"`` key, mixed
+case types). ``Page.from_bson`` normalizes a stored page once; the rest of
+the app then reads typed attributes instead of re-doing ``.get()``
+defaulting and type juggling. ``Page`` and ``FractionalAd`` use
+``__slots__`` so that large layouts take far less memory than lists of
+dicts, and ``to_bson`` writes a page back with any fields the model does not
+know about left untouched.
+"""
+
+import json
+from difflib import SequenceMatcher
+from sys import intern
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple, Union
+
+PAGE_TYPES = ("edit", "ad", "mixed", "placeholder", "unknown")
+
+FRACTIONAL_SIZES = {"1/4": 0.25, "1/3": 0.333, "1/2": 0.5, "2/3": 0.667}
+
+# Section used for pages and fractional ads without one
+DEFAULT_SECTION = "Uncategorized"
+
+# Version of the canonical page form stored in ``layouts.schema_version``.
+# Bump when ``normalize_pages`` changes; ``flask layouts normalize`` rewrites
+# layouts stored with an older version.
+LAYOUT_SCHEMA_VERSION = 1
+
+_PAGE_FIELDS = frozenset(
+    ("page_number", "page number", "type", "name", "section", "form_break")
+)
+_PAGE_FIELDS_WITH_ADS = _PAGE_FIELDS | {"fractional_ads"}
+_AD_FIELDS = frozenset(("size", "section", "name"))
+
+# Canonical type names, so every page shares the same string objects
+_KINDS = {page_type: page_type for page_type in PAGE_TYPES}
+
+
+def _shared(value: Any) -> Any:
+    """Intern a repeated label (type, section, ad size) so pages share one copy."""
+    return intern(value) if type(value) is str else value
+
+
+def page_type_name(value: Any) -> str:
+    """Normalize a page's stored type to one of ``PAGE_TYPES``.
+
+    Args:
+        value: The ``type`` value as stored on the page
+
+    Returns:
+        The lowercase page type, or "unknown" if it is not recognized
+    """
+    return _KINDS.get(str(value or "unknown").lower(), "unknown")
+
+
+def parse_page_number(value: Any) -> Any:
+    """Convert a stored page number to an int where possible.
+
+    Args:
+        value: The stored page number
+
+    Returns:
+        The page number as an int, the original value if it is not a number,
+        or None if it is missing (or a boolean)
+    """
+    if type(value) is int:
+        return value
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return value
+
+
+class FractionalAd:
+    """A fractional ad placed on a mixed page."""
+
+    __slots__ = ("size", "section", "name", "extra")
+
+    def __init__(
+        self,
+        size: Any = "1/4",
+        section: Any = None,
+        name: Any = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        self.size = size
+        self.section = section
+        self.name = name
+        self.extra = extra
+
+    @classmethod
+    def from_bson(cls, doc: Dict[str, Any]) -> "FractionalAd":
+        """Build an ad from its stored subdocument."""
+        extra = None
+        if len(doc) > 3 or not _AD_FIELDS.issuperset(doc):
+            extra = {key: value for key, value in doc.items() if key not in _AD_FIELDS}
+        return cls(
+            _shared(doc.get("size", "1/4")),
+            _shared(doc.get("section")),
+            doc.get("name"),
+            extra,
+        )
+
+    @property
+    def value(self) -> float:
+        """The share of the page the ad takes up."""
+        return FRACTIONAL_SIZES.get(self.size, 0.0)
+
+    @property
+    def section_or_default(self) -> Any:
+        return DEFAULT_SECTION if self.section is None else self.section
+
+    def to_bson(self) -> Dict[str, Any]:
+        """Convert the ad back to its stored form."""
+        doc: Dict[str, Any] = {"size": self.size}
+        if self.section is not None:
+            doc["section"] = self.section
+        if self.name is not None:
+            doc["name"] = self.name
+        if self.extra:
+            doc.update(self.extra)
+        return doc
+
+
+class Page:
+    """A page of a flatplan.
+
+    ``type`` is the stored value and ``kind`` its normalized form (one of
+    ``PAGE_TYPES``). ``page_number`` is an int for numeric values, including
+    numeric strings. Fields the model does not use are kept in ``extra``.
+    """
+
+    __slots__ = (
+        "page_number",
+        "type",
+        "kind",
+        "name",
+        "section",
+        "form_break",
+        "fractional_ads",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        page_number: Any = None,
+        type: Any = None,
+        name: Any = None,
+        section: Any = None,
+        form_break: Any = None,
+        fractional_ads: Tuple[FractionalAd, ...] = (),
+        extra: Optional[Dict[str, Any]] = None,
+    ):
+        self.page_number = page_number
+        self.type = type
+        self.kind = page_type_name(type)
+        self.name = name
+        self.section = section
+        self.form_break = form_break
+        self.fractional_ads = fractional_ads
+        self.extra = extra
+
+    @classmethod
+    def from_bson(cls, doc: Dict[str, Any]) -> "Page":
+        """Build a page from its stored subdocument.
+
+        Args:
+            doc: The page as stored in ``layouts.layout``
+
+        Returns:
+            The page
+        """
+        get = doc.get
+        page_number = get("page_number")
+        if page_number is None:
+            page_number = get("page number")
+
+        ads = get("fractional_ads")
+        if isinstance(ads, list):
+            known = _PAGE_FIELDS_WITH_ADS
+            ads = tuple(
+                FractionalAd.from_bson(ad) for ad in ads if isinstance(ad, dict)
+            )
+        else:
+            known = _PAGE_FIELDS
+            ads = ()
+
+        extra = None
+        if not known.issuperset(doc):
+            extra = {key: value for key, value in doc.items() if key not in known}
+
+        return cls(
+            parse_page_number(page_number),
+            _shared(get("type")),
+            get("name"),
+            _shared(get("section")),
+            get("form_break"),
+            ads,
+            extra,
+        )
+
+    @classmethod
+    def coerce(cls, page: Union["Page", Dict[str, Any]]) -> "Page":
+        """Return a page as a ``Page``, parsing it if it is still a dict."""
+        return page if isinstance(page, cls) else cls.from_bson(page)
+
+    @property
+    def is_page_zero(self) -> bool:
+        """Whether this is the Page 0 slot before the cover, which is not counted."""
+        return self.page_number == 0
+
+    @property
+    def section_or_default(self) -> Any:
+        return DEFAULT_SECTION if self.section is None else self.section
+
+    @property
+    def ad_space(self) -> float:
+        """The share of the page taken by fractional ads."""
+        return sum(ad.value for ad in self.fractional_ads)
+
+    def normalize(self) -> "Page":
+        """Strip the name and store known types in lowercase, in place."""
+        if isinstance(self.name, str):
+            self.name = self.name.strip()
+        if self.kind != "unknown":
+            self.type = self.kind
+        return self
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Read a field by its stored name, so templates can treat pages like dicts."""
+        if key in _SLOT_FIELDS:
+            value = getattr(self, key)
+            if key == "fractional_ads":
+                return [ad.to_bson() for ad in value] if value else default
+            return default if value is None else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def to_bson(self) -> Dict[str, Any]:
+        """Convert the page back to its stored form.
+
+        Returns:
+            The page subdocument, with ``page_number`` normalized and any
+            fields unknown to the model preserved
+        """
+        doc: Dict[str, Any] = {}
+        if self.page_number is not None:
+            doc["page_number"] = self.page_number
+        if self.type is not None:
+            doc["type"] = self.type
+        if self.name is not None:
+            doc["name"] = self.name
+        if self.section is not None:
+            doc["section"] = self.section
+        if self.form_break is not None:
+            doc["form_break"] = self.form_break
+        if self.fractional_ads:
+            doc["fractional_ads"] = [ad.to_bson() for ad in self.fractional_ads]
+        if self.extra:
+            doc.update(self.extra)
+        return doc
+
+    def __repr__(self) -> str:
+        return f"Page({self.page_number!r}, {self.kind!r}, {self.name!r})"
+
+
+_SLOT_FIELDS = frozenset(Page.__slots__) - {"kind", "extra"}
+_MISSING = object()
+
+
+def parse_pages(docs: Optional[Iterable[Any]]) -> List[Page]:
+    """Parse a stored page list, skipping entries that are not objects.
+
+    Args:
+        docs: The ``layout`` array of a layout document
+
+    Returns:
+        The pages
+    """
+    from_bson = Page.from_bson
+    return [from_bson(doc) for doc in docs or () if isinstance(doc, dict)]
+
+
+def pages_to_bson(pages: Iterable[Page]) -> List[Dict[str, Any]]:
+    """Convert pages back to their stored form.
+
+    Args:
+        pages: The pages
+
+    Returns:
+        The ``layout`` array to store
+    """
+    return [page.to_bson() for page in pages]
+
+
+def normalize_pages(pages: List[Page]) -> List[Page]:
+    """Bring pages into the canonical stored form, in place.
+
+    Names are stripped, known types are lowercased and pages are numbered
+    by position from 1. Pages stored as Page 0 keep number 0 and are not
+    counted, so renumbering never changes which pages the analytics count.
+
+    Args:
+        pages: The pages, in layout order
+
+    Returns:
+        The same list
+    """
+    number = 0
+    for page in pages:
+        page.normalize()
+        if page.is_page_zero:
+            page.page_number = 0
+        else:
+            number += 1
+            page.page_number = number
+    return pages
+
+
+def canonical_pages(docs: Optional[Iterable[Any]]) -> List[Dict[str, Any]]:
+    """Convert a page list from any writer to its canonical stored form.
+
+    Args:
+        docs: The pages as received or stored
+
+    Returns:
+        The ``layout`` array to store alongside ``LAYOUT_SCHEMA_VERSION``
+    """
+    return pages_to_bson(normalize_pages(parse_pages(docs)))
+
+
+def canonical_page(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize a single page written into an existing layout.
+
+    The page number is dropped, since page-level writes renumber the layout,
+    unless the page is Page 0, which keeps its number so it stays uncounted.
+
+    Args:
+        doc: The page as received
+
+    Returns:
+        The page subdocument to store
+    """
+    page = Page.from_bson(doc).normalize()
+    page.page_number = 0 if page.is_page_zero else None
+    return page.to_bson()
+
+
+def unnumbered_page(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop a stored page's number, which follows from its position.
+
+    Page 0 keeps its number because it is not positional.
+
+    Args:
+        doc: A page in canonical form
+
+    Returns:
+        The page without ``page_number`` (the same dict if there is nothing to drop)
+    """
+    if doc.get("page_number") == 0 or "page_number" not in doc:
+        return doc
+    return {key: value for key, value in doc.items() if key != "page_number"}
+
+
+def page_key(doc: Dict[str, Any]) -> str:
+    """A representation of a page that compares equal for equal pages."""
+    return json.dumps(doc, sort_keys=True, default=str)
+
+
+def diff_pages(
+    old: List[Dict[str, Any]],
+    new: List[Dict[str, Any]],
+    key: Callable[[Dict[str, Any]], str] = page_key,
+) -> List[Dict[str, Any]]:
+    """Compute the splices turning one page list into another.
+
+    A splice replaces ``remove`` pages of the old list, starting at ``at``,
+    with the ``insert`` pages::
+
+        {"at": 12, "remove": 1, "insert": [{...}]}
+
+    Args:
+        old: The previous pages
+        new: The new pages
+        key: Builds the value pages are compared by
+
+    Returns:
+        The splices, in ascending ``at`` order (empty if the lists are equal)
+    """
+    old_keys = [key(doc) for doc in old]
+    new_keys = [key(doc) for doc in new]
+
+    # Most writes touch a few neighbouring pages, so only the middle that
+    # differs is handed to the (quadratic in the worst case) matcher
+    start = 0
+    limit = min(len(old_keys), len(new_keys))
+    while start < limit and old_keys[start] == new_keys[start]:
+        start += 1
+    end = 0
+    while (
+        end < limit - start
+        and old_keys[len(old_keys) - end - 1] == new_keys[len(new_keys) - end - 1]
+    ):
+        end += 1
+
+    matcher = SequenceMatcher(
+        None,
+        old_keys[start : len(old_keys) - end],
+        new_keys[start : len(new_keys) - end],
+        autojunk=False,
+    )
+    return [
+        {
+            "at": start + i1,
+            "remove": i2 - i1,
+            "insert": new[start + j1 : start + j2],
+        }
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_delta(
+    docs: List[Dict[str, Any]], changes: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """Apply splices from ``diff_pages`` to the page list they were computed from.
+
+    ``at`` refers to the old list, so splices are applied last first.
+
+    Args:
+        docs: The old pages
+        changes: The splices
+
+    Returns:
+        A new list with the new pages
+    """
+    docs = list(docs)
+    for change in reversed(changes):
+        at = change["at"]
+        docs[at : at + change["remove"]] = change["insert"]
+    return docs
+
+
+def number_pages(docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Number canonical pages stored without their page numbers.
+
+    The inverse of ``unnumbered_page`` over a whole layout, numbering like
+    ``normalize_pages`` without re-parsing pages that are already canonical.
+
+    Args:
+        docs: Canonical pages, in layout order
+
+    Returns:
+        New page dicts with ``page_number`` set
+    """
+    numbered = []
+    number = 0
+    for doc in docs:
+        if doc.get("page_number") == 0:
+            numbered.append(doc)
+        else:
+            number += 1
+            numbered.append({"page_number": number, **unnumbered_page(doc)})
+    return numbered
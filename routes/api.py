@@ -1,275 +1,622 @@
 """API routes for the Flatplan application."""
 
+import time
 from datetime import datetime, timezone
 from bson import ObjectId
-from flask import Blueprint, request, session, jsonify
-from typing import Dict, List, Any, Union, Optional
+from bson.errors import InvalidId
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    request,
+    session,
+    jsonify,
+    stream_with_context,
+)
+from typing import Callable, Dict, List, Any, Tuple, Union, Optional
+
+from pymongo import ReturnDocument
 
 from extensions import layouts
+from models.page import LAYOUT_SCHEMA_VERSION, canonical_page
+from utils.analytics import (
+    analytics_delta,
+    load_analytics_page,
+    load_batch_analytics,
+    load_layout_analytics,
+)
+from utils.fragment_cache import fragment_cache
+from utils.layout_clones import NOT_BASED
+from utils.layout_export import EXPORT_FORMATS, iter_export, parse_since
+from routes.layout import (
+    layout_write_error,
+    update_layout_content,
+    write_based_layout,
+)
+from utils.layout_patch import (
+    appended_page,
+    build_page_write_pipeline,
+    insert_page_expression,
+    page_count_expression,
+    page_write_projection,
+    page_write_update,
+    remove_page_expression,
+    replaced_page,
+    replace_page_expression,
+)
+from utils.layout_versions import (
+    diff_versions,
+    ensure_baseline,
+    format_version,
+    list_versions,
+    load_version,
+    previous_revision,
+    record_version,
+)
+from utils.live_updates import (
+    CHANGED,
+    DELETED,
+    RETRY_MILLISECONDS,
+    format_event,
+    layout_events,
+    pages_event,
+)
+from utils.publication_trends import publication_trends
+from utils.revisions import (
+    REVISION_CONFLICT,
+    current_revision,
+    layout_query,
+    parse_revision,
+    revision_etag,
+    revision_query,
+)
 
 # Create blueprint
 api_bp = Blueprint("api", __name__)
 
 
+def page_write_response(
+    layout_id: str,
+    user_id: str,
+    expected_revision: Optional[int],
+    result: Optional[Dict[str, Any]],
+    body: Dict[str, Any],
+    changes: Optional[List[Dict[str, Any]]] = None,
+):
+    """Build the response for a page-level write.
+
+    Args:
+        layout_id: The ID of the layout that was written
+        user_id: The ID of the user who owns the layout
+        expected_revision: The revision from the If-Match header, if any
+        result: The updated document (revision, and the pages as ``layout`` if
+            they were written by the app), or None if nothing matched
+        body: The JSON body to return on success
+        changes: The splices the write made to the previous revision, if known
+
+    Returns:
+        A Flask response carrying the new revision as its ETag, or an error response
+
+    Successful writes are recorded in the layout's version history and
+    published to the layout's connected editors.
+    """
+    if result is None:
+        revision = current_revision(layout_id, user_id)
+        if revision is None:
+            return jsonify({"error": "Layout not found"}), 404
+
+        if expected_revision is not None and expected_revision != revision:
+            response = jsonify({"error": REVISION_CONFLICT, "revision": revision})
+            response.set_etag(revision_etag(revision))
+            return response, 409
+
+        return jsonify({"error": "Page not found in layout"}), 404
+
+    version = record_version(
+        ObjectId(layout_id), result["revision"], result.get("layout"), user_id, changes
+    )
+    fragment_cache.evict_layout(layout_id)
+    layout_events.publish(layout_id, pages_event(result["revision"], version))
+    body["revision"] = result["revision"]
+    response = jsonify(body)
+    response.set_etag(revision_etag(result["revision"]))
+    return response
+
+
+def single_page_write(
+    query: Dict[str, Any],
+    projection: Dict[str, Any],
+    build_update: Callable[
+        [Dict[str, Any]], Tuple[Any, Optional[List[Dict[str, Any]]]]
+    ],
+) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
+    """Apply a single-page write computed from the fields it depends on.
+
+    The page and its position are read first, and the write only applies if
+    the layout is still at the revision that was read; if another write got
+    in between, they are read again.
+
+    Args:
+        query: The filter for the layout and the page
+        projection: The fields ``build_update`` needs
+        build_update: Function returning the update (operators or pipeline)
+            and the splices it makes, or None for them if they are not known,
+            from the document read
+
+    Returns:
+        The updated document (``revision``) and the splices, or None for
+        both if no layout without a base matched
+    """
+    for _ in range(3):
+        layout_doc = layouts.find_one({**query, **NOT_BASED}, projection)
+        if not layout_doc:
+            return None, None
+
+        update, changes = build_update(layout_doc)
+        result = layouts.find_one_and_update(
+            {
+                "_id": layout_doc["_id"],
+                **revision_query(layout_doc.get("revision", 0)),
+                **NOT_BASED,
+            },
+            update,
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if result:
+            return result, changes
+    return None, None
+
+
 @api_bp.route("/api/page/<layout_id>", methods=["POST"])
 def add_page(layout_id):
-    """API endpoint to add a new page to a layout."""
-    user_id = session.get("user_id")
+    """API endpoint to add a new page to a layout.
+
+    The page is appended unless a ``position`` query parameter gives the
+    index to insert it at.
+    """
+    user_id = session.get("_user_id")
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    layout_doc = layouts.find_one(
-        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)}
-    )
-
-    if not layout_doc:
-        return jsonify({"error": "Layout not found"}), 404
-
     page_data = request.json
-    if not page_data:
+    if not page_data or not isinstance(page_data, dict):
         return jsonify({"error": "No page data provided"}), 400
 
+    position = request.args.get("position", type=int)
+    if position is not None and position < 0:
+        return jsonify({"error": "Invalid position"}), 400
+
+    try:
+        expected_revision = parse_revision(request.headers.get("If-Match"))
+    except ValueError:
+        return jsonify({"error": "Invalid If-Match header"}), 400
+
     # Add an ID to the page data if not present
     if "id" not in page_data:
         page_data["id"] = f"page-{int(datetime.now().timestamp())}"
-
-    # Get the layout's current pages
-    current_layout = layout_doc["layout"]
-
-    # Add the new page
-    current_layout.append(page_data)
-
-    # Update the layout in the database
-    layouts.update_one(
-        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)},
-        {
-            "$set": {
-                "layout": current_layout,
-                "modified_date": datetime.now(timezone.utc),
-            }
-        },
+    page = canonical_page(page_data)
+
+    def insert_page(pages):
+        index = len(pages) if position is None else position
+        return pages[:index] + [page] + pages[index:]
+
+    def append_page(layout_doc):
+        # Pages are numbered from the last one, so only canonical layouts qualify
+        canonical = layout_doc.get("schema_version") == LAYOUT_SCHEMA_VERSION
+        numbered = appended_page(page, layout_doc.get("last_page"))
+        if canonical and numbered is not None:
+            update = page_write_update(modified_date, delta)
+            update["$push"] = {"layout": numbered}
+        else:
+            update = build_page_write_pipeline(
+                insert_page_expression(page), modified_date, delta
+            )
+        changes = [{"at": layout_doc["page_count"], "remove": 0, "insert": [page]}]
+        return update, changes if canonical else None
+
+    ensure_baseline(ObjectId(layout_id), ObjectId(user_id))
+    query = layout_query(layout_id, user_id, expected_revision)
+    modified_date = datetime.now(timezone.utc)
+    delta = analytics_delta(added=[page])
+
+    if position is None:
+        result, changes = single_page_write(query, page_write_projection(), append_page)
+    else:
+        # Inserting before other pages renumbers them; the write needs no read
+        changes = None
+        result = layouts.find_one_and_update(
+            {**query, **NOT_BASED},
+            build_page_write_pipeline(
+                insert_page_expression(page, position), modified_date, delta
+            ),
+            projection={
+                "revision": 1,
+                "schema_version": 1,
+                "page_count": page_count_expression(),
+            },
+            return_document=ReturnDocument.AFTER,
+        )
+        if result and result.get("schema_version") == LAYOUT_SCHEMA_VERSION:
+            index = min(position, result["page_count"] - 1)
+            changes = [{"at": index, "remove": 0, "insert": [page]}]
+    if not result:
+        # Layouts with a base have their analytics recomputed by the write
+        result = write_based_layout(query, insert_page)
+
+    return page_write_response(
+        layout_id,
+        user_id,
+        expected_revision,
+        result,
+        {"status": "added", "page_id": page_data["id"]},
+        changes,
     )
 
-    return jsonify({"status": "added", "page_id": page_data["id"]})
-
 
 @api_bp.route("/api/page/<layout_id>/<page_id>", methods=["PUT", "DELETE"])
 def manage_page(layout_id, page_id):
     """API endpoint to update or delete a page in a layout."""
-    user_id = session.get("user_id")
+    user_id = session.get("_user_id")
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    layout_doc = layouts.find_one(
-        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)}
-    )
-
-    if not layout_doc:
-        return jsonify({"error": "Layout not found"}), 404
+    try:
+        expected_revision = parse_revision(request.headers.get("If-Match"))
+    except ValueError:
+        return jsonify({"error": "Invalid If-Match header"}), 400
 
-    current_layout = layout_doc["layout"]
+    query = layout_query(layout_id, user_id, expected_revision)
 
     if request.method == "PUT":
-        # Update an existing page
+        # Replace the matching page in place
         page_data = request.json
-        if not page_data:
+        if not page_data or not isinstance(page_data, dict):
             return jsonify({"error": "No page data provided"}), 400
 
-        # Find and update the page
-        page_updated = False
-        for i, page in enumerate(current_layout):
-            if page.get("id") == page_id:
-                current_layout[i] = page_data
-                page_updated = True
-                break
-
-        if not page_updated:
-            return jsonify({"error": "Page not found in layout"}), 404
+        page = canonical_page({**page_data, "id": page_id})
+        replacement = [page]
 
     elif request.method == "DELETE":
-        # Delete a page
-        initial_length = len(current_layout)
-        current_layout = [page for page in current_layout if page.get("id") != page_id]
-
-        if len(current_layout) == initial_length:
-            return jsonify({"error": "Page not found in layout"}), 404
-
-    # Update the layout in the database
-    layouts.update_one(
-        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)},
-        {
-            "$set": {
-                "layout": current_layout,
-                "modified_date": datetime.now(timezone.utc),
-            }
-        },
+        # Remove the matching page
+        replacement = []
+
+    def change_page(pages):
+        # The first page with the ID, like the update pipelines
+        index = next(
+            (i for i, existing in enumerate(pages) if existing.get("id") == page_id),
+            None,
+        )
+        if index is None:
+            return None
+        return pages[:index] + replacement + pages[index + 1 :]
+
+    def write_page(layout_doc):
+        # Replacing a page keeps the order, as does removing the last page;
+        # other writes renumber the pages after the one written
+        index, old_page = layout_doc["index"], layout_doc["page"]
+        canonical = layout_doc.get("schema_version") == LAYOUT_SCHEMA_VERSION
+        delta = analytics_delta(removed=[old_page], added=replacement)
+        update = page_write_update(modified_date, delta)
+
+        if request.method == "PUT":
+            numbered = replaced_page(page, old_page) if canonical else None
+            if numbered is None:
+                layout = replace_page_expression(page_id, page)
+                update = build_page_write_pipeline(layout, modified_date, delta)
+            else:
+                update["$set"][f"layout.{index}"] = numbered
+        elif index == layout_doc["page_count"] - 1:
+            update["$pop"] = {"layout": 1}
+        else:
+            layout = remove_page_expression(page_id)
+            update = build_page_write_pipeline(layout, modified_date, delta)
+
+        changes = [{"at": index, "remove": 1, "insert": replacement}]
+        return update, changes if canonical else None
+
+    ensure_baseline(ObjectId(layout_id), ObjectId(user_id))
+    modified_date = datetime.now(timezone.utc)
+
+    result, changes = single_page_write(
+        {**query, "layout.id": page_id}, page_write_projection(page_id), write_page
     )
+    if not result:
+        # Layouts with a base have their analytics recomputed by the write
+        result = write_based_layout(query, change_page)
 
-    return jsonify({"status": "success"})
+    return page_write_response(
+        layout_id, user_id, expected_revision, result, {"status": "success"}, changes
+    )
 
 
-def fractional_size_to_decimal(size_str: str) -> float:
-    """Convert a fractional size string to its decimal equivalent.
+@api_bp.route("/api/layout/<layout_id>/analytics", methods=["GET"])
+def get_layout_analytics(layout_id):
+    """API endpoint to get analytics for a layout."""
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    Args:
-        size_str: The fractional size as a string (e.g., "1/4", "1/3", etc.)
+    analytics = load_layout_analytics(
+        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)}
+    )
+    if not analytics:
+        return jsonify({"error": "Layout not found"}), 404
 
-    Returns:
-        The decimal value of the fraction
-    """
-    size_map = {"1/4": 0.25, "1/3": 0.333, "1/2": 0.5, "2/3": 0.667}
-    return size_map.get(size_str, 0.0)
+    return jsonify(analytics)
 
 
-def create_analytics_structure(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
-    """Create the initial analytics structure with default values.
+def owned_layout_id(layout_id: str, user_id: str) -> Optional[ObjectId]:
+    """Check that a layout exists and belongs to the user.
 
     Args:
-        layout_doc: The layout document from the database
+        layout_id: The ID of the layout from the URL
+        user_id: The ID of the current user
 
     Returns:
-        A dictionary with the initial analytics structure
+        The layout's ObjectId, or None if the user has no such layout
     """
-    return {
-        "publication_name": layout_doc.get("publication_name", "Unnamed Publication"),
-        "issue_name": layout_doc.get("issue_name", "Unnamed Issue"),
-        "total_pages": len(layout_doc["layout"]),
-        "total_editorial": 0.0,  # Total editorial including fractional
-        "total_ads": 0.0,  # Total ads including fractional
-        "page_types": {
-            "edit": {"total": 0, "sections": {}},
-            "ad": {"total": 0, "sections": {}},
-            "mixed": {
-                "total": 0,
-                "sections": {},
-                "editorialPercentage": 0.0,
-                "adPercentage": 0.0,
-            },
-            "placeholder": {"total": 0, "sections": {}},
-            "unknown": {"total": 0, "sections": {}},
-        },
-        "fractionalAdSizes": {"1/4": 0, "1/3": 0, "1/2": 0, "2/3": 0},
-    }
+    try:
+        layout_doc = layouts.find_one(layout_query(layout_id, user_id), {"_id": 1})
+    except InvalidId:
+        return None
+    return layout_doc["_id"] if layout_doc else None
 
 
-def process_mixed_page(
-    page: Dict[str, Any], analytics: Dict[str, Any], total_mixed_ad_space: float
-) -> float:
-    """Process a mixed page and update the analytics accordingly.
-
-    Args:
-        page: The page data
-        analytics: The analytics data
-        total_mixed_ad_space: Total ad space in mixed pages so far
+@api_bp.route("/api/layout/<layout_id>/versions", methods=["GET"])
+def get_layout_versions(layout_id):
+    """API endpoint to list a layout's version history, newest first.
 
-    Returns:
-        Updated total_mixed_ad_space value
+    Pass the oldest revision received as ``before`` to get the next page.
     """
-    fractional_ads = page.get("fractional_ads", [])
-    total_ad_space = 0.0
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    for ad in fractional_ads:
-        ad_size = ad.get("size", "1/4")
-        ad_decimal_size = fractional_size_to_decimal(ad_size)
-        total_ad_space += ad_decimal_size
+    layout_oid = owned_layout_id(layout_id, user_id)
+    if layout_oid is None:
+        return jsonify({"error": "Layout not found"}), 404
 
-        # Track fractional ad sizes
-        if ad_size in analytics["fractionalAdSizes"]:
-            analytics["fractionalAdSizes"][ad_size] += 1
+    before = request.args.get("before", type=int)
+    versions = list_versions(
+        layout_oid, current_app.config["LAYOUT_VERSIONS_PER_PAGE"], before
+    )
+    return jsonify({"versions": [format_version(version) for version in versions]})
 
-        # Add to section-specific ad tracking
-        ad_section = ad.get("section", "Uncategorized")
-        if ad_section not in analytics["page_types"]["ad"]["sections"]:
-            analytics["page_types"]["ad"]["sections"][ad_section] = 0
 
-        # Add fractional amount to the ad section
-        analytics["page_types"]["ad"]["sections"][ad_section] += ad_decimal_size
+@api_bp.route("/api/layout/<layout_id>/versions/<int:revision>/diff", methods=["GET"])
+def get_layout_version_diff(layout_id, revision):
+    """API endpoint to compare a version with an earlier one.
 
-    # Calculate editorial space (remaining space on the page)
-    editorial_space = max(0, 1 - total_ad_space)
+    The version is compared with the one recorded before it, or with the
+    revision given as ``against``. Each change lists the pages removed from
+    and inserted into the earlier version at position ``at``.
+    """
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    # Add to totals
-    analytics["total_ads"] += total_ad_space
-    analytics["total_editorial"] += editorial_space
+    layout_oid = owned_layout_id(layout_id, user_id)
+    if layout_oid is None:
+        return jsonify({"error": "Layout not found"}), 404
 
-    return total_mixed_ad_space + total_ad_space
+    against = request.args.get("against", type=int)
+    if against is None:
+        against = previous_revision(layout_oid, revision)
+        if against is None:
+            return jsonify({"error": "No earlier version to compare with"}), 404
 
+    changes = diff_versions(layout_oid, against, revision)
+    if changes is None:
+        return jsonify({"error": "Version not found"}), 404
 
-def update_section_counts(
-    page_type: str, section: str, analytics: Dict[str, Any]
-) -> None:
-    """Update section counts for a page.
+    return jsonify({"from": against, "to": revision, "changes": changes})
 
-    Args:
-        page_type: The page type
-        section: The section name
-        analytics: The analytics data
+
+@api_bp.route(
+    "/api/layout/<layout_id>/versions/<int:revision>/restore", methods=["POST"]
+)
+def restore_layout_version(layout_id, revision):
+    """API endpoint to restore a layout's pages to an earlier version.
+
+    The restore is saved as a new revision, so it can itself be undone.
+    Send the loaded revision as ``If-Match`` to avoid overwriting newer edits.
     """
-    # Initialize section counter if needed
-    if section not in analytics["page_types"][page_type]["sections"]:
-        analytics["page_types"][page_type]["sections"][section] = 0
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
 
-    # Increment section counter
-    analytics["page_types"][page_type]["sections"][section] += 1
+    try:
+        expected_revision = parse_revision(request.headers.get("If-Match"))
+    except ValueError:
+        return jsonify({"error": "Invalid If-Match header"}), 400
 
+    layout_oid = owned_layout_id(layout_id, user_id)
+    if layout_oid is None:
+        return jsonify({"error": "Layout not found"}), 404
 
-@api_bp.route("/api/layout/<layout_id>/analytics", methods=["GET"])
-def get_layout_analytics(layout_id):
-    """API endpoint to get analytics for a layout."""
+    pages = load_version(layout_oid, revision)
+    if pages is None:
+        return jsonify({"error": "Version not found"}), 404
+
+    new_revision, error = update_layout_content(
+        layout_id, user_id, pages, expected_revision
+    )
+    if error:
+        return layout_write_error(layout_id, user_id, error)
+
+    response = jsonify(
+        {"status": "restored", "revision": new_revision, "restored_from": revision}
+    )
+    response.set_etag(revision_etag(new_revision))
+    return response
+
+
+@api_bp.route("/api/layout/<layout_id>/events", methods=["GET"])
+def stream_layout_events(layout_id):
+    """API endpoint streaming a layout's change events to its editors.
+
+    The response is a ``text/event-stream`` of the events described in
+    ``utils.live_updates``, each with its revision as the event ID. Pass the
+    revision the editor loaded as ``revision``: if the layout has changed
+    since then (or since ``Last-Event-ID`` when the browser reconnects), a
+    ``changed`` event is sent first. The stream is closed after
+    ``LIVE_UPDATES_STREAM_SECONDS`` and the browser reconnects. A worker
+    that already holds ``LIVE_UPDATES_MAX_STREAMS`` streams answers 503.
+    """
     user_id = session.get("_user_id")
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
 
-    layout_doc = layouts.find_one(
-        {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)}
-    )
-    if not layout_doc:
+    if not layout_events.enabled:
+        return jsonify({"error": "Live updates are disabled"}), 404
+
+    layout_oid = owned_layout_id(layout_id, user_id)
+    if layout_oid is None:
         return jsonify({"error": "Layout not found"}), 404
 
-    # Initialize analytics structure
-    analytics = create_analytics_structure(layout_doc)
+    known = request.args.get("revision", type=int)
+    last_event_id = request.headers.get("Last-Event-ID", "")
+    if last_event_id.isdigit():
+        known = max(known or 0, int(last_event_id))
 
-    # Track total ad space in mixed pages for percentage calculation
-    total_mixed_ad_space = 0.0
+    config = current_app.config
 
-    # Process each page in the layout
-    for page in layout_doc["layout"]:
-        # Skip placeholder Page 0
-        if page.get("page_number") == 0:
-            continue
+    # Subscribe before reading the revision so no write falls in between
+    subscription = layout_events.subscribe(
+        current_app._get_current_object(), layout_oid
+    )
+    if subscription is None:
+        response = jsonify({"error": "Too many live update streams"})
+        response.headers["Retry-After"] = str(RETRY_MILLISECONDS // 1000)
+        return response, 503
+
+    def stream():
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n"
+            revision = current_revision(layout_id, user_id)
+            if revision is None:
+                yield format_event({"type": DELETED})
+                return
+            if known is not None and revision > known:
+                yield format_event({"type": CHANGED, "revision": revision})
+
+            deadline = time.monotonic() + config["LIVE_UPDATES_STREAM_SECONDS"]
+            while time.monotonic() < deadline:
+                event = subscription.get(config["LIVE_UPDATES_KEEPALIVE"])
+                if subscription.overflowed:
+                    # Too far behind to catch up event by event
+                    revision = current_revision(layout_id, user_id)
+                    yield format_event({"type": CHANGED, "revision": revision})
+                    return
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_event(event)
+                if event["type"] == DELETED:
+                    return
+        finally:
+            layout_events.unsubscribe(subscription)
+
+    response = Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Also unsubscribes if the client goes away before the stream starts
+    response.call_on_close(lambda: layout_events.unsubscribe(subscription))
+    return response
 
-        # Get page type and section
-        page_type = page.get("type", "unknown").lower()
-        if page_type not in analytics["page_types"]:
-            page_type = "unknown"
 
-        section = page.get("section", "Uncategorized")
+@api_bp.route("/api/layouts/analytics", methods=["GET", "POST"])
+def get_batch_analytics():
+    """API endpoint to get analytics for many layouts in one request.
 
-        # Increment total for page type
-        analytics["page_types"][page_type]["total"] += 1
+    POST a JSON body of the form ``{"layout_ids": [...]}`` to select layouts,
+    or GET to page through every layout of the account in ID order. The
+    response maps each layout ID to the same structure as the single-layout
+    analytics endpoint; a GET response also has ``next``, the ``after``
+    query parameter for the next page (null on the last page).
+    """
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
 
-        # Update section counts
-        update_section_counts(page_type, section, analytics)
+    query = {"account_id": ObjectId(user_id)}
+    limit = current_app.config["ANALYTICS_BATCH_LIMIT"]
 
-        # Handle page type-specific calculations
-        if page_type == "edit":
-            analytics["total_editorial"] += 1
-        elif page_type == "ad":
-            analytics["total_ads"] += 1
-        elif page_type == "mixed":
-            total_mixed_ad_space = process_mixed_page(
-                page, analytics, total_mixed_ad_space
-            )
+    if request.method == "POST":
+        layout_ids = (request.get_json(silent=True) or {}).get("layout_ids")
+        if not isinstance(layout_ids, list):
+            return jsonify({"error": "layout_ids must be a list"}), 400
+        if len(layout_ids) > limit:
+            return jsonify({"error": f"At most {limit} layouts per request"}), 400
 
-    # Calculate percentages for mixed pages if any exist
-    if analytics["page_types"]["mixed"]["total"] > 0:
-        mixed_total = analytics["page_types"]["mixed"]["total"]
-        ad_percentage = total_mixed_ad_space / mixed_total
-        analytics["page_types"]["mixed"]["adPercentage"] = ad_percentage
-        analytics["page_types"]["mixed"]["editorialPercentage"] = 1 - ad_percentage
+        try:
+            query["_id"] = {"$in": [ObjectId(layout_id) for layout_id in layout_ids]}
+        except (InvalidId, TypeError):
+            return jsonify({"error": "Invalid layout ID"}), 400
 
-    # Round decimal values for display
-    analytics["total_editorial"] = round(analytics["total_editorial"], 2)
-    analytics["total_ads"] = round(analytics["total_ads"], 2)
+        return jsonify({"layouts": load_batch_analytics(query)})
 
-    return jsonify(analytics)
+    after = request.args.get("after")
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except InvalidId:
+            return jsonify({"error": "Invalid layout ID"}), 400
+
+    analytics, next_id = load_analytics_page(query, limit)
+    return jsonify({"layouts": analytics, "next": next_id})
+
+
+@api_bp.route("/api/publications/trends", methods=["GET"])
+def get_publication_trends():
+    """API endpoint to get the cross-issue trend report of a publication.
+
+    The publication is selected with the ``publication`` query parameter.
+    """
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    publication_name = request.args.get("publication", "").strip()
+    if not publication_name:
+        return jsonify({"error": "publication is required"}), 400
+
+    report = publication_trends(user_id, publication_name)
+    if not report["issues"]:
+        return jsonify({"error": "Publication not found"}), 404
+
+    return jsonify(report)
+
+
+@api_bp.route("/api/layouts/export", methods=["GET"])
+def export_layouts():
+    """API endpoint to download every layout of the account.
+
+    ``format`` selects ``ndjson`` (default, one layout per line) or ``zip``
+    (one JSON file per issue), and ``since`` (ISO 8601) limits the export to
+    layouts modified after that time. The response is streamed from the
+    database cursor.
+    """
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be ndjson or zip"}), 400
+
+    try:
+        since = parse_since(request.args.get("since"))
+    except ValueError:
+        return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+
+    mimetype = "application/zip" if export_format == "zip" else "application/x-ndjson"
+    filename = f"layouts-{datetime.now(timezone.utc):%Y%m%d-%H%M%S}.{export_format}"
+    return Response(
+        stream_with_context(iter_export(ObjectId(user_id), export_format, since)),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
@@ -5,9 +5,9 @@ from bson import ObjectId
 from flask import Blueprint, request, session, redirect, url_for, render_template, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
-from flask_mail import Message
+from pymongo.errors import DuplicateKeyError
 
-from extensions import users, mail, serializer
+from extensions import users, serializer
 from forms import (
     LoginForm,
     RegistrationForm,
@@ -15,6 +15,8 @@ from forms import (
     PasswordResetForm,
 )
 from models.user import User
+from utils.mail_queue import enqueue_mail
+from utils.user_cache import user_cache
 
 # Create blueprint
 auth_bp = Blueprint("auth", __name__)
@@ -78,6 +80,7 @@ def register():
                     {"_id": ObjectId(user.id)},
                     {"$set": {"password_hash": password_hash}},
                 )
+                user_cache.invalidate(user.id)
 
                 flash("Your password has been set.")
                 return redirect(url_for("auth.login"))
@@ -92,7 +95,13 @@ def register():
             "created_at": datetime.now(timezone.utc),
         }
 
-        result = users.insert_one(new_user)
+        try:
+            users.insert_one(new_user)
+        except DuplicateKeyError:
+            # Another registration for the same email won the race
+            flash("An account already exists with that email.")
+            return redirect(url_for("auth.login"))
+
         flash("Congratulations, you are now registered!")
         return redirect(url_for("auth.login"))
 
@@ -113,15 +122,17 @@ def logout():
 
 # Password reset email function
 def send_password_reset_email(user_email):
-    """Send a password reset email to the user."""
+    """Queue a password reset email to the user."""
     token = generate_reset_token(user_email)
     reset_url = url_for("auth.reset_password", token=token, _external=True)
 
-    msg = Message("Password Reset Request", recipients=[user_email])
-    msg.body = f"""To reset your password, visit the following link: {reset_url}
+    enqueue_mail(
+        "Password Reset Request",
+        [user_email],
+        f"""To reset your password, visit the following link: {reset_url}
 
-If you did not make this request, simply ignore this email."""
-    mail.send(msg)
+If you did not make this request, simply ignore this email.""",
+    )
 
 
 @auth_bp.route("/reset_password_request", methods=["GET", "POST"])
@@ -169,6 +180,7 @@ def reset_password(token):
         users.update_one(
             {"_id": ObjectId(user.id)}, {"$set": {"password_hash": password_hash}}
         )
+        user_cache.invalidate(user.id)
 
         flash("Your password has been reset.")
         return redirect(url_for("auth.login"))
@@ -4,13 +4,14 @@ This module handles all routes related to layout creation, viewing, editing, and
 """
 
 import os
-import json
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional, Tuple, Union
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
 
 from bson import ObjectId
+from bson.errors import InvalidId
 from flask import (
     Blueprint,
+    current_app,
     request,
     session,
     redirect,
@@ -18,17 +19,58 @@ from flask import (
     render_template,
     jsonify,
     flash,
+    make_response,
 )
 from flask_login import login_required, current_user
-from flask_mail import Message
+from pymongo import ReturnDocument
 
-from extensions import layouts, mail, db
+from extensions import layouts, db, publication_rollups
 from forms import ShareLayoutForm
-from utils.layout_helpers import preprocess_layout_items
+from models.page import LAYOUT_SCHEMA_VERSION, canonical_pages
+from utils.analytics import compute_analytics, is_current
+from utils.fragment_cache import fragment_cache
+from utils.http_cache import layout_validators, not_modified_response, set_validators
+from utils.layout_clones import (
+    BASED,
+    NOT_BASED,
+    based_pages,
+    clone_pages_fields,
+    storage_update,
+)
+from utils.layout_helpers import canonical_layout_pages, layout_display_items
+from utils.layout_import import parse_layout_upload
+from utils.layout_patch import (
+    apply_patch_ops,
+    build_patch_pipeline,
+    patch_analytics_delta,
+    patch_changes,
+    required_layout_size,
+    stored_pages_projection,
+    touched_indexes,
+    validate_patch_ops,
+)
+from utils.layout_versions import delete_versions, ensure_baseline, record_version
+from utils.live_updates import DELETED, DETAILS, layout_events, pages_event
+from utils.mail_queue import enqueue_mail
+from utils.proof_render import PROOF_FORMATS, render_proof
+from utils.revisions import (
+    REVISION_CONFLICT,
+    current_revision,
+    layout_query,
+    parse_revision,
+    revision_etag,
+    revision_query,
+)
 
 # Create blueprint
 layout_bp = Blueprint("layout", __name__)
 
+# Templates rendering the spread grid for each view
+SPREAD_GRID_TEMPLATES = {
+    "editor": "components/spread_container.html",
+    "shared": "components/shared_spread_container.html",
+}
+
 
 def get_user_layout(
     layout_id: str, user_id: str
@@ -58,40 +100,229 @@ def get_user_layout(
         return None, f"Error retrieving layout: {str(e)}"
 
 
+def write_failure(layout_id: str, user_id: str) -> str:
+    """Explain why a revision-checked write to a layout matched nothing.
+
+    Args:
+        layout_id: The ID of the layout that was written
+        user_id: The ID of the user who owns the layout
+
+    Returns:
+        REVISION_CONFLICT if the layout exists, otherwise a not-found message
+    """
+    if current_revision(layout_id, user_id) is None:
+        return "Layout not found"
+    return REVISION_CONFLICT
+
+
+def write_based_layout(
+    query: Dict[str, Any],
+    change: Callable[[List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]],
+) -> Optional[Dict[str, Any]]:
+    """Change the pages of a layout stored as overrides of a base.
+
+    The pages are materialized, changed in the app and stored back as new
+    overrides (see ``utils.layout_clones``), guarded by the revision read so
+    a concurrent write is never lost. If another write lands in between, the
+    layout is read again, which fails if ``query`` requires the old revision.
+
+    Args:
+        query: The filter for the layout, as for a write to any other layout
+        change: Function returning the new pages from the current ones, or
+            None if the change does not apply to them
+
+    Returns:
+        The updated document (``revision`` and the new pages as ``layout``),
+        or None if no layout with a base matched or the change did not apply
+    """
+    for _ in range(3):
+        layout_doc = layouts.find_one(
+            {**query, **BASED}, {"base": 1, "overrides": 1, "revision": 1}
+        )
+        if not layout_doc:
+            return None
+
+        pages = change(based_pages(layout_doc))
+        if pages is None:
+            return None
+
+        pages = canonical_pages(pages)
+        update = storage_update(layout_doc["base"], pages)
+        update["$set"].update(
+            schema_version=LAYOUT_SCHEMA_VERSION,
+            modified_date=datetime.now(timezone.utc),
+            analytics=compute_analytics(pages),
+        )
+        update["$inc"] = {"revision": 1}
+        result = layouts.find_one_and_update(
+            {
+                "_id": layout_doc["_id"],
+                **revision_query(layout_doc.get("revision", 0)),
+                **BASED,
+            },
+            update,
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if result:
+            result["layout"] = pages
+            return result
+    return None
+
+
 def update_layout_content(
-    layout_id: str, user_id: str, layout_data: List[Dict[str, Any]]
-) -> Tuple[bool, Optional[str]]:
+    layout_id: str,
+    user_id: str,
+    layout_data: List[Dict[str, Any]],
+    expected_revision: Optional[int] = None,
+) -> Tuple[Optional[int], Optional[str]]:
     """Update the content of a layout.
 
     Args:
         layout_id: The ID of the layout to update
         user_id: The ID of the user who owns the layout
         layout_data: The new layout data
+        expected_revision: The revision the client loaded, or None to skip the check
 
     Returns:
-        A tuple containing a success flag and an error message (or None if successful)
+        A tuple containing the new revision number (or None if unsuccessful) and an error message (or None if successful)
     """
+    if not isinstance(layout_data, list):
+        return None, "Layout data must be a list of pages"
+
     try:
-        result = layouts.update_one(
-            {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)},
+        layout_data = canonical_pages(layout_data)
+        ensure_baseline(ObjectId(layout_id), ObjectId(user_id))
+        query = layout_query(layout_id, user_id, expected_revision)
+        result = layouts.find_one_and_update(
+            {**query, **NOT_BASED},
             {
                 "$set": {
                     "layout": layout_data,
+                    "schema_version": LAYOUT_SCHEMA_VERSION,
                     "modified_date": datetime.now(timezone.utc),
-                }
+                    "analytics": compute_analytics(layout_data),
+                },
+                "$inc": {"revision": 1},
             },
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
         )
+        if not result:
+            result = write_based_layout(query, lambda pages: layout_data)
 
-        if result.modified_count == 0:
-            return False, "No changes were made or layout not found"
+        if not result:
+            return None, write_failure(layout_id, user_id)
 
-        return True, None
+        version = record_version(
+            result["_id"], result["revision"], layout_data, user_id
+        )
+        fragment_cache.evict_layout(layout_id)
+        layout_events.publish(layout_id, pages_event(result["revision"], version))
+        return result["revision"], None
+    except Exception as e:
+        return None, f"Error updating layout: {str(e)}"
+
+
+def apply_layout_patch(
+    layout_id: str, user_id: str, base_revision: int, ops: List[Dict[str, Any]]
+) -> Tuple[Optional[int], Optional[str]]:
+    """Apply page-level patch operations to a layout in a single update.
+
+    Args:
+        layout_id: The ID of the layout to update
+        user_id: The ID of the user who owns the layout
+        base_revision: The revision the operations were computed against
+        ops: Validated patch operations
+
+    Returns:
+        A tuple containing the new revision number (or None if unsuccessful) and an error message (or None if successful)
+    """
+    try:
+        query = layout_query(layout_id, user_id, base_revision)
+        patch_query = {**query, **NOT_BASED}
+
+        required_size = required_layout_size(ops)
+        if required_size:
+            patch_query["$expr"] = {"$gte": [{"$size": "$layout"}, required_size]}
+
+        ensure_baseline(ObjectId(layout_id), ObjectId(user_id))
+
+        # Read the pages the patch deletes, updates or moves, at the revision
+        # the patch applies to, so the same write keeps the analytics current
+        indexes = touched_indexes(ops)
+        stored = {}
+        layout_doc = None
+        if indexes:
+            layout_doc = layouts.find_one(patch_query, stored_pages_projection(indexes))
+            if layout_doc:
+                stored = dict(zip(indexes, layout_doc["pages"]))
+
+        result = None
+        if layout_doc or not indexes:
+            result = layouts.find_one_and_update(
+                patch_query,
+                build_patch_pipeline(
+                    ops, datetime.now(timezone.utc), patch_analytics_delta(ops, stored)
+                ),
+                projection={"revision": 1, "schema_version": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+        if not result:
+            result = write_based_layout(
+                query, lambda pages: apply_patch_ops(pages, ops)
+            )
+
+        if not result:
+            # A patch whose indexes are out of range was computed against a
+            # different page list, so it is reported as a conflict as well
+            return None, write_failure(layout_id, user_id)
+
+        # Canonical layouts store the pages their history has, so the splices
+        # the patch made can be recorded as they are
+        changes = None
+        if "layout" not in result and (
+            result.get("schema_version") == LAYOUT_SCHEMA_VERSION
+        ):
+            changes = patch_changes(ops, stored)
+        version = record_version(
+            result["_id"], result["revision"], result.get("layout"), user_id, changes
+        )
+        fragment_cache.evict_layout(layout_id)
+        layout_events.publish(layout_id, pages_event(result["revision"], version))
+        return result["revision"], None
     except Exception as e:
-        return False, f"Error updating layout: {str(e)}"
+        return None, f"Error patching layout: {str(e)}"
+
+
+def layout_write_error(layout_id: str, user_id: str, error: str):
+    """Build the JSON error response for a failed layout write.
+
+    Args:
+        layout_id: The ID of the layout that was written
+        user_id: The ID of the user who owns the layout
+        error: The error message returned by the writer
+
+    Returns:
+        A Flask response tuple; revision conflicts get a 409 with the current revision
+    """
+    if error == REVISION_CONFLICT:
+        revision = current_revision(layout_id, user_id)
+        if revision is not None:
+            response = jsonify(
+                {"status": "conflict", "message": error, "revision": revision}
+            )
+            response.set_etag(revision_etag(revision))
+            return response, 409
+        error = "Layout not found"
+
+    if error == "Layout not found":
+        return jsonify({"status": "error", "message": error}), 404
+    return jsonify({"status": "error", "message": error}), 400
 
 
 def process_json_upload(
-    file, layout_id: str, user_id: str
+    file, layout_id: str, user_id: str, expected_revision: Optional[int] = None
 ) -> Tuple[bool, Optional[str]]:
     """Process a JSON file upload to update a layout.
 
@@ -99,6 +330,7 @@ def process_json_upload(
         file: The uploaded file object
         layout_id: The ID of the layout to update
         user_id: The ID of the user who owns the layout
+        expected_revision: The revision the client loaded, or None to skip the check
 
     Returns:
         A tuple containing a success flag and an error message (or None if successful)
@@ -106,17 +338,22 @@ def process_json_upload(
     if not file or not file.filename.endswith(".json"):
         return False, "Invalid file format. Please upload a JSON file."
 
-    try:
-
-        layout_data = json.loads(file.read().decode("utf-8"))
+    layout_data, error = parse_layout_upload(
+        file.stream,
+        current_app.config["LAYOUT_IMPORT_MAX_BYTES"],
+        current_app.config["LAYOUT_IMPORT_MAX_PAGES"],
+    )
+    if error:
+        return False, error
 
-        success, error = update_layout_content(layout_id, user_id, layout_data)
-        if not success:
+    try:
+        revision, error = update_layout_content(
+            layout_id, user_id, layout_data, expected_revision
+        )
+        if error:
             return False, error
 
         return True, None
-    except json.JSONDecodeError:
-        return False, "Invalid JSON format"
     except Exception as e:
         return False, f"Error processing JSON file: {str(e)}"
 
@@ -156,7 +393,7 @@ def create_shared_access(
 def send_shared_layout_email(
     email: str, layout_id: str, access_code: str
 ) -> Tuple[bool, Optional[str]]:
-    """Send an email with a shared layout access link.
+    """Queue an email with a shared layout access link.
 
     Args:
         email: The recipient's email address
@@ -174,15 +411,142 @@ def send_shared_layout_email(
             _external=True,
         )
 
-        msg = Message("Layout Shared With You", recipients=[email])
-        msg.body = f"""You have been given access to view a layout.
+        enqueue_mail(
+            "Layout Shared With You",
+            [email],
+            f"""You have been given access to view a layout.
                     Access with this link: {share_url}
                     Access code: {access_code}
-                    """
-        mail.send(msg)
+                    """,
+        )
         return True, None
     except Exception as e:
-        return False, f"Error sending email: {str(e)}"
+        return False, f"Error queueing email: {str(e)}"
+
+
+def render_spread_grid(layout_doc: Dict[str, Any], variant: str) -> Dict[str, Any]:
+    """Render a layout's spread grid, reusing the cached copy when there is one.
+
+    Args:
+        layout_doc: The layout document, including its pages
+        variant: "editor" for the layout editor, "shared" for the read-only view
+
+    Returns:
+        A dictionary with the rendered ``html`` and the ``page_count`` and
+        ``real_page_count`` (excluding the Page 0 placeholder) of the grid
+    """
+    key = fragment_cache.key(layout_doc, variant)
+    fragment = fragment_cache.get(key)
+    if fragment is not None:
+        return fragment
+
+    # Stored pages are canonical, so they are rendered as they are
+    items = layout_display_items(layout_doc)
+
+    fragment = {
+        "html": render_template(
+            SPREAD_GRID_TEMPLATES[variant], items=items, fixed_items=items[:]
+        ),
+        "page_count": len(items),
+        "real_page_count": len(items)
+        - (1 if items and items[0].get("page_number") == 0 else 0),
+    }
+    fragment_cache.set(key, fragment)
+    return fragment
+
+
+def proof_etag(layout_doc: Dict[str, Any], proof_format: str) -> str:
+    """Build the entity tag of a layout proof.
+
+    Args:
+        layout_doc: The layout document or its validators
+        proof_format: "pdf" or "png"
+
+    Returns:
+        The ETag value for the proof
+    """
+    return f"proof-{proof_format}-{revision_etag(layout_doc.get('revision') or 0)}"
+
+
+def proof_response(query: Dict[str, Any], proof_format: str, filename_hint: str):
+    """Serve a rendered proof of a layout, reusing the cached copy when there is one.
+
+    The cache key is derived from the layout's validators, so a cached proof
+    is served without loading the layout's pages.
+
+    Args:
+        query: The filter selecting the layout
+        proof_format: "pdf" or "png"
+        filename_hint: The ``download`` file name without extension
+
+    Returns:
+        The proof response, a 304 response, or None if the layout does not exist
+    """
+    validators = layout_validators(query)
+    if not validators:
+        return None
+
+    etag = proof_etag(validators, proof_format)
+    response = not_modified_response(validators, etag)
+    if response:
+        return response
+
+    variant = f"proof-{proof_format}"
+    proof = fragment_cache.get_file(fragment_cache.key(validators, variant))
+    if proof is None:
+        layout_doc = layouts.find_one(query)
+        if not layout_doc:
+            return None
+        validators = layout_doc
+        etag = proof_etag(layout_doc, proof_format)
+        proof = render_proof(
+            layout_doc, proof_format, current_app.config["PROOF_PNG_SCALE"]
+        )
+        fragment_cache.set_file(fragment_cache.key(layout_doc, variant), proof)
+
+    response = make_response(proof)
+    response.mimetype = PROOF_FORMATS[proof_format]
+    disposition = "attachment" if request.args.get("download") else "inline"
+    response.headers["Content-Disposition"] = (
+        f"{disposition}; filename={filename_hint}.{proof_format}"
+    )
+    return set_validators(response, validators, etag)
+
+
+def has_shared_access(layout_id: str, access_code: str) -> bool:
+    """Check an access code for a shared layout without loading the layout.
+
+    Args:
+        layout_id: The ID of the shared layout
+        access_code: The access code to verify
+
+    Returns:
+        True if the access code grants access to the layout
+    """
+    try:
+        shared_access = db.shared_access.find_one(
+            {"layout_id": ObjectId(layout_id), "access_code": access_code},
+            {"_id": 1},
+        )
+        return shared_access is not None
+    except Exception:
+        return False
+
+
+def shared_layout_etag(layout_doc: Dict[str, Any]) -> str:
+    """Build the entity tag of a shared layout page.
+
+    The page header depends on whether the viewer is logged in, so the tag
+    differs between the two variants.
+
+    Args:
+        layout_doc: The layout document or its validators
+
+    Returns:
+        The ETag value for the shared page
+    """
+    viewer = "user" if session.get("_user_id") else "guest"
+    return f"shared-{layout_doc.get('revision') or 0}-{viewer}"
 
 
 def verify_shared_access(
@@ -199,11 +563,7 @@ def verify_shared_access(
     """
     try:
         # Verify access code
-        shared_access = db.shared_access.find_one(
-            {"layout_id": ObjectId(layout_id), "access_code": access_code}
-        )
-
-        if not shared_access:
+        if not has_shared_access(layout_id, access_code):
             return False, None
 
         # Get the layout
@@ -224,6 +584,18 @@ def view_layout(layout_id):
     if not user_id:
         return redirect(url_for("main.index"))
 
+    # Answer revalidation requests from the index before loading the layout
+    if request.method == "GET":
+        try:
+            validators = layout_validators(layout_query(layout_id, user_id))
+        except InvalidId:
+            validators = None
+        if validators:
+            etag = revision_etag(validators.get("revision") or 0)
+            response = not_modified_response(validators, etag)
+            if response:
+                return response
+
     # Get the layout document
     layout_doc, error = get_user_layout(layout_id, user_id)
     if error:
@@ -235,35 +607,107 @@ def view_layout(layout_id):
         if request.is_json:
             layout_data = request.json
 
-            print(f"Received layout data: {layout_data}")
+            try:
+                expected_revision = parse_revision(request.headers.get("If-Match"))
+            except ValueError:
+                return (
+                    jsonify({"status": "error", "message": "Invalid If-Match header"}),
+                    400,
+                )
+
             if layout_data:
-                success, error = update_layout_content(layout_id, user_id, layout_data)
-                if success:
-                    return jsonify({"status": "updated"})
-                return jsonify({"status": "error", "message": error}), 400
+                revision, error = update_layout_content(
+                    layout_id, user_id, layout_data, expected_revision
+                )
+                if error:
+                    return layout_write_error(layout_id, user_id, error)
+
+                response = jsonify({"status": "updated", "revision": revision})
+                response.set_etag(revision_etag(revision))
+                return response
 
         # Handle file upload
         elif "file" in request.files:
             file = request.files["file"]
-            success, error = process_json_upload(file, layout_id, user_id)
+            try:
+                expected_revision = parse_revision(request.form.get("revision"))
+            except ValueError:
+                expected_revision = -1
+
+            if expected_revision == -1:
+                success, error = False, "Invalid revision"
+            else:
+                success, error = process_json_upload(
+                    file, layout_id, user_id, expected_revision
+                )
 
             if success:
                 flash("Layout updated from JSON file")
+            elif error == REVISION_CONFLICT:
+                flash(
+                    "The layout was changed by someone else before your upload. "
+                    "Review the latest version and upload again.",
+                    "error",
+                )
             else:
                 flash(f"Error processing JSON file: {error}", "error")
 
             # Redirect to refresh the page with the new data
             return redirect(url_for("layout.view_layout", layout_id=layout_id))
 
-    # Preprocess layout items for rendering
-    items = preprocess_layout_items(layout_doc["layout"])
+    response = make_response(
+        render_template(
+            "layout.html",
+            spread_grid=render_spread_grid(layout_doc, "editor"),
+            layout_id=layout_id,
+            layout_doc=layout_doc,
+        )
+    )
+    return set_validators(
+        response, layout_doc, revision_etag(layout_doc.get("revision", 0))
+    )
+
 
-    return render_template(
-        "layout.html",
-        items=items,
-        layout_id=layout_id,
-        layout_doc=layout_doc,
+@layout_bp.route("/layout/<layout_id>", methods=["PATCH"])
+@login_required
+def patch_layout(layout_id):
+    """Apply page-level changes to a layout without resending every page."""
+    user_id = session.get("_user_id")
+    if not user_id:
+        return jsonify({"status": "error", "message": "Unauthorized"}), 401
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({"status": "error", "message": "Invalid patch body"}), 400
+
+    base_revision = payload.get("base_revision")
+    if base_revision is None:
+        try:
+            base_revision = parse_revision(request.headers.get("If-Match"))
+        except ValueError:
+            base_revision = None
+    if not isinstance(base_revision, int) or base_revision < 0:
+        return (
+            jsonify({"status": "error", "message": "base_revision is required"}),
+            400,
+        )
+
+    ops, error = validate_patch_ops(
+        payload.get("ops"), current_app.config["LAYOUT_PATCH_MAX_OPS"]
     )
+    if error:
+        return jsonify({"status": "error", "message": error}), 400
+
+    if not ops:
+        return jsonify({"status": "unchanged", "revision": base_revision})
+
+    revision, error = apply_layout_patch(layout_id, user_id, base_revision, ops)
+    if error:
+        return layout_write_error(layout_id, user_id, error)
+
+    response = jsonify({"status": "patched", "revision": revision})
+    response.set_etag(revision_etag(revision))
+    return response
 
 
 @layout_bp.route("/share/<layout_id>", methods=["GET", "POST"])
@@ -323,6 +767,14 @@ def view_shared_layout(layout_id):
         else:
             return render_template("enter_access_code.html", layout_id=layout_id)
 
+    # Answer revalidation requests before loading the layout
+    if request.method == "GET" and has_shared_access(layout_id, access_code):
+        validators = layout_validators({"_id": ObjectId(layout_id)})
+        if validators:
+            response = not_modified_response(validators, shared_layout_etag(validators))
+            if response:
+                return response
+
     # Verify access code and get layout
     success, layout_doc = verify_shared_access(layout_id, access_code)
 
@@ -330,15 +782,54 @@ def view_shared_layout(layout_id):
         flash("Invalid access code or layout not found.")
         return render_template("enter_access_code.html", layout_id=layout_id)
 
-    # Preprocess layout items for rendering
-    items = preprocess_layout_items(layout_doc["layout"])
+    response = make_response(
+        render_template(
+            "view_shared_layout.html",
+            spread_grid=render_spread_grid(layout_doc, "shared"),
+            layout_id=layout_id,
+            layout_doc=layout_doc,
+            access_code=access_code,
+        )
+    )
+    return set_validators(response, layout_doc, shared_layout_etag(layout_doc))
+
 
-    return render_template(
-        "view_shared_layout.html",
-        items=items,
-        layout_id=layout_id,
-        layout_doc=layout_doc,
+@layout_bp.route("/layout/<layout_id>/proof.<proof_format>")
+@login_required
+def layout_proof(layout_id, proof_format):
+    """Download a PDF or PNG proof of a layout, rendered on the server."""
+    user_id = session.get("_user_id")
+    if not user_id:
+        return redirect(url_for("main.index"))
+    if proof_format not in PROOF_FORMATS:
+        return "Unknown proof format", 404
+
+    try:
+        query = layout_query(layout_id, user_id)
+    except InvalidId:
+        return "Layout not found", 404
+
+    response = proof_response(query, proof_format, f"flatplan-{layout_id}")
+    if response is None:
+        return "Layout not found", 404
+    return response
+
+
+@layout_bp.route("/shared/<layout_id>/proof.<proof_format>")
+def shared_layout_proof(layout_id, proof_format):
+    """Download a proof of a shared layout with an access code."""
+    access_code = request.args.get("code")
+    if proof_format not in PROOF_FORMATS:
+        return "Unknown proof format", 404
+    if not access_code or not has_shared_access(layout_id, access_code):
+        return redirect(url_for("layout.view_shared_layout", layout_id=layout_id))
+
+    response = proof_response(
+        {"_id": ObjectId(layout_id)}, proof_format, f"flatplan-{layout_id}"
     )
+    if response is None:
+        return "Layout not found", 404
+    return response
 
 
 @layout_bp.route("/create_layout", methods=["GET", "POST"])
@@ -366,6 +857,8 @@ def create_layout():
                 "publication_date": pub_date,
                 "modified_date": datetime.now(timezone.utc),
                 "layout": [],  # Start with empty layout
+                "schema_version": LAYOUT_SCHEMA_VERSION,
+                "analytics": compute_analytics([]),
             }
         ).inserted_id
 
@@ -389,14 +882,21 @@ def clone_layout(layout_id):
         return redirect(url_for("main.account"))
 
     # Create a clone with modified name
+    pages = canonical_layout_pages(layout_doc)
     clone_data = {
         "account_id": ObjectId(user_id),
         "publication_name": layout_doc["publication_name"],
         "issue_name": layout_doc["issue_name"] + " (Clone)",
         "publication_date": layout_doc.get("publication_date"),
         "modified_date": datetime.now(timezone.utc),
-        "layout": layout_doc["layout"],  # Copy the entire layout structure
+        # Share the pages with the original until either is edited
+        **clone_pages_fields(layout_doc, pages),
+        "schema_version": LAYOUT_SCHEMA_VERSION,
     }
+    if is_current(layout_doc.get("analytics")):
+        clone_data["analytics"] = layout_doc["analytics"]
+    else:
+        clone_data["analytics"] = compute_analytics(pages)
 
     # Insert the clone into the database
     new_layout_id = layouts.insert_one(clone_data).inserted_id
@@ -419,6 +919,14 @@ def edit_layout_metadata():
     issue_name = request.form.get("issue_name")
     publication_date = request.form.get("publication_date")
     return_to = request.form.get("return_to", "account")  # Default to account view
+    try:
+        expected_revision = parse_revision(request.form.get("revision"))
+    except ValueError:
+        flash("Invalid revision", "error")
+        if return_to == "layout":
+            return redirect(url_for("layout.view_layout", layout_id=layout_id))
+        else:
+            return redirect(url_for("main.account"))
 
     # Validate required fields
     if not all([layout_id, publication_name, issue_name]):
@@ -430,20 +938,39 @@ def edit_layout_metadata():
 
     # Update the layout metadata
     try:
-        result = layouts.update_one(
-            {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)},
+        result = layouts.find_one_and_update(
+            layout_query(layout_id, user_id, expected_revision),
             {
                 "$set": {
                     "publication_name": publication_name,
                     "issue_name": issue_name,
                     "publication_date": publication_date,
                     "modified_date": datetime.now(timezone.utc),
-                }
+                },
+                "$inc": {"revision": 1},
             },
+            projection={"revision": 1},
+            return_document=ReturnDocument.AFTER,
         )
 
-        if result.modified_count > 0:
+        if result:
+            fragment_cache.evict_layout(layout_id)
+            layout_events.publish(
+                layout_id,
+                {
+                    "type": DETAILS,
+                    "revision": result["revision"],
+                    "publication_name": publication_name,
+                    "issue_name": issue_name,
+                    "publication_date": publication_date,
+                },
+            )
             flash("Layout details updated successfully", "success")
+        elif write_failure(layout_id, user_id) == REVISION_CONFLICT:
+            flash(
+                "The layout was changed by someone else. Review the latest details and try again.",
+                "error",
+            )
         else:
             flash("No changes were made or layout not found", "error")
     except Exception as e:
@@ -477,6 +1004,10 @@ def delete_layout(layout_id):
         )
 
         if result.deleted_count > 0:
+            publication_rollups.delete_one({"_id": ObjectId(layout_id)})
+            delete_versions(ObjectId(layout_id))
+            fragment_cache.evict_layout(layout_id)
+            layout_events.publish(layout_id, {"type": DELETED})
             flash("Layout deleted successfully.", "success")
         else:
             flash("Failed to delete layout.", "error")
@@ -1,15 +1,156 @@
 """Main routes for the Flatplan application."""
 
+import base64
+import hmac
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
 from bson import ObjectId
-from flask import Blueprint, session, redirect, url_for, render_template, jsonify
+from bson.errors import InvalidId
+from flask import (
+    Blueprint,
+    current_app,
+    request,
+    session,
+    redirect,
+    url_for,
+    render_template,
+    jsonify,
+    Response,
+)
 from flask_login import login_required, current_user
 
 from extensions import users, layouts
+from utils.metrics import metrics, render
+from utils.mongo_client import mongo
+from utils.publication_trends import publication_trends
+from utils.user_cache import user_cache
 
 # Create blueprint
 main_bp = Blueprint("main", __name__)
 
 
+# Fields rendered on the account page; all of them are in the account_listing
+# index so the listing query is served from the index alone
+LISTING_PROJECTION = {
+    "_id": 1,
+    "publication_name": 1,
+    "issue_name": 1,
+    "publication_date": 1,
+    "modified_date": 1,
+    "revision": 1,
+}
+
+
+def encode_listing_cursor(layout_doc: Dict[str, Any]) -> str:
+    """Encode the position after a layout in the account listing.
+
+    Args:
+        layout_doc: The last layout shown on the current page
+
+    Returns:
+        An opaque, URL-safe cursor string
+    """
+    modified = layout_doc.get("modified_date") or datetime.fromtimestamp(0)
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=timezone.utc)
+    millis = int(modified.timestamp() * 1000)
+    raw = f"{millis}:{layout_doc['_id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_listing_cursor(cursor: str) -> Optional[Tuple[datetime, ObjectId]]:
+    """Decode a cursor produced by ``encode_listing_cursor``.
+
+    Args:
+        cursor: The cursor string from the query string
+
+    Returns:
+        A tuple of the modified date and layout ID, or None if the cursor is invalid
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        millis, layout_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        modified = datetime.fromtimestamp(int(millis) / 1000, timezone.utc)
+        return modified, ObjectId(layout_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        return None
+
+
+def parse_date_filter(value: Optional[str]) -> Optional[datetime]:
+    """Parse a ``YYYY-MM-DD`` filter value as a UTC date.
+
+    Args:
+        value: The raw query string value
+
+    Returns:
+        The date at midnight UTC, or None if empty or invalid
+    """
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+
+def list_account_layouts(
+    user_id: str,
+    publication: Optional[str] = None,
+    modified_from: Optional[datetime] = None,
+    modified_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 25,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """List an account's layouts, newest first, one page at a time.
+
+    Only summary fields are fetched; page arrays never leave the database.
+
+    Args:
+        user_id: The ID of the account
+        publication: Only include layouts of this publication
+        modified_from: Only include layouts modified on or after this date
+        modified_to: Only include layouts modified before the end of this date
+        cursor: The cursor returned for the previous page, if any
+        limit: The maximum number of layouts to return
+
+    Returns:
+        A tuple containing the layouts and the cursor for the next page (or None if this is the last page)
+    """
+    query: Dict[str, Any] = {"account_id": ObjectId(user_id)}
+    if publication:
+        query["publication_name"] = publication
+
+    modified_range = {}
+    if modified_from:
+        modified_range["$gte"] = modified_from
+    if modified_to:
+        modified_range["$lt"] = modified_to + timedelta(days=1)
+    if modified_range:
+        query["modified_date"] = modified_range
+
+    position = decode_listing_cursor(cursor) if cursor else None
+    if position:
+        modified, layout_id = position
+        query["$or"] = [
+            {"modified_date": {"$lt": modified}},
+            {"modified_date": modified, "_id": {"$lt": layout_id}},
+        ]
+
+    results = list(
+        layouts.find(query, LISTING_PROJECTION)
+        .sort([("modified_date", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(results) > limit:
+        results = results[:limit]
+        next_cursor = encode_listing_cursor(results[-1])
+
+    return results, next_cursor
+
+
 @main_bp.route("/")
 def index():
     """Display the home page or redirect to account."""
@@ -25,12 +166,76 @@ def account():
     if not user_id:
         return redirect(url_for("main.index"))
 
+    filters = {
+        "publication": request.args.get("publication", "").strip(),
+        "modified_from": request.args.get("modified_from", "").strip(),
+        "modified_to": request.args.get("modified_to", "").strip(),
+    }
+    cursor = request.args.get("cursor")
+
     user = users.find_one({"_id": ObjectId(user_id)})
-    user_layouts = list(layouts.find({"account_id": ObjectId(user_id)}))
-    return render_template("account.html", user=user, layouts=user_layouts)
+    user_layouts, next_cursor = list_account_layouts(
+        user_id,
+        publication=filters["publication"] or None,
+        modified_from=parse_date_filter(filters["modified_from"]),
+        modified_to=parse_date_filter(filters["modified_to"]),
+        cursor=cursor,
+        limit=current_app.config["ACCOUNT_LAYOUTS_PER_PAGE"],
+    )
+    publications = sorted(
+        layouts.distinct("publication_name", {"account_id": ObjectId(user_id)})
+    )
+
+    return render_template(
+        "account.html",
+        user=user,
+        layouts=user_layouts,
+        filters=filters,
+        publications=publications,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+    )
+
+
+@main_bp.route("/publication-trends")
+def publication_trends_report():
+    """Display ad and editorial trends across every issue of a publication."""
+    user_id = session.get("_user_id")
+    if not user_id:
+        return redirect(url_for("main.index"))
+
+    publication_name = request.args.get("publication", "").strip()
+    if not publication_name:
+        return redirect(url_for("main.account"))
+
+    report = publication_trends(user_id, publication_name)
+    if not report["issues"]:
+        return render_template("404.html"), 404
+
+    return render_template("publication_trends.html", report=report)
 
 
 @main_bp.route("/session")
 def session_info():
     """Return the current session information as JSON."""
-    return jsonify(dict(session))
+    info = dict(session)
+    if current_app.debug:
+        info["user_cache"] = user_cache.stats()
+        info["mongo_pool"] = mongo.stats()
+    return jsonify(info)
+
+
+@main_bp.route("/metrics")
+def metrics_endpoint():
+    """Expose request, MongoDB, cache and mail metrics for Prometheus."""
+    if not metrics.enabled:
+        return render_template("404.html"), 404
+
+    # create_app refuses to enable metrics without a token
+    token = current_app.config["METRICS_TOKEN"]
+    if not token or not hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain")
+
+    return Response(render(metrics.collect()), mimetype="text/plain; version=0.0.4")
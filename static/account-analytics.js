@@ -9,6 +9,10 @@ document.addEventListener('DOMContentLoaded', () => {
     // Get analytics button elements
     const analyticsButtons = document.querySelectorAll('[data-action="show-analytics"]');
 
+    // Analytics for every layout on the page, loaded with a single batch request
+    const layoutIds = [...new Set([...analyticsButtons].map(button => button.getAttribute('data-layout-id')))];
+    const batchAnalytics = layoutIds.length ? fetchBatchAnalytics(layoutIds) : Promise.resolve({});
+
     // Add event listeners to all analytics buttons
     analyticsButtons.forEach(button => {
         button.addEventListener('click', (e) => {
@@ -50,14 +54,9 @@ document.addEventListener('DOMContentLoaded', () => {
         // Show the modal with loading indicator
         analyticsModal.classList.remove('hidden');
 
-        // Fetch the analytics data from the API
-        fetch(`/api/layout/${layoutId}/analytics`)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Failed to fetch analytics data');
-                }
-                return response.json();
-            })
+        // Use the batch result, falling back to the single-layout endpoint
+        batchAnalytics
+            .then(analyticsByLayout => analyticsByLayout[layoutId] || fetchLayoutAnalytics(layoutId))
             .then(data => {
                 // Show the analytics modal with the fetched data
                 updateAnalyticsModalContent(data);
@@ -84,6 +83,45 @@ document.addEventListener('DOMContentLoaded', () => {
             });
     }
 
+    /**
+     * Fetches analytics for several layouts in one request
+     * @param {Array<string>} ids - The layout IDs
+     * @returns {Promise<Object>} Analytics keyed by layout ID (empty on failure)
+     */
+    function fetchBatchAnalytics(ids) {
+        return fetch('/api/layouts/analytics', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ layout_ids: ids })
+        })
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to fetch batch analytics data');
+                }
+                return response.json();
+            })
+            .then(data => data.layouts || {})
+            .catch(error => {
+                console.error('Error fetching batch analytics:', error);
+                return {};
+            });
+    }
+
+    /**
+     * Fetches analytics for a single layout
+     * @param {string} layoutId - The layout ID
+     * @returns {Promise<Object>} The analytics data
+     */
+    function fetchLayoutAnalytics(layoutId) {
+        return fetch(`/api/layout/${layoutId}/analytics`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to fetch analytics data');
+                }
+                return response.json();
+            });
+    }
+
     /**
      * Closes the analytics modal
      */
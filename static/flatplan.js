@@ -4,7 +4,9 @@
  * This module handles core functionality for the Flatplan application including:
  * - Page management and numbering
  * - Layout data extraction and serialization
- * - Export functionality (JSON, PDF, JPEG)
+ * - Delta saves (page-level patches against the last saved revision)
+ * - Live updates (other editors' changes, received as server-sent events)
+ * - Export functionality (JSON, and PDF/PNG proofs rendered on the server)
  * - UI interactions and event handling
  * - Drag-and-drop functionality via Sortable.js
  */
@@ -218,146 +220,425 @@ function showLoadingIndicator(message) {
 }
 
 /**
- * Exports the current layout as a JPEG image
+ * Downloads a proof of the saved layout rendered on the server
+ * @param {string} format - "pdf" or "png"
  */
-function exportAsJPEG() {
-  // Use html2canvas to capture the spread container
-  const spreadContainer = document.querySelector('.spread-container');
-
-  if (!spreadContainer) {
+function downloadProof(format) {
+  const layoutId = document.getElementById('layout-id')?.value;
+  if (!layoutId) {
     showNotification('No layout found to export', 'error', true);
     return;
   }
 
-  // Show loading indicator
-  const loadingIndicator = showLoadingIndicator('Generating image...');
-
-  // Use html2canvas to capture the content
-  html2canvas(spreadContainer, {
-    backgroundColor: '#ffffff',
-    scale: 2, // Higher quality
-    logging: false,
-    useCORS: true
-  }).then(canvas => {
-    try {
-      // Convert canvas to data URL
-      const dataURL = canvas.toDataURL('image/jpeg', 0.9);
-
-      // Create download link
-      const link = document.createElement('a');
-      link.download = getExportFilename('jpg');
-      link.href = dataURL;
-
-      // Trigger download
-      document.body.appendChild(link);
-      link.click();
-      document.body.removeChild(link);
-
-      showNotification('JPEG exported successfully', 'success');
-    } catch (error) {
-      console.error('Error in JPEG export process:', error);
-      showNotification('Error generating JPEG', 'error', true);
-    } finally {
-      // Remove loading indicator
-      document.body.removeChild(loadingIndicator);
-    }
-  }).catch(error => {
-    console.error('Error generating JPEG:', error);
-    showNotification('Error generating JPEG. Please try again.', 'error', true);
-    document.body.removeChild(loadingIndicator);
-  });
+  // Proofs are drawn from the stored layout, so unsaved edits are not included
+  const link = document.createElement('a');
+  link.href = `/layout/${layoutId}/proof.${format}?download=1`;
+  link.download = getExportFilename(format);
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
+}
+
+/**
+ * Exports the current layout as a PNG image
+ */
+function exportAsPNG() {
+  downloadProof('png');
 }
 
 /**
  * Exports the current layout as a PDF document
  */
 function exportAsPDF() {
-  // Use html2canvas and jsPDF
-  const spreadContainer = document.querySelector('.spread-container');
+  downloadProof('pdf');
+}
+
+// ===================================================
+// SECTION 3: DELTA SAVES
+// ===================================================
+
+/**
+ * Last saved state of the layout, used as the base for patches
+ */
+const savedLayoutState = {
+  pages: null,
+  revision: 0,
+  saving: false
+};
+
+/**
+ * Records the page list and revision the server currently holds
+ * @param {Array} pages - Page objects as returned by getCurrentLayoutAsJSON
+ * @param {number} revision - The layout revision the pages correspond to
+ */
+function snapshotSavedLayout(pages, revision) {
+  savedLayoutState.pages = pages;
+  savedLayoutState.revision = revision;
+
+  // Keep the forms on the page (JSON upload, layout details) on the same revision
+  const revisionInput = document.getElementById('layout-revision');
+  if (revisionInput) revisionInput.value = revision;
+  document.querySelectorAll('#json-upload-form input[name="revision"]').forEach(input => {
+    input.value = revision;
+  });
+  document.querySelectorAll('[data-action="edit-layout"]').forEach(button => {
+    button.setAttribute('data-revision', revision);
+  });
+}
+
+/**
+ * Serializes a page for comparison, ignoring its page number
+ * (the server renumbers pages after applying a patch)
+ * @param {Object} page - Page object
+ * @returns {string} Comparison key
+ */
+function pageComparisonKey(page) {
+  const { page_number, ...rest } = page;
+  return JSON.stringify(rest);
+}
+
+/**
+ * Returns the fields that differ between two versions of a page
+ * @param {Object} before - The saved page
+ * @param {Object} after - The current page
+ * @returns {Object} Changed fields and their new values
+ */
+function changedPageFields(before, after) {
+  const fields = {};
+  const keys = new Set([...Object.keys(before), ...Object.keys(after)]);
+
+  keys.forEach(key => {
+    if (key === 'page_number') return;
+    const value = key in after ? after[key] : null;
+    if (JSON.stringify(before[key]) !== JSON.stringify(value)) {
+      fields[key] = value;
+    }
+  });
+
+  return fields;
+}
+
+/**
+ * Computes the page-level operations that turn one page list into another
+ * Operation indexes refer to the list after the previous operation is applied
+ * @param {Array} basePages - The last saved page list
+ * @param {Array} currentPages - The current page list
+ * @returns {Array|null} Patch operations, or null if a full save is cheaper
+ */
+function computeLayoutPatch(basePages, currentPages) {
+  const a = basePages.map(pageComparisonKey);
+  const b = currentPages.map(pageComparisonKey);
+
+  // Trim the unchanged prefix and suffix
+  let start = 0;
+  while (start < a.length && start < b.length && a[start] === b[start]) start++;
+  let endA = a.length;
+  let endB = b.length;
+  while (endA > start && endB > start && a[endA - 1] === b[endB - 1]) {
+    endA--;
+    endB--;
+  }
+
+  const n = endA - start;
+  const m = endB - start;
+  if (n * m > 4000000) return null;
+
+  // Longest common subsequence table over the changed middle section
+  const lcs = Array.from({ length: n + 1 }, () => new Uint32Array(m + 1));
+  for (let i = n - 1; i >= 0; i--) {
+    for (let j = m - 1; j >= 0; j--) {
+      lcs[i][j] = a[start + i] === b[start + j]
+        ? lcs[i + 1][j + 1] + 1
+        : Math.max(lcs[i + 1][j], lcs[i][j + 1]);
+    }
+  }
+
+  const ops = [];
+  let i = 0;
+  let j = 0;
+  let position = start;
+
+  while (i < n || j < m) {
+    if (i < n && j < m && a[start + i] === b[start + j]) {
+      i++;
+      j++;
+      position++;
+    } else if (i < n && j < m && lcs[i + 1][j + 1] === lcs[i][j]) {
+      // Same slot, different content: send only the fields that changed
+      ops.push({
+        op: 'update',
+        index: position,
+        fields: changedPageFields(basePages[start + i], currentPages[start + j])
+      });
+      i++;
+      j++;
+      position++;
+    } else if (j < m && (i === n || lcs[i][j + 1] >= lcs[i + 1][j])) {
+      ops.push({ op: 'insert', index: position, page: currentPages[start + j] });
+      j++;
+      position++;
+    } else {
+      ops.push({ op: 'delete', index: position, key: a[start + i] });
+      i++;
+    }
+  }
+
+  // A single page dragged to a new position shows up as a delete plus an insert
+  if (ops.length === 2) {
+    const [first, second] = ops;
+    if (first.op === 'delete' && second.op === 'insert' &&
+        first.key === pageComparisonKey(second.page)) {
+      return [{ op: 'move', from: first.index, to: second.index }];
+    }
+    if (first.op === 'insert' && second.op === 'delete' &&
+        second.key === pageComparisonKey(first.page)) {
+      return [{ op: 'move', from: second.index - 1, to: first.index }];
+    }
+  }
 
-  if (!spreadContainer) {
-    showNotification('No layout found to export', 'error');
+  ops.forEach(op => delete op.key);
+  return ops;
+}
+
+/**
+ * Sends the current layout to the server, as a patch when possible
+ * @param {string} layoutId - The layout ID
+ * @param {number} maxPatchOps - The largest patch the server accepts
+ */
+function saveLayout(layoutId, maxPatchOps) {
+  const layout = getCurrentLayoutAsJSON();
+  const ops = savedLayoutState.pages ? computeLayoutPatch(savedLayoutState.pages, layout) : null;
+
+  if (ops && ops.length === 0) {
+    showNotification('No changes to save.', 'info');
     return;
   }
 
+  const headers = {
+    'Content-Type': 'application/json',
+    'X-CSRF-Token': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || ''
+  };
+
+  // Fall back to sending every page when the patch would be larger than the layout
+  const usePatch = ops && ops.length <= maxPatchOps && ops.length < layout.length;
+  const request = usePatch
+    ? fetch(`/layout/${layoutId}`, {
+        method: 'PATCH',
+        headers: headers,
+        body: JSON.stringify({ base_revision: savedLayoutState.revision, ops: ops })
+      })
+    : fetch(`/layout/${layoutId}`, {
+        method: 'POST',
+        headers: { ...headers, 'If-Match': `"${savedLayoutState.revision}"` },
+        body: JSON.stringify(layout)
+      });
+
   // Show loading indicator
-  const loadingIndicator = showLoadingIndicator('Generating PDF...');
-
-  // Use html2canvas to capture the content
-  html2canvas(spreadContainer, {
-    backgroundColor: '#ffffff',
-    scale: 2, // Higher quality
-    logging: false,
-    useCORS: true
-  }).then(canvas => {
-    try {
-      // Initialize PDF document - use landscape orientation which works better for flatplan layouts
-      const { jsPDF } = window.jspdf;
-      if (!jsPDF) {
-        throw new Error('jsPDF library not found');
+  const loadingIndicator = showLoadingIndicator('Saving layout...');
+
+  // Hold back live events until the save's revision is known
+  savedLayoutState.saving = true;
+
+  request
+    .then(res => res.json().catch(() => ({})).then(data => ({ res, data })))
+    .then(({ res, data }) => {
+      // Remove loading indicator
+      document.body.removeChild(loadingIndicator);
+
+      if (res.ok) {
+        snapshotSavedLayout(layout, data.revision ?? savedLayoutState.revision);
+        showNotification('Layout saved successfully!', 'success', true);
+      } else if (res.status === 409) {
+        showNotification(
+          'This layout was changed by someone else since you opened it. Reload to get the latest version before saving.',
+          'error',
+          true
+        );
+      } else {
+        showNotification('Failed to save layout.', 'error', true);
+        console.error('Save failed with status:', res.status, data.message);
       }
+    })
+    .catch(error => {
+      document.body.removeChild(loadingIndicator);
+      showNotification('Error saving layout.', 'error', true);
+      console.error('Save error:', error);
+    })
+    .finally(() => {
+      savedLayoutState.saving = false;
+      flushLiveEvents();
+    });
+}
 
-      const pdf = new jsPDF({
-        orientation: 'landscape',
-        unit: 'mm',
-        format: 'a4'
-      });
+// ===================================================
+// SECTION 4: LIVE UPDATES
+// ===================================================
 
-      // Get the filename
-      const filename = getExportFilename('pdf');
+/**
+ * Live events received while a save was in flight
+ */
+const pendingLiveEvents = [];
 
-      // Add the canvas as an image to the PDF
-      const imgData = canvas.toDataURL('image/jpeg', 1.0);
-      const pdfWidth = pdf.internal.pageSize.getWidth();
-      const pdfHeight = pdf.internal.pageSize.getHeight();
-      const canvasRatio = canvas.height / canvas.width;
+/**
+ * Milliseconds to wait, plus up to as much again, before reconnecting to a
+ * live update stream the server refused
+ */
+const LIVE_RETRY_MS = 5000;
 
-      // Calculate dimensions to fit within the PDF
-      let imgWidth = pdfWidth;
-      let imgHeight = imgWidth * canvasRatio;
+/**
+ * Checks whether the layout has edits that have not been saved yet
+ * @returns {boolean} True if the pages differ from the last saved state
+ */
+function hasUnsavedChanges() {
+  if (!savedLayoutState.pages) return false;
+  const ops = computeLayoutPatch(savedLayoutState.pages, getCurrentLayoutAsJSON());
+  return ops === null || ops.length > 0;
+}
 
-      // If image height exceeds page height, scale down
-      if (imgHeight > pdfHeight) {
-        imgHeight = pdfHeight;
-        imgWidth = imgHeight / canvasRatio;
-      }
+/**
+ * Shows a banner asking the user to reload to see changes made elsewhere
+ * @param {string} message - What happened
+ * @param {boolean} canReload - Whether to offer a reload button
+ */
+function showReloadBanner(message, canReload = true) {
+  let banner = document.getElementById('live-update-banner');
+  if (!banner) {
+    banner = document.createElement('div');
+    banner.id = 'live-update-banner';
+    banner.className = 'fixed top-4 left-1/2 transform -translate-x-1/2 z-50 bg-indigo-600 text-white px-4 py-2 rounded-md shadow-lg flex items-center';
+    document.body.appendChild(banner);
+  }
 
-      // Center the image on the page
-      const x = (pdfWidth - imgWidth) / 2;
-      const y = (pdfHeight - imgHeight) / 2;
+  banner.textContent = message;
+  if (canReload) {
+    const reloadBtn = document.createElement('button');
+    reloadBtn.className = 'ml-3 px-2 py-1 bg-white text-indigo-600 rounded text-sm';
+    reloadBtn.textContent = 'Reload';
+    reloadBtn.addEventListener('click', () => window.location.reload());
+    banner.appendChild(reloadBtn);
+  }
+}
 
-      // Add the image to the PDF
-      pdf.addImage(imgData, 'JPEG', x, y, imgWidth, imgHeight);
+/**
+ * Applies page splices from another editor to the page grid
+ * Each splice removes `remove` pages at `at` (in the old page list) and
+ * inserts `insert` in their place
+ * @param {Array} changes - The splices, in page order
+ * @param {number} pageCount - The number of pages after the change
+ * @returns {boolean} False if the grid does not match the pages the changes apply to
+ */
+function applyPageChanges(changes, pageCount) {
+  const container = document.querySelector('.spread-container');
+  if (!container || typeof window.buildPageBox !== 'function') return false;
+
+  const pageBoxes = () => Array.from(container.querySelectorAll('.box'))
+    .filter(box => box.id !== 'page-0');
+
+  const removed = changes.reduce((total, change) => total + change.remove, 0);
+  const inserted = changes.reduce((total, change) => total + change.insert.length, 0);
+  if (pageBoxes().length - removed + inserted !== pageCount) return false;
+
+  // Apply the last splice first so the positions of earlier ones stay valid
+  [...changes].reverse().forEach(change => {
+    const boxes = pageBoxes();
+    const anchor = boxes[change.at + change.remove] || null;
+    boxes.slice(change.at, change.at + change.remove).forEach(box => box.remove());
+    change.insert.forEach(page => container.insertBefore(window.buildPageBox(page), anchor));
+  });
 
-      // Add metadata to the PDF
-      pdf.setProperties({
-        title: `${document.querySelector('.text-xl.font-bold')?.textContent || 'Flatplan'} - ${document.querySelector('.text-indigo-100.text-sm')?.textContent || 'Export'} Layout`,
-        subject: 'Magazine Layout',
-        author: 'Flatplan App',
-        creator: 'Flatplan App',
-        creationDate: new Date()
-      });
+  updatePageNumbers();
+  return true;
+}
 
-      // Generate the PDF and trigger download
-      pdf.save(filename);
+/**
+ * Shows new layout details (publication, issue, date) from another editor
+ * @param {Object} event - A "details" event
+ */
+function applyLayoutDetails(event) {
+  const publicationEl = document.querySelector('.bg-indigo-600 h2.text-xl');
+  const issueEl = document.querySelector('.bg-indigo-600 p.text-indigo-100');
+  if (publicationEl) publicationEl.textContent = event.publication_name;
+  if (issueEl) issueEl.textContent = event.issue_name;
+
+  document.querySelectorAll('[data-action="edit-layout"]').forEach(button => {
+    button.setAttribute('data-publication-name', event.publication_name);
+    button.setAttribute('data-issue-name', event.issue_name);
+    button.setAttribute('data-publication-date', event.publication_date || '');
+  });
+}
 
-      showNotification('PDF exported successfully', 'success');
-    } catch (error) {
-      console.error('Error in PDF export process:', error);
-      showNotification('Error generating PDF', 'error', true);
-    } finally {
-      // Remove loading indicator
-      document.body.removeChild(loadingIndicator);
-    }
-  }).catch(error => {
-    console.error('Error generating PDF:', error);
-    showNotification('Error generating PDF. Please try again.', 'error', true);
-    document.body.removeChild(loadingIndicator);
+/**
+ * Handles an event from the layout's live update stream
+ * @param {string} type - "pages", "details", "changed" or "deleted"
+ * @param {Object} event - The event data
+ */
+function handleLiveEvent(type, event) {
+  if (savedLayoutState.saving) {
+    pendingLiveEvents.push([type, event]);
+    return;
+  }
+
+  if (type === 'deleted') {
+    showReloadBanner('This layout has been deleted by another editor.', false);
+    return;
+  }
+
+  // Our own saves, and changes we already have
+  if (event.revision <= savedLayoutState.revision) return;
+
+  // Splices are positions in the base revision's pages, so they only apply
+  // to a grid at exactly that revision; anything else reloads
+  const isNext = event.revision === savedLayoutState.revision + 1;
+  if (type === 'pages' && isNext && event.base_revision === savedLayoutState.revision &&
+      !hasUnsavedChanges() && applyPageChanges(event.changes, event.page_count)) {
+    snapshotSavedLayout(getCurrentLayoutAsJSON(), event.revision);
+    showNotification('Layout updated by another editor', 'info');
+    return;
+  }
+
+  if (type === 'details' && isNext) {
+    applyLayoutDetails(event);
+    snapshotSavedLayout(savedLayoutState.pages, event.revision);
+    return;
+  }
+
+  showReloadBanner(hasUnsavedChanges()
+    ? 'Another editor changed this layout. Reload to get their changes before saving yours.'
+    : 'Another editor changed this layout.');
+}
+
+/**
+ * Handles the live events held back while a save was in flight
+ */
+function flushLiveEvents() {
+  pendingLiveEvents.splice(0).forEach(([type, event]) => handleLiveEvent(type, event));
+}
+
+/**
+ * Connects to the layout's live update stream
+ * @param {string} layoutId - The layout ID
+ */
+function connectLiveUpdates(layoutId) {
+  if (typeof EventSource === 'undefined') return;
+
+  const source = new EventSource(`/api/layout/${layoutId}/events?revision=${savedLayoutState.revision}`);
+  ['pages', 'details', 'changed', 'deleted'].forEach(type => {
+    source.addEventListener(type, message => {
+      handleLiveEvent(type, JSON.parse(message.data));
+      if (type === 'deleted') source.close();
+    });
+  });
+
+  // The browser reconnects to a stream that ended on its own, but not after
+  // an error response (e.g. 503 when the server has too many streams open)
+  source.addEventListener('error', () => {
+    if (source.readyState !== EventSource.CLOSED) return;
+    setTimeout(() => connectLiveUpdates(layoutId), LIVE_RETRY_MS + Math.random() * LIVE_RETRY_MS);
   });
 }
 
 // ===================================================
-// SECTION 3: EVENT LISTENERS AND INITIALIZATION
+// SECTION 5: EVENT LISTENERS AND INITIALIZATION
 // ===================================================
 
 /**
@@ -427,10 +708,10 @@ function initializeExportOptions() {
     downloadPdfBtn.addEventListener('click', exportAsPDF);
   }
 
-  // JPEG Export
-  const downloadJpegBtn = document.getElementById('download-jpeg-btn');
-  if (downloadJpegBtn) {
-    downloadJpegBtn.addEventListener('click', exportAsJPEG);
+  // PNG Export
+  const downloadPngBtn = document.getElementById('download-png-btn');
+  if (downloadPngBtn) {
+    downloadPngBtn.addEventListener('click', exportAsPNG);
   }
 }
 
@@ -440,39 +721,21 @@ function initializeExportOptions() {
 function initializeSaveFunction() {
   const saveBtn = document.getElementById('save-layout-btn');
   const layoutId = document.getElementById('layout-id')?.value;
+  const revisionInput = document.getElementById('layout-revision');
 
   if (saveBtn && layoutId) {
-    saveBtn.addEventListener('click', () => {
-      const layout = getCurrentLayoutAsJSON();
-
-      // Show loading indicator
-      const loadingIndicator = showLoadingIndicator('Saving layout...');
-
-      fetch(`/layout/${layoutId}`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'X-CSRF-Token': document.querySelector('meta[name="csrf-token"]')?.getAttribute('content') || ''
-        },
-        body: JSON.stringify(layout)
-      })
-      .then(res => {
-        // Remove loading indicator
-        document.body.removeChild(loadingIndicator);
-
-        if (res.ok) {
-          showNotification('Layout saved successfully!', 'success', true);
-        } else {
-          showNotification('Failed to save layout.', 'error', true);
-          console.error('Save failed with status:', res.status);
-        }
-      })
-      .catch(error => {
-        document.body.removeChild(loadingIndicator);
-        showNotification('Error saving layout.', 'error', true);
-        console.error('Save error:', error);
-      });
+    const maxPatchOps = parseInt(revisionInput?.getAttribute('data-max-patch-ops'), 10) || 0;
+    savedLayoutState.revision = parseInt(revisionInput?.value, 10) || 0;
+
+    // Take the base snapshot once every script has finished decorating the pages
+    window.addEventListener('load', () => {
+      snapshotSavedLayout(getCurrentLayoutAsJSON(), parseInt(revisionInput?.value, 10) || 0);
+      if (revisionInput?.getAttribute('data-live-updates') === 'true') {
+        connectLiveUpdates(layoutId);
+      }
     });
+
+    saveBtn.addEventListener('click', () => saveLayout(layoutId, maxPatchOps));
   }
 }
 
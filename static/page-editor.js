@@ -370,8 +370,9 @@ document.addEventListener('DOMContentLoaded', () => {
                 const issueName = this.getAttribute('data-issue-name');
                 const publicationDate = this.getAttribute('data-publication-date') || '';
                 const returnTo = this.getAttribute('data-return-to');
+                const revision = this.getAttribute('data-revision') || '';
 
-                openLayoutEditModal(layoutId, publicationName, issueName, publicationDate, returnTo);
+                openLayoutEditModal(layoutId, publicationName, issueName, publicationDate, returnTo, revision);
             });
         });
     }
@@ -391,8 +392,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const issueName = button.getAttribute('data-issue-name');
             const publicationDate = button.getAttribute('data-publication-date') || '';
             const returnTo = button.getAttribute('data-return-to');
+            const revision = button.getAttribute('data-revision') || '';
 
-            openLayoutEditModal(layoutId, publicationName, issueName, publicationDate, returnTo);
+            openLayoutEditModal(layoutId, publicationName, issueName, publicationDate, returnTo, revision);
         }
 
         // Handle layout modal close button clicks
@@ -408,8 +410,9 @@ document.addEventListener('DOMContentLoaded', () => {
      * @param {string} issueName - The issue name
      * @param {string} publicationDate - The publication date
      * @param {string} returnTo - Where to return after editing ('layout' or 'account')
+     * @param {string} revision - The layout revision the details were loaded at
      */
-    window.openLayoutEditModal = function(layoutId, publicationName, issueName, publicationDate, returnTo) {
+    window.openLayoutEditModal = function(layoutId, publicationName, issueName, publicationDate, returnTo, revision = '') {
         if (!layoutModal) {
             console.error('Layout modal element not found!');
             return;
@@ -422,6 +425,11 @@ document.addEventListener('DOMContentLoaded', () => {
         document.getElementById('edit-publication-date').value = publicationDate;
         document.getElementById('edit-return-to').value = returnTo;
 
+        const revisionInput = document.getElementById('edit-revision');
+        if (revisionInput) {
+            revisionInput.value = revision;
+        }
+
         // Show modal
         layoutModal.classList.remove('hidden');
     };
@@ -920,6 +928,63 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
 
+    /**
+     * Builds the box for a page received from the server, like the spread grid
+     * template renders it (used to apply other editors' changes)
+     * @param {Object} page - The page as stored on the server
+     * @returns {HTMLElement} The page box, not yet added to the layout
+     */
+    window.buildPageBox = function(page) {
+        const knownTypes = ['edit', 'ad', 'mixed', 'placeholder'];
+        const pageType = knownTypes.includes(page.type) ? page.type : 'unknown';
+        const section = page.section || '';
+
+        const box = document.createElement('div');
+        box.id = page.page_number === 0 ? 'page-0' : `page-live-${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
+        box.className = `box rounded border ${pageType} relative p-3 aspect-[3/4] w-32 text-center flex flex-col justify-start select-none mr-2.5 shadow-sm`;
+        if (pageType === 'ad' && section === 'Bonus') box.classList.add('bonus');
+        if (pageType === 'ad' && section === 'Promo') box.classList.add('promo');
+        updateFormBreak(box, !!page.form_break);
+        if (page.fractional_units && page.fractional_units.length) {
+            box.setAttribute('data-fractional-ads', JSON.stringify(page.fractional_units));
+        }
+        if (page.mixed_page_template_id) {
+            box.setAttribute('data-mixed-page-layout-id', page.mixed_page_template_id);
+        }
+
+        if (pageType !== 'mixed') {
+            const sectionEl = document.createElement('div');
+            sectionEl.className = 'section font-semibold text-xs text-gray-700 mb-0.5';
+            sectionEl.textContent = section;
+            box.appendChild(sectionEl);
+        }
+
+        const nameWrapper = document.createElement('div');
+        nameWrapper.className = 'name-wrapper flex-1 flex items-center justify-center';
+        const nameEl = document.createElement('div');
+        nameEl.className = 'name font-medium text-sm truncate-long max-w-[90%] text-center text-gray-800';
+        nameEl.textContent = page.name || '';
+        nameWrapper.appendChild(nameEl);
+        box.appendChild(nameWrapper);
+
+        // Numbered by updatePageNumbers once the box is in the layout
+        const numberEl = document.createElement('div');
+        numberEl.className = 'page-number text-gray-500 text-xs';
+        box.appendChild(numberEl);
+
+        box.addEventListener('click', (e) => {
+            if (box.id === 'page-0') return;
+            if (box.classList.contains('mixed') && !e.target.closest('.edit-page-button')) {
+                return;
+            }
+            if (e.currentTarget === box) {
+                openEditModal(box);
+            }
+        });
+
+        return box;
+    };
+
     /**
      * Deletes a page
      */
@@ -0,0 +1,32 @@
+"""Shared fixtures for the test suite.
+
+Tests that need MongoDB use a throwaway database on the server at
+``MONGODB_TEST_URI`` (default ``mongodb://localhost:27017/``) and are skipped
+when no server is reachable.
+"""
+
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+
+@pytest.fixture(scope="session")
+def mongo_db():
+    """A MongoDB database that is dropped when the test session ends."""
+    client = MongoClient(
+        os.environ.get("MONGODB_TEST_URI", "mongodb://localhost:27017/"),
+        serverSelectionTimeoutMS=2000,
+    )
+    try:
+        client.admin.command("ping")
+    except PyMongoError as e:
+        client.close()
+        pytest.skip(f"MongoDB is not available: {e}")
+
+    name = f"flatplan_test_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
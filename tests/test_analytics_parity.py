@@ -0,0 +1,146 @@
+"""Parity of the aggregation analytics engine with the Python engine.
+
+Every flatplan in ``uploads/`` is stored as uploaded, in canonical form and
+with mixed pages carrying fractional ads, and both engines must produce the
+same analytics for it.
+"""
+
+import copy
+import glob
+import json
+import os
+
+import pytest
+from bson import ObjectId
+
+from models.page import FRACTIONAL_SIZES, canonical_pages
+from utils.analytics import aggregate_analytics, compute_analytics, format_analytics
+
+FIXTURES = sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), "..", "uploads", "*.json"))
+)
+
+# Ads placed on the generated mixed pages, in turn: every known size, an
+# unknown size, a missing section and a section with dots in its name
+FRACTIONAL_ADS = [
+    [{"size": "1/2", "section": "Paid", "name": "Advertiser"}],
+    [{"size": "1/4", "section": "Paid"}, {"size": "1/4", "section": "House"}],
+    [{"size": "1/3"}, {"size": "2/3", "section": "Paid"}],
+    [{"size": "3/4", "section": "Paid"}, {"size": "1/4", "section": "Real.Estate"}],
+    [],
+]
+
+
+def load_fixture(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def with_mixed_pages(pages):
+    """Turn every third page into a mixed page and add the odd page shapes."""
+    pages = copy.deepcopy(canonical_pages(pages))
+    for index, page in enumerate(pages[1::3]):
+        page["type"] = "mixed"
+        page["fractional_ads"] = copy.deepcopy(
+            FRACTIONAL_ADS[index % len(FRACTIONAL_ADS)]
+        )
+    pages.insert(0, {"name": "Page 0", "type": "placeholder", "page_number": 0})
+    pages.append({"name": "Open", "type": "placeholder", "section": "Placeholder"})
+    pages.append({"name": "Odd", "type": "Insert", "page number": "7"})
+    pages.append({"name": "Upper", "type": "AD", "section": None})
+    return pages
+
+
+VARIANTS = {
+    "stored": lambda pages: pages,
+    "canonical": canonical_pages,
+    "mixed": with_mixed_pages,
+}
+
+
+def differences(expected, actual, path=""):
+    """List the values that differ, comparing numbers with a small tolerance."""
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        found = []
+        for key in sorted(set(expected) | set(actual), key=str):
+            found.extend(
+                differences(expected.get(key), actual.get(key), f"{path}.{key}")
+            )
+        return found
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        if expected == pytest.approx(actual, abs=1e-6):
+            return []
+    elif expected == actual:
+        return []
+    return [f"{path}: python={expected!r} aggregation={actual!r}"]
+
+
+@pytest.fixture
+def collection(mongo_db):
+    mongo_db.layouts.delete_many({})
+    return mongo_db.layouts
+
+
+def store(collection, pages):
+    return collection.insert_one(
+        {"_id": ObjectId(), "account_id": ObjectId(), "revision": 3, "layout": pages}
+    ).inserted_id
+
+
+def test_fixtures_found():
+    assert FIXTURES
+
+
+@pytest.mark.parametrize("variant", sorted(VARIANTS))
+@pytest.mark.parametrize("path", FIXTURES, ids=os.path.basename)
+def test_engines_agree(collection, path, variant):
+    pages = VARIANTS[variant](load_fixture(path))
+    layout_id = store(collection, pages)
+
+    [result] = aggregate_analytics({"_id": layout_id}, collection)
+
+    assert result["_id"] == layout_id
+    assert result["revision"] == 3
+    expected = format_analytics({"analytics": compute_analytics(pages)})
+    actual = format_analytics({"analytics": result["analytics"]})
+    assert differences(expected, actual) == []
+
+
+def test_mixed_pages_are_counted(collection):
+    pages = with_mixed_pages(load_fixture(FIXTURES[0]))
+    store(collection, pages)
+
+    [result] = aggregate_analytics({}, collection)
+    analytics = format_analytics({"analytics": result["analytics"]})
+
+    assert analytics["page_types"]["mixed"]["total"] > 0
+    assert all(analytics["fractionalAdSizes"][size] > 0 for size in FRACTIONAL_SIZES)
+    assert analytics["total_pages"] == len(pages)
+
+
+def test_batch_matches_each_layout(collection):
+    expected = {}
+    for path in FIXTURES:
+        for make in VARIANTS.values():
+            pages = make(load_fixture(path))
+            expected[store(collection, pages)] = compute_analytics(pages)
+
+    results = aggregate_analytics({"_id": {"$in": list(expected)}}, collection)
+
+    assert {result["_id"] for result in results} == set(expected)
+    for result in results:
+        assert (
+            differences(
+                format_analytics({"analytics": expected[result["_id"]]}),
+                format_analytics({"analytics": result["analytics"]}),
+            )
+            == []
+        )
+
+
+def test_empty_layout_has_no_pages(collection):
+    layout_id = store(collection, [])
+
+    results = aggregate_analytics({"_id": layout_id}, collection)
+
+    assert [result["analytics"]["total_pages"] for result in results] in ([], [0])
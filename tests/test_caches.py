@@ -0,0 +1,157 @@
+"""The user cache and the fragment cache backends."""
+
+import os
+
+import pytest
+
+import utils.user_cache as user_cache_module
+from utils.fragment_cache import MemoryBackend, SQLiteBackend
+from utils.user_cache import UserCache
+
+
+class Clock:
+    """A stand-in for ``time.monotonic`` that only moves when told to."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(user_cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_user_cache_hit_and_miss(clock):
+    cache = UserCache(maxsize=2, ttl=10)
+
+    assert cache.get("a") is None
+    cache.set("a", "user a")
+
+    assert cache.get("a") == "user a"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_user_cache_entries_expire(clock):
+    cache = UserCache(maxsize=2, ttl=10)
+    cache.set("a", "user a")
+
+    clock.now += 10
+    assert cache.get("a") == "user a"
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_user_cache_evicts_the_least_recently_used(clock):
+    cache = UserCache(maxsize=2, ttl=10)
+    cache.set("a", "user a")
+    cache.set("b", "user b")
+    cache.get("a")
+
+    cache.set("c", "user c")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "user a"
+    assert cache.get("c") == "user c"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_user_cache_invalidate(clock):
+    cache = UserCache(maxsize=2, ttl=10)
+    cache.set("a", "user a")
+
+    cache.invalidate("a")
+    cache.invalidate("missing")
+
+    assert cache.get("a") is None
+
+
+@pytest.mark.parametrize("maxsize, ttl", [(0, 10), (2, 0)])
+def test_user_cache_can_be_disabled(clock, maxsize, ttl):
+    cache = UserCache()
+    cache.configure(maxsize, ttl)
+
+    cache.set("a", "user a")
+
+    assert cache.get("a") is None
+
+
+def test_user_cache_configure_drops_entries(clock):
+    cache = UserCache(maxsize=2, ttl=10)
+    cache.set("a", "user a")
+
+    cache.configure(4, 10)
+
+    assert cache.get("a") is None
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    """A fragment cache backend holding at most 10 bytes."""
+    if request.param == "memory":
+        return MemoryBackend(10)
+    return SQLiteBackend(os.path.join(tmp_path, "cache", "fragments.db"), 10)
+
+
+def test_fragment_backend_get_and_set(backend):
+    assert backend.get("1:a") is None
+
+    backend.set("1:a", "1", b"abc")
+    backend.set("1:a", "1", b"abcd")
+
+    assert backend.get("1:a") == b"abcd"
+    assert backend.stats()["entries"] == 1
+    assert backend.stats()["bytes"] == 4
+
+
+def test_fragment_backend_evicts_over_the_size_limit(backend, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("utils.fragment_cache.time.time", lambda: now[0])
+    for key in ("1:a", "1:b", "1:c"):
+        now[0] += 100
+        backend.set(key, "1", b"1234")
+    now[0] += 100
+    backend.get("1:b")
+
+    now[0] += 100
+    backend.set("1:d", "1", b"1234")
+
+    assert backend.get("1:a") is None
+    assert backend.get("1:c") is None
+    assert backend.get("1:b") == b"1234"
+    assert backend.get("1:d") == b"1234"
+    assert backend.stats()["bytes"] <= 10
+    assert backend.stats()["evictions"] == 2
+
+
+def test_fragment_backend_skips_values_over_the_limit(backend):
+    backend.set("1:a", "1", b"x" * 11)
+
+    assert backend.get("1:a") is None
+    assert backend.stats()["entries"] == 0
+
+
+def test_fragment_backend_delete_layout(backend):
+    backend.set("1:a", "1", b"a")
+    backend.set("1:b", "1", b"b")
+    backend.set("12:a", "12", b"c")
+
+    backend.delete_layout("1")
+
+    assert backend.get("1:a") is None
+    assert backend.get("1:b") is None
+    assert backend.get("12:a") == b"c"
+    assert backend.stats()["bytes"] == 1
+
+
+def test_sqlite_backend_is_shared_through_the_file(tmp_path):
+    path = os.path.join(tmp_path, "fragments.db")
+    SQLiteBackend(path, 100).set("1:a", "1", b"shared")
+
+    assert SQLiteBackend(path, 100).get("1:a") == b"shared"
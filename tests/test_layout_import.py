@@ -0,0 +1,187 @@
+"""The streaming upload parser and page validation."""
+
+import io
+import json
+
+import pytest
+
+import utils.layout_import as layout_import
+from models.page import canonical_pages
+from utils.analytics import compute_analytics
+from utils.layout_import import (
+    LayoutImportError,
+    iter_json_array,
+    normalize_page,
+    parse_layout_upload,
+)
+
+PAGES = [
+    {"name": "Cover", "type": "edit", "page_number": 1},
+    {"name": "Ad", "type": "ad", "page number": "2", "section": "Paid"},
+    {"name": "ünïcödé", "type": "mixed", "fractional_ads": [{"size": "1/2"}]},
+    {"name": "Numbers", "type": "edit", "values": [1, 2.5, -3e2, None, True]},
+]
+
+
+def parse(data, max_bytes=1024 * 1024):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return list(iter_json_array(io.BytesIO(data), max_bytes))
+
+
+@pytest.fixture(params=[1, 3, 64 * 1024], ids=lambda size: f"chunk{size}")
+def chunk_size(request, monkeypatch):
+    """Read uploads in chunks small enough to split every token."""
+    monkeypatch.setattr(layout_import, "READ_CHUNK_SIZE", request.param)
+    return request.param
+
+
+def test_decodes_every_element(chunk_size):
+    assert parse(json.dumps(PAGES, indent=2)) == PAGES
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("[]", []),
+        (" [ ] ", []),
+        ("[1, 23, 456]", [1, 23, 456]),
+        ('["a", {"b": []}]', ["a", {"b": []}]),
+        ("\ufeff[1]", [1]),
+        ("\n[\n1\n,\n2\n]\n", [1, 2]),
+    ],
+)
+def test_decodes_edge_cases(text, expected, chunk_size):
+    assert parse(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, error",
+    [
+        ("", "Expected a JSON array of pages"),
+        ('{"name": "x"}', "Expected a JSON array of pages"),
+        ("[1, 2", "Unexpected end of file"),
+        ("[1,", "Unexpected end of file"),
+        ("[1 2]", "Page 2: expected ',' between pages"),
+        ('[{"name": }]', "Page 1: invalid JSON"),
+        ("[1] x", "Unexpected data after the list of pages"),
+    ],
+)
+def test_rejects_malformed_json(text, error, chunk_size):
+    with pytest.raises(LayoutImportError, match=error):
+        parse(text)
+
+
+def test_rejects_invalid_utf8():
+    with pytest.raises(LayoutImportError, match="not valid UTF-8"):
+        parse(b'["\xff"]')
+
+
+def test_rejects_large_files(chunk_size):
+    with pytest.raises(LayoutImportError, match="larger than"):
+        parse(json.dumps(PAGES * 100), max_bytes=1024)
+
+
+def test_rejects_large_pages(monkeypatch):
+    monkeypatch.setattr(layout_import, "READ_CHUNK_SIZE", 16)
+    monkeypatch.setattr(layout_import, "MAX_PAGE_BYTES", 64)
+
+    with pytest.raises(LayoutImportError, match="Page 2: page is too large"):
+        parse(json.dumps([{"name": "x"}, {"name": "x" * 200}]))
+
+
+def test_normalize_page():
+    page = normalize_page(
+        {"name": " Cover ", "type": " Edit ", "page number": "3", "extra": 1}, 0
+    )
+
+    assert page == {
+        "name": "Cover",
+        "type": "edit",
+        "section": "",
+        "page_number": 3,
+        "extra": 1,
+    }
+
+
+def test_normalize_page_defaults_the_number_to_the_position():
+    assert normalize_page({"type": "ad"}, 4)["page_number"] == 5
+
+
+def test_normalize_page_accepts_numeric_text():
+    page = normalize_page({"type": "ad", "name": 12, "section": 1.5}, 0)
+
+    assert (page["name"], page["section"]) == ("12", "1.5")
+
+
+@pytest.mark.parametrize(
+    "page, error",
+    [
+        ([], "Page 3: expected an object"),
+        ({"type": "edit", "page_number": "x"}, "Page 3: invalid page number"),
+        ({"type": "edit", "page_number": True}, "Page 3: invalid page number"),
+        ({"type": "edit", "name": ["x"]}, "Page 3: 'name' must be text"),
+        ({"type": ["edit"]}, "Page 3: 'type' must be text"),
+        ({"type": "ad", "fractional_ads": {}}, "must be a list of objects"),
+        ({"type": "ad", "fractional_ads": ["1/2"]}, "must be a list of objects"),
+    ],
+)
+def test_normalize_page_rejects_invalid_pages(page, error):
+    with pytest.raises(LayoutImportError, match=error):
+        normalize_page(page, 2)
+
+
+def test_parse_layout_upload():
+    pages, error = parse_layout_upload(
+        io.BytesIO(json.dumps(PAGES).encode()), 10**6, 10
+    )
+
+    assert error is None
+    assert [page["page_number"] for page in pages] == [1, 2, 3, 4]
+    assert [page["type"] for page in pages] == ["edit", "ad", "mixed", "edit"]
+
+
+def test_parse_layout_upload_limits_the_page_count():
+    pages, error = parse_layout_upload(io.BytesIO(json.dumps(PAGES).encode()), 10**6, 3)
+
+    assert pages is None
+    assert error == "Page 4: too many pages (limit 3)"
+
+
+@pytest.mark.parametrize("page_type", ["Insert", "gatefold", " cover wrap "])
+def test_normalize_page_keeps_unknown_types(page_type):
+    page = normalize_page({"type": page_type}, 0)
+
+    assert page["type"] == page_type
+
+
+def test_normalize_page_accepts_pages_without_a_type():
+    assert "type" not in normalize_page({"name": "Blank"}, 0)
+
+
+def test_normalize_page_keeps_unknown_ad_sizes():
+    ads = [{"size": "1/8", "section": "Paid"}, {"size": 2}, {}]
+
+    assert (
+        normalize_page({"type": "mixed", "fractional_ads": ads}, 0)["fractional_ads"]
+        == ads
+    )
+
+
+def test_unknown_types_and_sizes_are_counted_like_stored_pages():
+    pages = [
+        {"name": "Insert", "type": "Insert"},
+        {"type": "mixed", "fractional_ads": [{"size": "1/8"}, {"size": "1/2"}]},
+    ]
+
+    uploaded, error = parse_layout_upload(
+        io.BytesIO(json.dumps(pages).encode()), 10**6, 10
+    )
+
+    assert error is None
+    assert [page.get("type") for page in uploaded] == [
+        page.get("type") for page in canonical_pages(pages)
+    ]
+    analytics = compute_analytics(uploaded)
+    assert analytics["page_types"]["unknown"]["total"] == 1
+    assert analytics["mixed_ad_space"] == pytest.approx(0.5)
@@ -0,0 +1,210 @@
+"""Patch operations: validation, application and what a patch records.
+
+None of these tests need MongoDB: the pages a patch touches, the splices
+recorded in the version history and the analytics delta are all built in
+the app and checked against the page list the patch produces.
+"""
+
+import copy
+
+import pytest
+
+from models.page import apply_delta, canonical_pages, unnumbered_page
+from utils.analytics import analytics_delta
+from utils.layout_patch import (
+    apply_patch_ops,
+    patch_analytics_delta,
+    patch_changes,
+    required_layout_size,
+    touched_indexes,
+    validate_patch_ops,
+)
+
+PAGES = canonical_pages(
+    [
+        {"name": "Cover", "type": "edit", "section": "Front"},
+        {"name": "Ad 1", "type": "ad", "section": "Paid"},
+        {
+            "name": "Mixed",
+            "type": "mixed",
+            "section": "News",
+            "fractional_ads": [{"size": "1/2", "section": "Paid"}],
+        },
+        {"name": "Feature", "type": "edit", "section": "Features"},
+        {"name": "Ad 2", "type": "ad", "section": "House"},
+        {"name": "Back", "type": "edit", "section": "Back"},
+    ]
+)
+
+PATCHES = {
+    "insert": [{"op": "insert", "index": 2, "page": {"name": "New", "type": "ad"}}],
+    "append": [{"op": "insert", "index": 6, "page": {"name": "End", "type": "edit"}}],
+    "delete": [{"op": "delete", "index": 1}],
+    "update": [{"op": "update", "index": 3, "fields": {"type": "AD", "name": " X "}}],
+    "move": [{"op": "move", "from": 0, "to": 4}],
+    "mixed": [
+        {"op": "insert", "index": 0, "page": {"name": "First", "type": "edit"}},
+        {"op": "move", "from": 3, "to": 1},
+        {"op": "update", "index": 1, "fields": {"section": "Moved"}},
+        {"op": "delete", "index": 5},
+        {"op": "update", "index": 0, "fields": {"type": "ad"}},
+    ],
+    "insert then delete": [
+        {"op": "insert", "index": 1, "page": {"name": "Gone", "type": "ad"}},
+        {"op": "delete", "index": 1},
+    ],
+}
+
+
+def validated(ops):
+    cleaned, error = validate_patch_ops(ops, 100)
+    assert error is None
+    return cleaned
+
+
+def unnumbered(pages):
+    return [unnumbered_page(page) for page in canonical_pages(pages)]
+
+
+def stored_pages(ops):
+    return {index: PAGES[index] for index in touched_indexes(ops)}
+
+
+def nonzero(delta):
+    return {path: pytest.approx(amount) for path, amount in delta.items() if amount}
+
+
+@pytest.mark.parametrize(
+    "ops, error",
+    [
+        ({"op": "delete"}, "ops must be a list"),
+        ([{"op": "rename", "index": 0}], "Operation 0: unknown operation"),
+        ([{"op": "delete", "index": -1}], "'index' must be a non-negative integer"),
+        ([{"op": "delete", "index": True}], "'index' must be a non-negative integer"),
+        ([{"op": "move", "from": 0}], "'to' must be a non-negative integer"),
+        ([{"op": "insert", "index": 0, "page": []}], "'page' must be an object"),
+        ([{"op": "update", "index": 0, "fields": {}}], "'fields' must be a non-empty"),
+        ([{"op": "update", "index": 0, "fields": {"$set": 1}}], "invalid field name"),
+        ([{"op": "update", "index": 0, "fields": {"a.b": 1}}], "invalid field name"),
+        ([{"op": "delete", "index": 0}] * 3, "Too many operations"),
+    ],
+)
+def test_invalid_ops_are_rejected(ops, error):
+    cleaned, message = validate_patch_ops(ops, 2)
+
+    assert cleaned is None
+    assert error in message
+
+
+def test_valid_ops_are_normalized():
+    cleaned = validated(
+        [
+            {"op": "insert", "index": 0, "page": {"name": " New ", "type": "AD"}},
+            {"op": "update", "index": 1, "fields": {"type": "Edit", "page_number": 9}},
+            {"op": "move", "from": 1, "to": 0, "extra": True},
+        ]
+    )
+
+    assert cleaned[0]["page"]["name"] == "New"
+    assert cleaned[0]["page"]["type"] == "ad"
+    assert "page_number" not in cleaned[0]["page"]
+    assert cleaned[1]["fields"] == {"type": "edit"}
+    assert cleaned[2] == {"op": "move", "from": 1, "to": 0}
+
+
+@pytest.mark.parametrize(
+    "ops, size",
+    [
+        ([], 0),
+        ([{"op": "insert", "index": 4, "page": {}}], 4),
+        ([{"op": "delete", "index": 4}], 5),
+        ([{"op": "move", "from": 2, "to": 7}], 8),
+        ([{"op": "insert", "index": 0, "page": {}}, {"op": "delete", "index": 5}], 5),
+        ([{"op": "delete", "index": 0}, {"op": "update", "index": 5, "fields": {}}], 7),
+    ],
+)
+def test_required_layout_size(ops, size):
+    assert required_layout_size(ops) == size
+
+
+def test_apply_patch_ops():
+    ops = validated(PATCHES["mixed"])
+
+    pages = apply_patch_ops(PAGES, ops)
+
+    assert [page["name"] for page in pages] == [
+        "First",
+        "Mixed",
+        "Cover",
+        "Ad 1",
+        "Feature",
+        "Back",
+    ]
+    assert pages[0]["type"] == "ad"
+    assert pages[1]["section"] == "Moved"
+    assert [page["name"] for page in PAGES][:2] == ["Cover", "Ad 1"]
+
+
+def test_apply_patch_ops_out_of_range():
+    assert apply_patch_ops(PAGES, validated([{"op": "delete", "index": 6}])) is None
+    assert apply_patch_ops(PAGES, validated(PATCHES["append"])) is not None
+
+
+def test_touched_indexes():
+    assert touched_indexes(validated(PATCHES["insert"])) == []
+    assert touched_indexes(validated(PATCHES["move"])) == [0]
+    assert touched_indexes(validated(PATCHES["mixed"])) == [2, 4]
+
+
+@pytest.mark.parametrize("name", sorted(PATCHES))
+def test_patch_changes_rebuild_the_patched_pages(name):
+    ops = validated(PATCHES[name])
+    expected = unnumbered(apply_patch_ops(PAGES, ops))
+
+    changes = patch_changes(ops, stored_pages(ops))
+
+    assert apply_delta(unnumbered(PAGES), changes) == expected
+    assert [change["at"] for change in changes] == sorted(
+        change["at"] for change in changes
+    )
+
+
+def test_patch_changes_leave_untouched_pages_out():
+    ops = validated(PATCHES["update"])
+
+    [change] = patch_changes(ops, stored_pages(ops))
+
+    assert change["at"] == 3
+    assert change["remove"] == 1
+    assert [page["name"] for page in change["insert"]] == ["X"]
+
+
+@pytest.mark.parametrize("name", sorted(PATCHES))
+def test_patch_analytics_delta_matches_the_patched_pages(name):
+    ops = validated(PATCHES[name])
+    expected = analytics_delta(
+        removed=PAGES, added=canonical_pages(apply_patch_ops(PAGES, ops))
+    )
+
+    delta = patch_analytics_delta(ops, stored_pages(ops))
+
+    assert nonzero(delta) == nonzero(expected)
+
+
+def test_patch_analytics_delta_of_a_move_is_empty():
+    ops = validated(PATCHES["move"])
+
+    assert nonzero(patch_analytics_delta(ops, stored_pages(ops))) == {}
+
+
+def test_patch_helpers_do_not_modify_their_input():
+    pages = copy.deepcopy(PAGES)
+    ops = validated(PATCHES["mixed"])
+    stored = stored_pages(ops)
+
+    apply_patch_ops(pages, ops)
+    patch_changes(ops, stored)
+    patch_analytics_delta(ops, stored)
+
+    assert pages == PAGES
+    assert stored == stored_pages(ops)
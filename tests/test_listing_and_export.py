@@ -0,0 +1,108 @@
+"""Account listing cursors and the streaming zip export."""
+
+import io
+import json
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from routes.main import decode_listing_cursor, encode_listing_cursor
+from utils.layout_export import iter_zip
+
+
+def test_listing_cursor_round_trip():
+    layout_id = ObjectId()
+    modified = datetime(2024, 5, 6, 7, 8, 9, 123000, tzinfo=timezone.utc)
+
+    cursor = encode_listing_cursor({"_id": layout_id, "modified_date": modified})
+
+    assert "=" not in cursor
+    assert decode_listing_cursor(cursor) == (modified, layout_id)
+
+
+def test_listing_cursor_treats_naive_dates_as_utc():
+    layout_id = ObjectId()
+    cursor = encode_listing_cursor(
+        {"_id": layout_id, "modified_date": datetime(2024, 5, 6, 7, 8, 9)}
+    )
+
+    assert decode_listing_cursor(cursor) == (
+        datetime(2024, 5, 6, 7, 8, 9, tzinfo=timezone.utc),
+        layout_id,
+    )
+
+
+def test_listing_cursor_without_a_modified_date():
+    layout_id = ObjectId()
+
+    modified, decoded_id = decode_listing_cursor(
+        encode_listing_cursor({"_id": layout_id})
+    )
+
+    assert decoded_id == layout_id
+    assert modified.timestamp() == datetime.fromtimestamp(0).timestamp()
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "!!!", "MTIzOnh5eg", "eHl6OjEyMw"])
+def test_invalid_listing_cursors(cursor):
+    assert decode_listing_cursor(cursor) is None
+
+
+def exported(publication, issue, pages=()):
+    return {
+        "id": str(ObjectId()),
+        "publication_name": publication,
+        "issue_name": issue,
+        "layout": list(pages),
+    }
+
+
+def read_zip(chunks):
+    return zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+
+def test_iter_zip_writes_one_file_per_layout():
+    documents = [
+        exported("Weekly", "May 1", [{"name": "Cover"}]),
+        exported("Weekly", "May 8"),
+        exported("Monthly", "June"),
+    ]
+
+    archive = read_zip(iter_zip(documents))
+
+    assert archive.namelist() == [
+        "Weekly/May 1.json",
+        "Weekly/May 8.json",
+        "Monthly/June.json",
+    ]
+    assert json.loads(archive.read("Weekly/May 1.json")) == documents[0]
+    assert archive.testzip() is None
+
+
+def test_iter_zip_streams_each_layout():
+    documents = iter([exported("A", "1"), exported("A", "2")])
+    chunks = iter_zip(documents)
+
+    next(chunks)
+
+    assert next(documents)["issue_name"] == "2"
+
+
+def test_iter_zip_cleans_and_deduplicates_names():
+    documents = [
+        exported("../News", "Issue: 1/2"),
+        exported("../News", "Issue: 1/2"),
+        exported("", " . "),
+    ]
+
+    names = read_zip(iter_zip(documents)).namelist()
+
+    assert names[0] == "_News/Issue_ 1_2.json"
+    assert names[1] == f"_News/Issue_ 1_2 ({documents[1]['id']}).json"
+    assert names[2] == "untitled/untitled.json"
+
+
+def test_iter_zip_without_layouts():
+    assert read_zip(iter_zip([])).namelist() == []
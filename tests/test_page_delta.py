@@ -0,0 +1,145 @@
+"""Page-level deltas: ``diff_pages``, ``apply_delta`` and rebuilding versions.
+
+Every recorded version must rebuild to exactly the pages that were stored,
+so each test turns a page list into another and back through the splices.
+Only ``test_version_pages_round_trip`` needs MongoDB.
+"""
+
+import random
+
+import pytest
+from bson import ObjectId
+
+import utils.layout_versions as layout_versions
+from models.page import (
+    apply_delta,
+    canonical_pages,
+    diff_pages,
+    number_pages,
+    unnumbered_page,
+)
+
+
+def make_pages(names):
+    return [
+        unnumbered_page(page)
+        for page in canonical_pages(
+            [{"name": name, "type": "edit", "section": "News"} for name in names]
+        )
+    ]
+
+
+PAGES = make_pages("ABCDEFGHIJ")
+
+EDITS = {
+    "equal": PAGES,
+    "insert": PAGES[:3] + make_pages(["New"]) + PAGES[3:],
+    "append": PAGES + make_pages(["End"]),
+    "delete": PAGES[:4] + PAGES[5:],
+    "replace": PAGES[:2] + make_pages(["X", "Y"]) + PAGES[4:],
+    "move": PAGES[1:6] + PAGES[:1] + PAGES[6:],
+    "empty": [],
+    "reverse": PAGES[::-1],
+}
+
+
+@pytest.mark.parametrize("name", sorted(EDITS))
+def test_round_trip(name):
+    new = EDITS[name]
+
+    changes = diff_pages(PAGES, new)
+
+    assert apply_delta(PAGES, changes) == new
+
+
+def test_round_trip_from_empty():
+    assert apply_delta([], diff_pages([], PAGES)) == PAGES
+
+
+def test_equal_lists_have_no_changes():
+    assert diff_pages(PAGES, list(PAGES)) == []
+
+
+def test_single_page_change_is_one_splice():
+    new = list(PAGES)
+    new[5] = {**new[5], "name": "Changed"}
+
+    assert diff_pages(PAGES, new) == [{"at": 5, "remove": 1, "insert": [new[5]]}]
+
+
+def test_splices_are_in_ascending_order():
+    new = make_pages(["0"]) + PAGES[:4] + PAGES[5:] + make_pages(["Z"])
+
+    changes = diff_pages(PAGES, new)
+
+    assert [change["at"] for change in changes] == [0, 4, 10]
+    assert apply_delta(PAGES, changes) == new
+
+
+def test_random_edits_round_trip():
+    generator = random.Random(7)
+    old = PAGES
+    for step in range(200):
+        new = list(old)
+        for _ in range(generator.randint(1, 4)):
+            action = generator.choice(("insert", "delete", "update", "move"))
+            if action == "insert" or not new:
+                new.insert(generator.randint(0, len(new)), make_pages([str(step)])[0])
+            elif action == "delete":
+                del new[generator.randrange(len(new))]
+            elif action == "update":
+                index = generator.randrange(len(new))
+                new[index] = {**new[index], "section": f"S{step}"}
+            else:
+                new.insert(
+                    generator.randint(0, len(new) - 1),
+                    new.pop(generator.randrange(len(new))),
+                )
+
+        assert apply_delta(old, diff_pages(old, new)) == new
+        old = new
+
+
+def test_apply_delta_does_not_modify_its_input():
+    pages = list(PAGES)
+
+    apply_delta(pages, diff_pages(pages, EDITS["replace"]))
+
+    assert pages == PAGES
+
+
+def test_number_pages_matches_canonical_numbering():
+    stored = canonical_pages(
+        [
+            {"name": "Page 0", "type": "placeholder", "page_number": 0},
+            {"name": "One", "type": "edit"},
+            {"name": "Two", "type": "ad", "page_number": 9},
+        ]
+    )
+
+    assert number_pages([unnumbered_page(page) for page in stored]) == stored
+    assert [page.get("page_number") for page in stored] == [0, 1, 2]
+
+
+def test_version_pages_round_trip(mongo_db, monkeypatch):
+    monkeypatch.setattr(layout_versions, "layout_versions", mongo_db.layout_versions)
+    layout_id = ObjectId()
+    history = [PAGES, EDITS["insert"], EDITS["move"], EDITS["delete"], EDITS["empty"]]
+    versions = [
+        {"layout_id": layout_id, "revision": 1, "kind": "snapshot", "pages": PAGES}
+    ]
+    for revision, (old, new) in enumerate(zip(history, history[1:]), start=2):
+        versions.append(
+            {
+                "layout_id": layout_id,
+                "revision": revision,
+                "kind": "delta",
+                "changes": diff_pages(old, new),
+            }
+        )
+    mongo_db.layout_versions.insert_many(versions)
+
+    for revision, pages in enumerate(history, start=1):
+        assert layout_versions._version_pages(layout_id, revision) == pages
+    assert layout_versions._version_pages(layout_id, len(history) + 1) is None
+    assert layout_versions._version_pages(ObjectId(), 1) is None
@@ -0,0 +1,42 @@
+"""Parsing revision preconditions and matching stored revisions."""
+
+import pytest
+
+from utils.revisions import parse_revision, revision_etag, revision_query
+
+
+@pytest.mark.parametrize(
+    "value, revision",
+    [
+        (None, None),
+        ("", None),
+        ("*", None),
+        (" * ", None),
+        ("0", 0),
+        ("7", 7),
+        ('"7"', 7),
+        ('W/"7"', 7),
+        (' "12" ', 12),
+        ('"3", "4"', 3),
+    ],
+)
+def test_parse_revision(value, revision):
+    assert parse_revision(value) == revision
+
+
+@pytest.mark.parametrize("value", ["abc", "W/", "-1", '"-2"', "1.5"])
+def test_parse_revision_rejects_invalid_values(value):
+    with pytest.raises(ValueError):
+        parse_revision(value)
+
+
+def test_etag_round_trip():
+    assert parse_revision(f'"{revision_etag(42)}"') == 42
+
+
+def test_revision_query():
+    assert revision_query(5) == {"revision": 5}
+
+
+def test_revision_zero_matches_layouts_without_a_revision():
+    assert revision_query(0) == {"revision": {"$in": [0, None]}}
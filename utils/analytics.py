@@ -0,0 +1,665 @@
+"""Layout analytics engine for the Flatplan application.
+
+Analytics are stored on each layout document in an ``analytics`` subdocument
+so that the analytics modal and the account dashboard can read them without
+walking the page list. Writers that replace the whole page list store a fresh
+copy; page-level writers apply ``$inc`` deltas built from the pages they add
+or remove. A subdocument without the current ``version`` (for example one
+created by an ``$inc`` on a layout saved before analytics were stored) is
+treated as stale and rebuilt on the next read, either in Python or with an
+aggregation that counts the pages inside MongoDB (``ANALYTICS_ENGINE``).
+"""
+
+from typing import Dict, List, Any, Iterable, Optional, Tuple, Union
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import UpdateOne
+from pymongo.collection import Collection
+
+from extensions import layouts
+from models.page import (
+    FRACTIONAL_SIZES,
+    PAGE_TYPES,
+    DEFAULT_SECTION,
+    Page,
+    page_type_name,
+)
+from utils.layout_clones import BASED, NOT_BASED, PAGES_PROJECTION, layout_pages
+
+# Bump when the stored structure changes so old subdocuments are rebuilt
+# (2: pages are read through models.page, so numeric-string page numbers
+# and null sections are normalized)
+ANALYTICS_VERSION = 2
+
+
+def fractional_size_to_decimal(size_str: str) -> float:
+    """Convert a fractional size string to its decimal equivalent.
+
+    Args:
+        size_str: The fractional size as a string (e.g., "1/4", "1/3", etc.)
+
+    Returns:
+        The decimal value of the fraction
+    """
+    return FRACTIONAL_SIZES.get(size_str, 0.0)
+
+
+def section_key(section: Any) -> str:
+    """Encode a section name so it can be used as a MongoDB field name.
+
+    Args:
+        section: The section name as stored on the page
+
+    Returns:
+        The section name with ``%``, ``.`` and ``$`` percent-encoded
+    """
+    key = str(section).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+    return key or "%"
+
+
+def section_name(key: str) -> str:
+    """Decode a section field name produced by ``section_key``.
+
+    Args:
+        key: The encoded section name
+
+    Returns:
+        The original section name
+    """
+    if key == "%":
+        return ""
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def _increment(counts: Dict[str, float], path: str, amount: float) -> None:
+    """Add an amount to a flat counter."""
+    counts[path] = counts.get(path, 0) + amount
+
+
+def _add_contribution(counts: Dict[str, float], page: Page) -> None:
+    """Add what a single page contributes to a flat counter of dotted paths."""
+    _increment(counts, "total_pages", 1)
+
+    # The placeholder Page 0 only counts towards the page total
+    if page.is_page_zero:
+        return
+
+    page_type = page.kind
+    section = section_key(page.section_or_default)
+
+    _increment(counts, f"page_types.{page_type}.total", 1)
+    _increment(counts, f"page_types.{page_type}.sections.{section}", 1)
+
+    if page_type == "edit":
+        _increment(counts, "total_editorial", 1)
+    elif page_type == "ad":
+        _increment(counts, "total_ads", 1)
+    elif page_type == "mixed":
+        total_ad_space = 0.0
+
+        for ad in page.fractional_ads:
+            ad_decimal_size = ad.value
+            total_ad_space += ad_decimal_size
+
+            if ad.size in FRACTIONAL_SIZES:
+                _increment(counts, f"fractionalAdSizes.{ad.size}", 1)
+
+            ad_section = section_key(ad.section_or_default)
+            _increment(counts, f"page_types.ad.sections.{ad_section}", ad_decimal_size)
+
+        # Editorial space is whatever the fractional ads leave on the page
+        _increment(counts, "total_ads", total_ad_space)
+        _increment(counts, "total_editorial", max(0, 1 - total_ad_space))
+        _increment(counts, "mixed_ad_space", total_ad_space)
+
+
+def _iter_pages(pages: Iterable[Any]) -> Iterable[Page]:
+    """Parse stored pages as needed, skipping entries that are not pages."""
+    for page in pages:
+        if isinstance(page, dict):
+            yield Page.from_bson(page)
+        elif isinstance(page, Page):
+            yield page
+
+
+def page_contribution(page: Union[Page, Dict[str, Any]]) -> Dict[str, float]:
+    """Calculate what a single page adds to a layout's analytics.
+
+    Args:
+        page: The page, or its stored subdocument
+
+    Returns:
+        A mapping of dotted analytics paths to the amounts the page contributes
+    """
+    counts: Dict[str, float] = {}
+    _add_contribution(counts, Page.coerce(page))
+    return counts
+
+
+def empty_analytics() -> Dict[str, Any]:
+    """Create the stored analytics structure for a layout with no pages.
+
+    Returns:
+        A dictionary with every counter set to zero
+    """
+    return {
+        "version": ANALYTICS_VERSION,
+        "total_pages": 0,
+        "total_editorial": 0.0,
+        "total_ads": 0.0,
+        "mixed_ad_space": 0.0,
+        "page_types": {
+            page_type: {"total": 0, "sections": {}} for page_type in PAGE_TYPES
+        },
+        "fractionalAdSizes": {size: 0 for size in FRACTIONAL_SIZES},
+    }
+
+
+def compute_analytics(pages: Iterable[Any]) -> Dict[str, Any]:
+    """Compute the stored analytics structure for a list of pages.
+
+    Contributions are summed into a flat counter first and nested once at the
+    end, rather than walking the nested structure for every page.
+
+    Args:
+        pages: The layout's pages, as ``Page`` objects or stored subdocuments
+
+    Returns:
+        The analytics subdocument to store on the layout
+    """
+    counts: Dict[str, float] = {}
+    for page in _iter_pages(pages):
+        _add_contribution(counts, page)
+
+    analytics = empty_analytics()
+    for path, amount in counts.items():
+        *parents, leaf = path.split(".")
+        target = analytics
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = target.get(leaf, 0) + amount
+
+    return analytics
+
+
+def _value_or(path: str, default: Any) -> Dict[str, Any]:
+    """Expression for a field's value, or a default when the field is missing.
+
+    Unlike ``$ifNull`` this keeps explicit nulls, matching ``dict.get``.
+    """
+    return {"$cond": [{"$eq": [{"$type": path}, "missing"]}, default, path]}
+
+
+def page_zero_expression(page: str) -> Dict[str, Any]:
+    """Expression testing whether a page is Page 0, as ``Page.is_page_zero`` does.
+
+    Args:
+        page: The path of the page, e.g. ``"$layout"`` or ``"$$page"``
+
+    Returns:
+        A boolean aggregation expression
+    """
+    page_number = {"$ifNull": [f"{page}.page_number", f"{page}.page number"]}
+    return {
+        "$cond": [
+            {"$eq": [{"$type": page_number}, "string"]},
+            {"$regexMatch": {"input": page_number, "regex": r"^\s*0+\s*$"}},
+            {"$eq": [page_number, 0]},
+        ]
+    }
+
+
+def analytics_pipeline(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build an aggregation computing layout analytics inside MongoDB.
+
+    Pages and fractional ads are unwound and grouped by layout, type and
+    section, so only the per-group counts leave the server. Type names and
+    section keys are normalized in Python by ``aggregate_analytics``, which
+    keeps them identical to ``page_contribution``; page numbers, sections and
+    fractional ads are read the same way as ``models.page.Page``.
+
+    Args:
+        query: A filter selecting the layouts
+
+    Returns:
+        The aggregation pipeline
+    """
+    ad_value = {
+        "$switch": {
+            "branches": [
+                {"case": {"$eq": ["$$size", size]}, "then": value}
+                for size, value in FRACTIONAL_SIZES.items()
+            ],
+            "default": 0.0,
+        }
+    }
+
+    page_zero = page_zero_expression("$layout")
+
+    return [
+        {"$match": query},
+        {"$project": {"revision": 1, "layout": 1}},
+        {"$unwind": {"path": "$layout", "preserveNullAndEmptyArrays": True}},
+        {
+            "$set": {
+                "page": {"$eq": [{"$type": "$layout"}, "object"]},
+                "counted": {
+                    "$and": [
+                        {"$eq": [{"$type": "$layout"}, "object"]},
+                        {"$not": [page_zero]},
+                    ]
+                },
+                "mixed": {
+                    "$and": [
+                        {"$eq": [{"$type": "$layout.type"}, "string"]},
+                        {"$eq": [{"$toLower": "$layout.type"}, "mixed"]},
+                    ]
+                },
+                "ads": {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": {
+                                    "$cond": [
+                                        {"$isArray": "$layout.fractional_ads"},
+                                        "$layout.fractional_ads",
+                                        [],
+                                    ]
+                                },
+                                "as": "ad",
+                                "cond": {"$eq": [{"$type": "$$ad"}, "object"]},
+                            }
+                        },
+                        "as": "ad",
+                        "in": {
+                            "$let": {
+                                "vars": {"size": _value_or("$$ad.size", "1/4")},
+                                "in": {
+                                    "size": "$$size",
+                                    "section": {
+                                        "$ifNull": ["$$ad.section", DEFAULT_SECTION]
+                                    },
+                                    "value": ad_value,
+                                },
+                            }
+                        },
+                    }
+                },
+            }
+        },
+        {"$set": {"ad_space": {"$cond": ["$mixed", {"$sum": "$ads.value"}, 0.0]}}},
+        {
+            "$facet": {
+                "pages": [
+                    {
+                        "$group": {
+                            "_id": {
+                                "layout": "$_id",
+                                "counted": "$counted",
+                                "type": "$layout.type",
+                                "section": {
+                                    "$ifNull": ["$layout.section", DEFAULT_SECTION]
+                                },
+                            },
+                            "revision": {"$first": "$revision"},
+                            "count": {"$sum": {"$cond": ["$page", 1, 0]}},
+                            "ad_space": {"$sum": "$ad_space"},
+                            "editorial_space": {
+                                "$sum": {
+                                    "$cond": [
+                                        "$mixed",
+                                        {"$max": [0, {"$subtract": [1, "$ad_space"]}]},
+                                        0.0,
+                                    ]
+                                }
+                            },
+                        }
+                    }
+                ],
+                "ads": [
+                    {"$match": {"counted": True, "mixed": True}},
+                    {"$unwind": "$ads"},
+                    {
+                        "$group": {
+                            "_id": {
+                                "layout": "$_id",
+                                "size": "$ads.size",
+                                "section": "$ads.section",
+                            },
+                            "count": {"$sum": 1},
+                            "space": {"$sum": "$ads.value"},
+                        }
+                    },
+                ],
+            }
+        },
+    ]
+
+
+def aggregate_analytics(
+    query: Dict[str, Any], collection: Optional[Collection] = None
+) -> List[Dict[str, Any]]:
+    """Compute analytics for the matching layouts with ``analytics_pipeline``.
+
+    Args:
+        query: A filter selecting the layouts
+        collection: The collection to aggregate (defaults to ``layouts``)
+
+    Returns:
+        One document per layout with ``_id``, ``revision`` and ``analytics``
+    """
+    collection = layouts if collection is None else collection
+    result = next(collection.aggregate(analytics_pipeline(query)), None)
+    if not result:
+        return []
+
+    rebuilt: Dict[ObjectId, Dict[str, Any]] = {}
+
+    for group in result["pages"]:
+        key = group["_id"]
+        layout_doc = rebuilt.setdefault(
+            key["layout"],
+            {
+                "_id": key["layout"],
+                "revision": group.get("revision") or 0,
+                "analytics": empty_analytics(),
+            },
+        )
+        analytics = layout_doc["analytics"]
+        analytics["total_pages"] += group["count"]
+        if not key["counted"]:
+            continue
+
+        page_type = page_type_name(key.get("type"))
+        counts = analytics["page_types"][page_type]
+        section = section_key(key.get("section"))
+        counts["total"] += group["count"]
+        counts["sections"][section] = (
+            counts["sections"].get(section, 0) + group["count"]
+        )
+
+        if page_type == "edit":
+            analytics["total_editorial"] += group["count"]
+        elif page_type == "ad":
+            analytics["total_ads"] += group["count"]
+        elif page_type == "mixed":
+            analytics["total_ads"] += group["ad_space"]
+            analytics["total_editorial"] += group["editorial_space"]
+            analytics["mixed_ad_space"] += group["ad_space"]
+
+    for group in result["ads"]:
+        key = group["_id"]
+        analytics = rebuilt[key["layout"]]["analytics"]
+        if key.get("size") in FRACTIONAL_SIZES:
+            analytics["fractionalAdSizes"][key["size"]] += group["count"]
+        sections = analytics["page_types"]["ad"]["sections"]
+        section = section_key(key.get("section"))
+        sections[section] = sections.get(section, 0) + group["space"]
+
+    return list(rebuilt.values())
+
+
+def analytics_delta(
+    removed: Iterable[Union[Page, Dict[str, Any]]] = (),
+    added: Iterable[Union[Page, Dict[str, Any]]] = (),
+) -> Dict[str, float]:
+    """Build the ``$inc`` document for pages removed from and added to a layout.
+
+    Args:
+        removed: Pages taken out of the layout (including the old version of replaced pages)
+        added: Pages put into the layout
+
+    Returns:
+        A mapping of ``analytics.*`` paths to increments, without zero entries
+    """
+    delta: Dict[str, float] = {}
+
+    for page in removed:
+        for path, amount in page_contribution(page).items():
+            _increment(delta, f"analytics.{path}", -amount)
+    for page in added:
+        for path, amount in page_contribution(page).items():
+            _increment(delta, f"analytics.{path}", amount)
+
+    return {path: amount for path, amount in delta.items() if amount}
+
+
+def analytics_delta_stage(delta: Dict[str, float]) -> Dict[str, Any]:
+    """Build an update pipeline stage applying an ``analytics_delta``.
+
+    Pipeline updates cannot use ``$inc``, so each counter is added to
+    explicitly. Like ``$inc``, this creates counters that do not exist yet.
+
+    Args:
+        delta: A non-empty ``$inc`` document from ``analytics_delta``
+
+    Returns:
+        A ``$set`` stage
+    """
+    return {
+        "$set": {
+            path: {"$add": [{"$ifNull": [f"${path}", 0]}, amount]}
+            for path, amount in delta.items()
+        }
+    }
+
+
+def is_current(analytics: Optional[Dict[str, Any]]) -> bool:
+    """Check whether a stored analytics subdocument can be served as is.
+
+    Args:
+        analytics: The stored subdocument, if any
+
+    Returns:
+        True if the subdocument is complete and uses the current structure
+    """
+    return bool(analytics) and analytics.get("version") == ANALYTICS_VERSION
+
+
+def _format_sections(sections: Dict[str, float]) -> Dict[str, float]:
+    """Decode section names and drop sections whose count fell to zero."""
+    formatted = {}
+    for key, count in sections.items():
+        if abs(count) < 1e-9:
+            continue
+        formatted[section_name(key)] = (
+            int(round(count)) if float(count).is_integer() else round(count, 3)
+        )
+    return formatted
+
+
+def format_analytics(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn a layout's stored analytics into the structure served by the API.
+
+    Args:
+        layout_doc: The layout document, with at least ``analytics`` and the name fields
+
+    Returns:
+        A dictionary with page type totals, section counts and ad/editorial totals
+    """
+    stored = layout_doc["analytics"]
+    page_types = {}
+
+    for page_type in PAGE_TYPES:
+        counts = stored.get("page_types", {}).get(page_type, {})
+        page_types[page_type] = {
+            "total": int(round(counts.get("total", 0))),
+            "sections": _format_sections(counts.get("sections", {})),
+        }
+
+    # Calculate percentages for mixed pages if any exist
+    mixed = page_types["mixed"]
+    mixed["editorialPercentage"] = 0.0
+    mixed["adPercentage"] = 0.0
+    if mixed["total"] > 0:
+        ad_percentage = stored.get("mixed_ad_space", 0.0) / mixed["total"]
+        mixed["adPercentage"] = ad_percentage
+        mixed["editorialPercentage"] = 1 - ad_percentage
+
+    return {
+        "publication_name": layout_doc.get("publication_name", "Unnamed Publication"),
+        "issue_name": layout_doc.get("issue_name", "Unnamed Issue"),
+        "total_pages": int(round(stored.get("total_pages", 0))),
+        "total_editorial": round(stored.get("total_editorial", 0.0), 2),
+        "total_ads": round(stored.get("total_ads", 0.0), 2),
+        "page_types": page_types,
+        "fractionalAdSizes": {
+            size: int(round(stored.get("fractionalAdSizes", {}).get(size, 0)))
+            for size in FRACTIONAL_SIZES
+        },
+    }
+
+
+def _store_analytics_write(
+    layout_doc: Dict[str, Any],
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Build the revision-guarded filter and update storing a layout's analytics."""
+    revision = layout_doc.get("revision", 0)
+    return (
+        {
+            "_id": layout_doc["_id"],
+            "revision": {"$in": [0, None]} if revision == 0 else revision,
+        },
+        {"$set": {"analytics": layout_doc["analytics"]}},
+    )
+
+
+def store_analytics(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Compute and store analytics for a layout document that includes its pages.
+
+    The write only applies if the layout is still at the revision that was
+    read, so it never overwrites analytics maintained by a newer write.
+
+    Args:
+        layout_doc: The layout document, with ``_id``, ``layout`` and ``revision``
+
+    Returns:
+        The computed analytics subdocument
+    """
+    analytics = compute_analytics(layout_doc.get("layout", []))
+    layouts.update_one(*_store_analytics_write({**layout_doc, "analytics": analytics}))
+    return analytics
+
+
+def rebuild_analytics(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Recompute and store the analytics of the layouts matching a query.
+
+    ``ANALYTICS_ENGINE`` selects whether the pages are counted by MongoDB
+    (``aggregation``) or loaded and counted in Python (``python``). Clones
+    stored as overrides of a base (see ``utils.layout_clones``) are always
+    counted in Python, since their pages only exist once materialized.
+
+    Args:
+        query: A filter selecting the layouts
+
+    Returns:
+        One document per layout with ``_id``, ``revision`` and ``analytics``
+    """
+    if current_app.config.get("ANALYTICS_ENGINE") == "aggregation":
+        rebuilt = aggregate_analytics({"$and": [query, NOT_BASED]})
+        query = {"$and": [query, BASED]}
+    else:
+        rebuilt = []
+
+    rebuilt.extend(
+        {
+            "_id": layout_doc["_id"],
+            "revision": layout_doc.get("revision", 0),
+            "analytics": compute_analytics(layout_pages(layout_doc)),
+        }
+        for layout_doc in layouts.find(query, {**PAGES_PROJECTION, "revision": 1})
+    )
+
+    if rebuilt:
+        layouts.bulk_write(
+            [UpdateOne(*_store_analytics_write(layout_doc)) for layout_doc in rebuilt],
+            ordered=False,
+        )
+    return rebuilt
+
+
+def load_layout_analytics(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Load the analytics for a layout, rebuilding them if they are stale.
+
+    Args:
+        query: A filter selecting a single layout
+
+    Returns:
+        The formatted analytics, or None if no layout matches
+    """
+    layout_doc = layouts.find_one(
+        query, {"analytics": 1, "publication_name": 1, "issue_name": 1}
+    )
+    if not layout_doc:
+        return None
+
+    if not is_current(layout_doc.get("analytics")):
+        rebuilt = rebuild_analytics({"_id": layout_doc["_id"]})
+        if not rebuilt:
+            return None
+        layout_doc["analytics"] = rebuilt[0]["analytics"]
+
+    return format_analytics(layout_doc)
+
+
+# Fields read for each layout by the batch analytics endpoint
+BATCH_PROJECTION = {"analytics": 1, "publication_name": 1, "issue_name": 1}
+
+
+def _batch_analytics(layout_docs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Format the analytics of many layouts, rebuilding the stale ones together."""
+    stale = {
+        layout_doc["_id"]: layout_doc
+        for layout_doc in layout_docs
+        if not is_current(layout_doc.get("analytics"))
+    }
+    if stale:
+        for rebuilt in rebuild_analytics({"_id": {"$in": list(stale)}}):
+            stale[rebuilt["_id"]]["analytics"] = rebuilt["analytics"]
+
+    return {
+        str(layout_doc["_id"]): format_analytics(layout_doc)
+        for layout_doc in layout_docs
+        if is_current(layout_doc.get("analytics"))
+    }
+
+
+def load_batch_analytics(query: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Load the analytics for many layouts at once.
+
+    Stored analytics are read with a single query; layouts whose analytics
+    are stale are rebuilt together with ``rebuild_analytics``.
+
+    Args:
+        query: A filter selecting the layouts
+
+    Returns:
+        A dictionary mapping layout IDs (as strings) to formatted analytics
+    """
+    return _batch_analytics(list(layouts.find(query, BATCH_PROJECTION)))
+
+
+def load_analytics_page(
+    query: Dict[str, Any], limit: int
+) -> Tuple[Dict[str, Dict[str, Any]], Optional[str]]:
+    """Load the analytics for one page of layouts, in ID order.
+
+    Args:
+        query: A filter selecting the layouts (add ``{"_id": {"$gt": ...}}``
+            with the previous page's last ID to read the next page)
+        limit: The maximum number of layouts on the page
+
+    Returns:
+        A tuple containing the analytics by layout ID (as in
+        ``load_batch_analytics``) and the last layout ID of the page, or None
+        if this is the last page
+    """
+    layout_docs = list(
+        layouts.find(query, BATCH_PROJECTION).sort("_id", 1).limit(limit + 1)
+    )
+    last_id = None
+    if len(layout_docs) > limit:
+        layout_docs = layout_docs[:limit]
+        last_id = str(layout_docs[-1]["_id"])
+    return _batch_analytics(layout_docs), last_id
@@ -0,0 +1,314 @@
+"""Cache for rendered flatplan grid fragments.
+
+Rendering the spread grid loops over every page of a layout and is the most
+CPU-heavy part of the layout pages. Rendered grids are cached under a key
+built from the layout ID, its revision and modified date, and the template
+variant, so a write never serves a stale grid; writers still call
+``evict_layout`` so old entries free their space straight away.
+
+Two backends are available, selected with ``FRAGMENT_CACHE_BACKEND``:
+
+- ``memory``: a per-process LRU bounded by the size of the cached fragments
+- ``sqlite``: an LRU in a local SQLite file shared by every worker on the host
+
+``none`` disables the cache. Rendered proofs (utils/proof_render.py) are
+cached the same way with ``get_file``/``set_file``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+# Seconds after which a hit in the SQLite cache records its access again;
+# hits in between need no write, at the cost of a coarser LRU order
+ACCESS_REFRESH_SECONDS = 60
+
+
+class MemoryBackend:
+    """A thread-safe in-process LRU bounded by the total size of its values."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached value and mark it as recently used."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, layout_id: str, value: bytes) -> None:
+        """Store a value, evicting the least recently used ones over the limit."""
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._entries[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def delete_layout(self, layout_id: str) -> None:
+        """Drop every value cached for a layout."""
+        prefix = f"{layout_id}:"
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                self.current_bytes -= len(self._entries.pop(key))
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the number and total size of cached values."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+            }
+
+
+class SQLiteBackend:
+    """An LRU stored in a SQLite file so every worker on a host shares it.
+
+    Access times are only refreshed once they are ``ACCESS_REFRESH_SECONDS``
+    old, so most hits are a single read.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS fragments ("
+                "key TEXT PRIMARY KEY, layout_id TEXT NOT NULL, value BLOB NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS fragments_layout ON fragments (layout_id)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS fragments_accessed ON fragments (accessed)"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, opening a new one after a fork."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return a cached value and mark it as recently used."""
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, accessed FROM fragments WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if now - row[1] >= ACCESS_REFRESH_SECONDS:
+            connection.execute(
+                "UPDATE fragments SET accessed = ? WHERE key = ?", (now, key)
+            )
+        return bytes(row[0])
+
+    def set(self, key: str, layout_id: str, value: bytes) -> None:
+        """Store a value, evicting the least recently used ones over the limit."""
+        if len(value) > self.max_bytes:
+            return
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO fragments VALUES (?, ?, ?, ?, ?)",
+                (key, layout_id, value, len(value), time.time()),
+            )
+            total = connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM fragments"
+            ).fetchone()[0]
+            while total > self.max_bytes:
+                row = connection.execute(
+                    "SELECT key, size FROM fragments ORDER BY accessed LIMIT 1"
+                ).fetchone()
+                connection.execute("DELETE FROM fragments WHERE key = ?", (row[0],))
+                total -= row[1]
+                self.evictions += 1
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete_layout(self, layout_id: str) -> None:
+        """Drop every value cached for a layout."""
+        self._connection().execute(
+            "DELETE FROM fragments WHERE layout_id = ?", (layout_id,)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the number and total size of cached values."""
+        entries, size = (
+            self._connection()
+            .execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM fragments")
+            .fetchone()
+        )
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class FragmentCache:
+    """Front end for the configured fragment cache backend."""
+
+    def __init__(self):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, backend: str, max_bytes: int, path: str) -> None:
+        """Select the backend and its size limit.
+
+        Args:
+            backend: "memory", "sqlite" or "none"
+            max_bytes: The maximum total size of the cached fragments
+            path: The SQLite file used by the "sqlite" backend
+        """
+        if backend == "memory":
+            self.backend = MemoryBackend(max_bytes)
+        elif backend == "sqlite":
+            self.backend = SQLiteBackend(path, max_bytes)
+        elif backend == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown fragment cache backend: {backend}")
+
+    @staticmethod
+    def key(layout_doc: Dict[str, Any], variant: str) -> str:
+        """Build the cache key of a layout's rendered fragment.
+
+        Args:
+            layout_doc: The layout document
+            variant: The template variant (e.g. "editor" or "shared")
+
+        Returns:
+            A key that changes whenever the layout is written
+        """
+        modified = layout_doc.get("modified_date")
+        millis = 0
+        if isinstance(modified, datetime):
+            if modified.tzinfo is None:
+                modified = modified.replace(tzinfo=timezone.utc)
+            millis = int(modified.timestamp() * 1000)
+        revision = layout_doc.get("revision") or 0
+        return f"{layout_doc['_id']}:{revision}:{millis}:{variant}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a rendered fragment.
+
+        Args:
+            key: The key from ``key``
+
+        Returns:
+            The fragment as stored by ``set``, or None on a miss
+        """
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, fragment: Dict[str, Any]) -> None:
+        """Store a rendered fragment.
+
+        Args:
+            key: The key from ``key``
+            fragment: The rendered HTML and any values derived while rendering
+                it, as a JSON-serializable dictionary
+        """
+        if self.backend is not None:
+            value = json.dumps(fragment).encode("utf-8")
+            self.backend.set(key, key.split(":", 1)[0], value)
+
+    def get_file(self, key: str) -> Optional[bytes]:
+        """Look up a rendered file (such as a PDF proof) stored as raw bytes.
+
+        Args:
+            key: The key from ``key``
+
+        Returns:
+            The file, or None on a miss
+        """
+        if self.backend is None:
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set_file(self, key: str, value: bytes) -> None:
+        """Store a rendered file as raw bytes.
+
+        Args:
+            key: The key from ``key``
+            value: The file contents
+        """
+        if self.backend is not None:
+            self.backend.set(key, key.split(":", 1)[0], value)
+
+    def evict_layout(self, layout_id: Any) -> None:
+        """Drop every cached fragment of a layout after it was written.
+
+        Args:
+            layout_id: The layout's ID
+        """
+        if self.backend is not None:
+            self.backend.delete_layout(str(layout_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """Report hit/miss counters and the backend's usage.
+
+        Returns:
+            A dictionary of cache statistics
+        """
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+        if self.backend is not None:
+            stats.update(self.backend.stats())
+        return stats
+
+
+# Shared by the layout views and the layout writers
+fragment_cache = FragmentCache()
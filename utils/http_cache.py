@@ -0,0 +1,103 @@
+"""Conditional GET support for rendered layout pages.
+
+Rendering a flatplan is the most expensive response the app produces, and
+proof links are refreshed all day. These helpers read a layout's validators
+(``revision`` and ``modified_date``) from the ``layout_validators`` index
+without loading the document, and answer ``If-None-Match`` and
+``If-Modified-Since`` with ``304 Not Modified`` before anything is rendered.
+"""
+
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from flask import current_app, request, session
+from pymongo.errors import OperationFailure
+
+from extensions import layouts
+
+# Index holding every field needed by ``layout_validators`` (see utils/indexes.py)
+VALIDATOR_INDEX = "layout_validators"
+
+VALIDATOR_PROJECTION = {"_id": 1, "revision": 1, "modified_date": 1}
+
+
+def layout_validators(query: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Read a layout's revision and modified date without fetching the document.
+
+    The probe is hinted to ``layout_validators`` so it is answered from the
+    index alone; if the index has not been created yet the same query runs
+    unhinted.
+
+    Args:
+        query: A filter on ``_id`` (and optionally ``account_id``)
+
+    Returns:
+        A dictionary with ``revision`` and ``modified_date``, or None if no layout matches
+    """
+    try:
+        return layouts.find_one(query, VALIDATOR_PROJECTION, hint=VALIDATOR_INDEX)
+    except OperationFailure:
+        return layouts.find_one(query, VALIDATOR_PROJECTION)
+
+
+def _last_modified(validators: Dict[str, Any]) -> Optional[datetime]:
+    """Get a layout's modified date as an aware UTC datetime, truncated to seconds."""
+    modified = validators.get("modified_date")
+    if not isinstance(modified, datetime):
+        return None
+    if modified.tzinfo is None:
+        modified = modified.replace(tzinfo=timezone.utc)
+    return modified.replace(microsecond=0)
+
+
+def not_modified_response(validators: Dict[str, Any], etag: str):
+    """Answer a conditional GET for a layout page if the client's copy is current.
+
+    Pages with pending flash messages are always rendered so the messages
+    are shown. ``If-None-Match`` takes precedence over ``If-Modified-Since``.
+
+    Args:
+        validators: The result of ``layout_validators``
+        etag: The entity tag of the page the client would receive
+
+    Returns:
+        A 304 response, or None if the page has to be rendered
+    """
+    if request.method != "GET" or session.get("_flashes"):
+        return None
+
+    last_modified = _last_modified(validators)
+
+    if request.if_none_match:
+        current = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified:
+        current = last_modified <= request.if_modified_since
+    else:
+        current = False
+
+    if not current:
+        return None
+
+    response = current_app.response_class(status=304)
+    return set_validators(response, validators, etag)
+
+
+def set_validators(response, validators: Dict[str, Any], etag: str):
+    """Attach a layout page's validators to a response.
+
+    Args:
+        response: The response to update
+        validators: A layout document or the result of ``layout_validators``
+        etag: The entity tag of the page
+
+    Returns:
+        The same response
+    """
+    response.set_etag(etag)
+    last_modified = _last_modified(validators)
+    if last_modified:
+        response.last_modified = last_modified
+    # Browsers may keep the page but must check with us before reusing it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
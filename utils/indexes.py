@@ -0,0 +1,165 @@
+"""MongoDB index registry for the Flatplan application.
+
+Every index the application relies on is declared here. ``ensure_indexes``
+applies the registry idempotently (from ``create_app`` when
+``MONGODB_ENSURE_INDEXES`` is set, or with ``flask indexes ensure``) and
+``check_indexes`` compares it against the database, using ``$indexStats`` to
+flag indexes that are never used.
+"""
+
+from typing import Dict, List, Any, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+
+# Seconds sent and failed emails are kept in ``mail_queue`` after they finish
+MAIL_RETENTION_SECONDS = 30 * 24 * 60 * 60
+
+# Indexes per collection, as keyword arguments for ``create_index``
+INDEXES: Dict[str, List[Dict[str, Any]]] = {
+    "layouts": [
+        # Account listing: filter by account, newest first, and cover the
+        # fields rendered on the account page so the listing never loads
+        # page arrays
+        {
+            "keys": [
+                ("account_id", ASCENDING),
+                ("modified_date", DESCENDING),
+                ("_id", DESCENDING),
+                ("publication_name", ASCENDING),
+                ("issue_name", ASCENDING),
+                ("publication_date", ASCENDING),
+                ("revision", ASCENDING),
+            ],
+            "name": "account_listing",
+        },
+        # Conditional GETs read revision and modified_date from this index
+        # without fetching the layout (utils/http_cache.py)
+        {
+            "keys": [
+                ("_id", ASCENDING),
+                ("account_id", ASCENDING),
+                ("revision", ASCENDING),
+                ("modified_date", ASCENDING),
+            ],
+            "name": "layout_validators",
+        },
+        # Publication filter options and per-issue lookups
+        # (mongo_helpers.get_layout_by_issue)
+        {
+            "keys": [
+                ("account_id", ASCENDING),
+                ("publication_name", ASCENDING),
+                ("issue_name", ASCENDING),
+            ],
+            "name": "account_publication_issue",
+        },
+        # Clones sharing a base, for ``flask layouts gc-bases``
+        # (utils/layout_clones.py); most layouts have no base
+        {"keys": [("base", ASCENDING)], "name": "layout_base", "sparse": True},
+    ],
+    "layout_versions": [
+        # One version per layout revision; history listings, rebuilds (latest
+        # snapshot at or before a revision, then the deltas after it) and
+        # compaction all walk a layout's versions by revision
+        {
+            "keys": [("layout_id", ASCENDING), ("revision", DESCENDING)],
+            "name": "layout_revision_unique",
+            "unique": True,
+        },
+    ],
+    "users": [
+        # Login and registration look users up by email
+        {"keys": [("email", ASCENDING)], "name": "email_unique", "unique": True},
+    ],
+    "mail_queue": [
+        # The mail worker claims due messages in next_attempt_at order
+        {
+            "keys": [("status", ASCENDING), ("next_attempt_at", ASCENDING)],
+            "name": "status_next_attempt",
+        },
+        # Sent and failed messages are deleted once they have been finished
+        # for MAIL_RETENTION_SECONDS; queued messages have no finished_at
+        {
+            "keys": [("finished_at", ASCENDING)],
+            "name": "finished_ttl",
+            "expireAfterSeconds": MAIL_RETENTION_SECONDS,
+        },
+    ],
+    "shared_access": [
+        # verify_shared_access checks a layout's access code
+        {
+            "keys": [("layout_id", ASCENDING), ("access_code", ASCENDING)],
+            "name": "layout_access_code",
+        },
+    ],
+}
+
+
+def _key_pattern(keys: Any) -> Tuple[Tuple[str, Any], ...]:
+    """Normalize an index key specification for comparison."""
+    items = keys.items() if hasattr(keys, "items") else keys
+    return tuple((field, direction) for field, direction in items)
+
+
+def ensure_indexes(database) -> List[str]:
+    """Create every declared index that does not exist yet.
+
+    ``create_index`` is a no-op for indexes that already exist with the same
+    definition, so this is safe to run repeatedly.
+
+    Args:
+        database: The pymongo database to create the indexes in
+
+    Returns:
+        The names of the indexes that were ensured, as ``collection.index``
+    """
+    ensured = []
+    for collection_name, specs in INDEXES.items():
+        collection = database[collection_name]
+        for spec in specs:
+            options = {key: value for key, value in spec.items() if key != "keys"}
+            collection.create_index(spec["keys"], **options)
+            ensured.append(f"{collection_name}.{spec['name']}")
+    return ensured
+
+
+def check_indexes(database) -> Dict[str, List[str]]:
+    """Compare the declared indexes with the ones present in the database.
+
+    Usage counts come from ``$indexStats`` and reset when the server
+    restarts, so an index reported as unused may simply not have been needed
+    since then.
+
+    Args:
+        database: The pymongo database to inspect
+
+    Returns:
+        A dictionary with ``missing``, ``undeclared`` and ``unused`` lists of
+        ``collection.index`` names
+    """
+    report: Dict[str, List[str]] = {"missing": [], "undeclared": [], "unused": []}
+
+    for collection_name, specs in INDEXES.items():
+        collection = database[collection_name]
+        existing = {
+            _key_pattern(info["key"]): info["name"]
+            for info in collection.list_indexes()
+        }
+        declared = {_key_pattern(spec["keys"]): spec["name"] for spec in specs}
+
+        for pattern, name in declared.items():
+            if pattern not in existing:
+                report["missing"].append(f"{collection_name}.{name}")
+
+        for pattern, name in existing.items():
+            if pattern not in declared and name != "_id_":
+                report["undeclared"].append(f"{collection_name}.{name}")
+
+        for stats in collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                since = stats["accesses"]["since"].strftime("%Y-%m-%d %H:%M")
+                report["unused"].append(
+                    f"{collection_name}.{stats['name']} (no use since {since})"
+                )
+
+    return report
@@ -0,0 +1,195 @@
+"""Copy-on-write storage for cloned layouts.
+
+Cloning shares pages instead of copying them. The source's pages are moved
+once into an immutable ``layout_bases`` document that the source and every
+clone reference as ``base``; each of those layouts then stores only its
+``overrides``, the splices (see ``models.page.diff_pages``) turning the base
+pages into its own. ``layout_pages`` materializes them on read, so the rest
+of the app sees the same page list as for any other layout.
+
+Layouts with a base are written by the app (read, change, store the new
+overrides) instead of by the server-side pipelines used for other layouts:
+those writes only match ``NOT_BASED`` layouts, and writers fall back to
+``routes.layout.write_based_layout``. Once a layout's overrides hold more
+than ``CLONE_MATERIALIZE_RATIO`` of its pages it stores its pages in full
+again and no longer depends on the base. ``flask layouts gc-bases`` deletes
+bases that nothing references any more.
+"""
+
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Any, Optional, Tuple
+
+from bson import ObjectId
+from flask import current_app
+
+from extensions import layout_bases, layout_versions, layouts
+from models.page import (
+    LAYOUT_SCHEMA_VERSION,
+    apply_delta,
+    diff_pages,
+    number_pages,
+    unnumbered_page,
+)
+from utils.revisions import revision_query
+
+# Query fragments selecting layouts with and without a base
+BASED = {"base": {"$exists": True}}
+NOT_BASED = {"base": {"$exists": False}}
+
+# Fields needed to read a layout's pages, whether or not it has a base
+PAGES_PROJECTION = {"layout": 1, "schema_version": 1, "base": 1, "overrides": 1}
+
+# Bases younger than this are never collected, since a clone referencing
+# one may still be on its way to the database
+BASE_GC_GRACE = timedelta(hours=1)
+
+
+@lru_cache(maxsize=64)
+def base_pages(base_id: ObjectId) -> Tuple[Dict[str, Any], ...]:
+    """Load the pages of a base.
+
+    Bases never change, so they are cached per process. The pages are shared
+    between callers and must not be modified.
+
+    Args:
+        base_id: The base's ObjectId
+
+    Returns:
+        The base's pages, without page numbers
+
+    Raises:
+        LookupError: If the base does not exist
+    """
+    base = layout_bases.find_one({"_id": base_id}, {"pages": 1})
+    if base is None:
+        raise LookupError(f"Layout base {base_id} not found")
+    return tuple(base["pages"])
+
+
+def is_based(layout_doc: Dict[str, Any]) -> bool:
+    """Check whether a layout stores its pages as overrides of a base."""
+    return "base" in layout_doc
+
+
+def based_pages(layout_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Materialize the pages of a layout with a base.
+
+    Args:
+        layout_doc: The layout document, with ``base`` and ``overrides``
+
+    Returns:
+        The layout's pages in canonical form
+    """
+    return number_pages(
+        apply_delta(base_pages(layout_doc["base"]), layout_doc.get("overrides") or [])
+    )
+
+
+def layout_pages(layout_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get a layout's stored pages, materializing them if it has a base.
+
+    Args:
+        layout_doc: The layout document, read with at least ``PAGES_PROJECTION``
+
+    Returns:
+        The pages
+    """
+    if is_based(layout_doc):
+        return based_pages(layout_doc)
+    return layout_doc.get("layout") or []
+
+
+def create_base(pages: List[Dict[str, Any]]) -> ObjectId:
+    """Store a page list as a new base.
+
+    Args:
+        pages: Pages in canonical form
+
+    Returns:
+        The new base's ObjectId
+    """
+    return layout_bases.insert_one(
+        {
+            "pages": [unnumbered_page(page) for page in pages],
+            "page_count": len(pages),
+            "created_at": datetime.now(timezone.utc),
+        }
+    ).inserted_id
+
+
+def storage_update(base_id: ObjectId, pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the update storing new pages on a layout with a base.
+
+    Args:
+        base_id: The layout's base
+        pages: The layout's new pages, in canonical form
+
+    Returns:
+        ``$set`` and ``$unset`` documents storing the pages as overrides, or
+        in full once they differ from the base by more than
+        ``CLONE_MATERIALIZE_RATIO`` of the pages
+    """
+    overrides = diff_pages(
+        list(base_pages(base_id)), [unnumbered_page(page) for page in pages]
+    )
+    overridden = sum(len(change["insert"]) for change in overrides)
+    if overridden > current_app.config["CLONE_MATERIALIZE_RATIO"] * len(pages):
+        return {"$set": {"layout": pages}, "$unset": {"base": "", "overrides": ""}}
+    return {"$set": {"overrides": overrides}, "$unset": {"layout": ""}}
+
+
+def clone_pages_fields(
+    source_doc: Dict[str, Any], pages: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """Build the page fields of a new clone of a layout.
+
+    A source that already has a base shares it with the clone. Otherwise its
+    pages become a new base, and the source is switched to the base as well
+    so the pages are stored once.
+
+    Args:
+        source_doc: The layout being cloned, with ``_id`` and ``revision``
+        pages: The source's pages in canonical form
+
+    Returns:
+        The ``base`` and ``overrides`` fields for the clone
+    """
+    if is_based(source_doc):
+        return {
+            "base": source_doc["base"],
+            "overrides": source_doc.get("overrides") or [],
+        }
+
+    base_id = create_base(pages)
+    if source_doc.get("schema_version") == LAYOUT_SCHEMA_VERSION:
+        # Skipped if the source was written meanwhile; it then keeps its own
+        # copy of the pages. Legacy layouts are skipped because switching
+        # would change their pages without a new revision.
+        layouts.update_one(
+            {
+                "_id": source_doc["_id"],
+                **revision_query(source_doc.get("revision", 0)),
+                **NOT_BASED,
+            },
+            {"$set": {"base": base_id, "overrides": []}, "$unset": {"layout": ""}},
+        )
+    return {"base": base_id, "overrides": []}
+
+
+def collect_bases(now: Optional[datetime] = None) -> int:
+    """Delete bases that no layout or layout version references.
+
+    Args:
+        now: The current time (defaults to now)
+
+    Returns:
+        The number of bases deleted
+    """
+    cutoff = (now or datetime.now(timezone.utc)) - BASE_GC_GRACE
+    referenced = set(layouts.distinct("base", BASED))
+    referenced.update(layout_versions.distinct("base", BASED))
+    result = layout_bases.delete_many(
+        {"_id": {"$nin": list(referenced)}, "created_at": {"$lt": cutoff}}
+    )
+    return result.deleted_count
@@ -0,0 +1,202 @@
+"""Streaming export of every layout of an account.
+
+Layouts are read from a MongoDB cursor and written out one at a time, either
+as NDJSON (one layout per line) or as a zip archive with one JSON file per
+issue, so memory use does not grow with the size of the account. An export
+can be limited to layouts modified since a given time for incremental
+backups; layouts are exported oldest change first, so the ``modified_date``
+of the last exported layout is the checkpoint for the next run.
+"""
+
+import json
+import re
+import zipfile
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+from bson import ObjectId
+
+from extensions import layouts
+from utils.layout_clones import PAGES_PROJECTION, layout_pages
+
+EXPORT_FORMATS = ("ndjson", "zip")
+
+EXPORT_PROJECTION = {
+    "publication_name": 1,
+    "issue_name": 1,
+    "publication_date": 1,
+    "modified_date": 1,
+    "revision": 1,
+    **PAGES_PROJECTION,
+}
+
+# Layouts fetched per cursor batch
+EXPORT_BATCH_SIZE = 50
+
+
+def parse_since(value: Optional[str]) -> Optional[datetime]:
+    """Parse the ``since`` timestamp of an incremental export.
+
+    Args:
+        value: An ISO 8601 date or datetime (UTC if no offset is given), or None
+
+    Returns:
+        An aware datetime, or None if no value was given
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 timestamp
+    """
+    if not value:
+        return None
+    since = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
+
+
+def iter_export_documents(
+    account_id: ObjectId, since: Optional[datetime] = None
+) -> Iterator[Dict[str, Any]]:
+    """Stream an account's layouts from MongoDB, oldest change first.
+
+    Args:
+        account_id: The account's ObjectId
+        since: Only export layouts modified after this time
+
+    Yields:
+        Layout documents in export form (see ``export_document``)
+    """
+    query: Dict[str, Any] = {"account_id": account_id}
+    if since:
+        query["modified_date"] = {"$gt": since}
+
+    cursor = (
+        layouts.find(query, EXPORT_PROJECTION)
+        .sort([("modified_date", 1), ("_id", 1)])
+        .batch_size(EXPORT_BATCH_SIZE)
+    )
+    with cursor:
+        for layout_doc in cursor:
+            yield export_document(layout_doc)
+
+
+def _json_value(value: Any) -> Any:
+    """Convert BSON types to JSON-friendly values."""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    return value
+
+
+def export_document(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored layout to its exported form.
+
+    Args:
+        layout_doc: The layout document
+
+    Returns:
+        The layout's metadata and pages with IDs and dates as strings
+    """
+    return {
+        "id": str(layout_doc["_id"]),
+        "publication_name": layout_doc.get("publication_name", ""),
+        "issue_name": layout_doc.get("issue_name", ""),
+        "publication_date": _json_value(layout_doc.get("publication_date")),
+        "modified_date": _json_value(layout_doc.get("modified_date")),
+        "revision": layout_doc.get("revision", 0),
+        "layout": _json_value(layout_pages(layout_doc)),
+    }
+
+
+def iter_ndjson(documents: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Encode exported layouts as NDJSON, one line per layout.
+
+    Args:
+        documents: Layouts from ``iter_export_documents``
+
+    Yields:
+        One encoded line per layout
+    """
+    for document in documents:
+        yield json.dumps(document, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class _ZipStream:
+    """A write-only file that hands out what has been written since last drained."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _zip_name(document: Dict[str, Any], used: set) -> str:
+    """Build a unique ``publication/issue.json`` path for a layout in the archive."""
+
+    def clean(value: str) -> str:
+        return re.sub(r"[^\w .-]+", "_", value).strip(" .") or "untitled"
+
+    name = f"{clean(document['publication_name'])}/{clean(document['issue_name'])}"
+    if f"{name}.json" in used:
+        name = f"{name} ({document['id']})"
+    used.add(f"{name}.json")
+    return f"{name}.json"
+
+
+def iter_zip(documents: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Encode exported layouts as a zip archive with one JSON file per issue.
+
+    The archive is written to a non-seekable stream, so each entry is
+    compressed and sent as soon as its layout has been read.
+
+    Args:
+        documents: Layouts from ``iter_export_documents``
+
+    Yields:
+        Chunks of the zip archive
+    """
+    stream = _ZipStream()
+    used = set()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for document in documents:
+            archive.writestr(
+                _zip_name(document, used), json.dumps(document, indent=2)
+            )
+            yield stream.drain()
+    yield stream.drain()
+
+
+def iter_export(
+    account_id: ObjectId, export_format: str, since: Optional[datetime] = None
+) -> Iterator[bytes]:
+    """Stream an account's layouts in the requested format.
+
+    Args:
+        account_id: The account's ObjectId
+        export_format: "ndjson" or "zip"
+        since: Only export layouts modified after this time
+
+    Yields:
+        Chunks of the export
+    """
+    documents = iter_export_documents(account_id, since)
+    if export_format == "zip":
+        return iter_zip(documents)
+    return iter_ndjson(documents)
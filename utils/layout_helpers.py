@@ -6,133 +6,109 @@ keep the main routes file clean and focused on routing logic.
 
 from typing import Dict, List, Any
 
+from models.page import LAYOUT_SCHEMA_VERSION, canonical_pages
+from utils.analytics import compute_analytics, format_analytics, is_current
+from utils.layout_clones import based_pages, is_based, layout_pages
 
-def preprocess_layout_items(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Preprocess layout items for rendering.
+# Shown in front of page 1 so that it starts on a right-hand page
+PAGE_ZERO_PLACEHOLDER = {
+    "name": "—",
+    "type": "placeholder",
+    "section": "Start",
+    "page_number": 0,
+}
+
+
+def is_canonical(layout_doc: Dict[str, Any]) -> bool:
+    """Check whether a layout's pages are stored in the current canonical form.
 
     Args:
-        items: The raw layout items from the database
+        layout_doc: The layout document
 
     Returns:
-        Processed layout items ready for rendering
+        True if the pages can be used as stored
     """
-    # Make a copy to avoid modifying the original
-    processed_items = items.copy()
-
-    # Add visible placeholder Page 0 if first real page is Page 1
-    if processed_items and processed_items[0].get("page_number") == 1:
-        processed_items.insert(
-            0,
-            {
-                "name": "—",
-                "type": "placeholder",
-                "section": "Start",
-                "page_number": 0,
-            },
-        )
+    return layout_doc.get("schema_version") == LAYOUT_SCHEMA_VERSION
 
-    # Normalize item names
-    for item in processed_items:
-        if "name" in item:
-            item["name"] = item.get("name", "").strip()
 
-    # Ensure page numbering is consistent
-    processed_items = ensure_consistent_page_numbering(processed_items)
+def canonical_layout_pages(layout_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get a layout's pages in canonical form.
 
-    return processed_items
-
-
-def ensure_consistent_page_numbering(
-    items: List[Dict[str, Any]],
-) -> List[Dict[str, Any]]:
-    """Ensure page numbering is consistent and sequential.
+    Pages written since the canonical form was introduced are returned as
+    stored (materialized from their base for clones); older layouts (until
+    ``flask layouts normalize`` has run) are normalized on the fly, without
+    modifying the document.
 
     Args:
-        items: The layout items to check
+        layout_doc: The layout document, including its pages
 
     Returns:
-        Layout items with consistent page numbering
+        The canonical page list
     """
-    # Skip if no items
-    if not items:
-        return items
+    if is_based(layout_doc):
+        return based_pages(layout_doc)
+    if is_canonical(layout_doc):
+        return layout_doc.get("layout") or []
+    return canonical_pages(layout_doc.get("layout"))
+
 
-    # Skip page 0 if it exists
-    start_index = 1 if items[0].get("page_number") == 0 else 0
+def layout_display_items(layout_doc: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Get the items of a layout's spread grid.
 
-    # Ensure remaining pages are numbered sequentially
-    for i in range(start_index, len(items)):
-        items[i]["page_number"] = i if start_index == 0 else i
+    Stored pages are already numbered, so they are rendered as they are; only
+    the Page 0 placeholder is added in front when the layout starts at page 1.
+    The stored pages are neither copied nor modified.
 
-    return items
+    Args:
+        layout_doc: The layout document, including its pages
+
+    Returns:
+        The pages to render, in order
+    """
+    pages = canonical_layout_pages(layout_doc)
+    if pages and pages[0].get("page_number") != 0:
+        return [PAGE_ZERO_PLACEHOLDER, *pages]
+    return pages
 
 
 def extract_layout_summary(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
     """Extract a summary of a layout for display in listings.
 
+    The counts come from the layout's stored analytics (computed on the fly
+    if they are missing), so they always agree with the analytics API.
+
     Args:
-        layout_doc: The complete layout document
+        layout_doc: The layout document, with its ``analytics`` or ``layout`` field
 
     Returns:
         A dictionary with summary information
     """
-    items = layout_doc.get("layout", [])
+    analytics = layout_doc.get("analytics")
+    if not is_current(analytics):
+        analytics = compute_analytics(layout_pages(layout_doc))
+
+    formatted = format_analytics({**layout_doc, "analytics": analytics})
+    page_types = formatted["page_types"]
 
     # Count page types
     page_counts = {
-        "total": len(items),
-        "editorial": sum(1 for item in items if item.get("type") == "edit"),
-        "ads": sum(1 for item in items if item.get("type") == "ad"),
-        "mixed": sum(1 for item in items if item.get("type") == "mixed"),
-        "placeholder": sum(1 for item in items if item.get("type") == "placeholder"),
+        "total": formatted["total_pages"],
+        "editorial": page_types["edit"]["total"],
+        "ads": page_types["ad"]["total"],
+        "mixed": page_types["mixed"]["total"],
+        "placeholder": page_types["placeholder"]["total"],
     }
 
-    # Calculate editorial and ad percentages including fractional pages
-    total_editorial = page_counts["editorial"]
-    total_ads = page_counts["ads"]
-
-    # Process mixed pages
-    for item in items:
-        if item.get("type") == "mixed" and "fractional_ads" in item:
-            # Calculate ad space in this mixed page
-            fractional_ads = item.get("fractional_ads", [])
-            total_ad_space = 0.0
-
-            for ad in fractional_ads:
-                ad_size = ad.get("size", "1/4")
-                ad_decimal_size = fractional_size_to_decimal(ad_size)
-                total_ad_space += ad_decimal_size
-
-            # Calculate editorial space (remaining space on the page)
-            editorial_space = max(0, 1 - total_ad_space)
-
-            # Add to totals
-            total_ads += total_ad_space
-            total_editorial += editorial_space
-
     # Add to summary
     summary = {
         "id": str(layout_doc.get("_id")),
-        "publication_name": layout_doc.get("publication_name", "Unnamed Publication"),
-        "issue_name": layout_doc.get("issue_name", "Unnamed Issue"),
+        "publication_name": formatted["publication_name"],
+        "issue_name": formatted["issue_name"],
         "publication_date": layout_doc.get("publication_date"),
         "modified_date": layout_doc.get("modified_date"),
         "page_counts": page_counts,
-        "total_editorial": round(total_editorial, 2),
-        "total_ads": round(total_ads, 2),
+        "total_editorial": formatted["total_editorial"],
+        "total_ads": formatted["total_ads"],
     }
 
     return summary
-
-
-def fractional_size_to_decimal(size_str: str) -> float:
-    """Convert a fractional size string to its decimal equivalent.
-
-    Args:
-        size_str: The fractional size as a string (e.g., "1/4", "1/3", etc.)
-
-    Returns:
-        The decimal value of the fraction
-    """
-    size_map = {"1/4": 0.25, "1/3": 0.333, "1/2": 0.5, "2/3": 0.667}
-    return size_map.get(size_str, 0.0)
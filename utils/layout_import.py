@@ -0,0 +1,240 @@
+"""Streaming parser and validator for uploaded flatplan JSON files.
+
+An upload is a JSON array of page objects. Pages are decoded one at a time
+from the file stream, so the raw bytes, the decoded text and the parsed tree
+are never all held in memory at once, and each page is validated and
+normalized as soon as it has been read. Errors name the offending page.
+
+Files in the wild differ slightly: ``page_number`` may be a string, and some
+files (like data.json) use a ``"page number"`` key instead. Only pages that
+cannot be stored are rejected; page types and fractional ad sizes the app
+does not know are kept as they are, like ``models.page.canonical_page``
+does, and count as ``unknown`` (or take no space) in the analytics.
+"""
+
+import codecs
+import json
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+from models.page import PAGE_TYPES, canonical_pages
+from utils.analytics import compute_analytics
+
+# Bytes read from the upload at a time
+READ_CHUNK_SIZE = 64 * 1024
+
+# A single page larger than this is rejected rather than buffered
+MAX_PAGE_BYTES = 256 * 1024
+
+_decoder = json.JSONDecoder()
+
+
+class LayoutImportError(ValueError):
+    """Raised when an upload is not a valid flatplan."""
+
+
+def _page_error(index: int, message: str) -> LayoutImportError:
+    """Build an error that names the page (1-based, as shown to users)."""
+    return LayoutImportError(f"Page {index + 1}: {message}")
+
+
+def iter_json_array(stream, max_bytes: int) -> Iterator[Any]:
+    """Decode the elements of a top-level JSON array one at a time.
+
+    Args:
+        stream: A binary file-like object positioned at the start of the JSON
+        max_bytes: The maximum number of bytes to read from the stream
+
+    Yields:
+        Each decoded element of the array
+
+    Raises:
+        LayoutImportError: If the stream is not a JSON array or is too large
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    position = 0
+    total = 0
+    eof = False
+    started = False
+    index = 0
+
+    def fill() -> bool:
+        """Read the next chunk into the buffer; return False at end of input."""
+        nonlocal buffer, position, total, eof
+        chunk = stream.read(READ_CHUNK_SIZE)
+        total += len(chunk)
+        if total > max_bytes:
+            raise LayoutImportError(f"File is larger than {max_bytes // 1024} KB")
+        try:
+            text = decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError:
+            raise LayoutImportError("File is not valid UTF-8")
+        buffer = buffer[position:] + text
+        position = 0
+        eof = not chunk
+        return bool(chunk)
+
+    def next_token() -> Optional[str]:
+        """Skip whitespace and return the next character, reading as needed."""
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n":
+                position += 1
+            if position < len(buffer):
+                return buffer[position]
+            if eof or not fill():
+                return None
+
+    if next_token() != "[":
+        raise LayoutImportError("Expected a JSON array of pages")
+    position += 1
+
+    while True:
+        token = next_token()
+        if token is None:
+            raise LayoutImportError("Unexpected end of file")
+        if token == "]":
+            position += 1
+            break
+        if started:
+            if token != ",":
+                raise _page_error(index, "expected ',' between pages")
+            position += 1
+            if next_token() is None:
+                raise LayoutImportError("Unexpected end of file")
+
+        # Decode the next element, reading more input until it is complete.
+        # A value ending exactly at the end of the buffer (e.g. a number) may
+        # continue in the next chunk, so it is only accepted at end of input.
+        while True:
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+                if end < len(buffer) or eof:
+                    break
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise _page_error(index, f"invalid JSON ({e.msg})")
+                if len(buffer) - position > MAX_PAGE_BYTES:
+                    raise _page_error(index, "page is too large")
+            fill()
+
+        position = end
+        started = True
+        index += 1
+        yield value
+
+    if next_token() is not None:
+        raise LayoutImportError("Unexpected data after the list of pages")
+
+
+def _text(page: Dict[str, Any], key: str, index: int) -> str:
+    """Read an optional text field from a page, stripped of whitespace."""
+    value = page.get(key)
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    if not isinstance(value, str):
+        raise _page_error(index, f"'{key}' must be text")
+    return value.strip()
+
+
+def normalize_page(page: Any, index: int) -> Dict[str, Any]:
+    """Validate a page from an upload and convert it to the stored shape.
+
+    Args:
+        page: The decoded page object
+        index: The page's position in the upload (0-based)
+
+    Returns:
+        The normalized page
+
+    Raises:
+        LayoutImportError: If the page cannot be stored
+    """
+    if not isinstance(page, dict):
+        raise _page_error(index, "expected an object")
+
+    normalized = dict(page)
+
+    page_number = normalized.pop("page number", None)
+    page_number = normalized.get("page_number", page_number)
+    if page_number is None:
+        page_number = index + 1
+    elif isinstance(page_number, str) and page_number.strip().isdigit():
+        page_number = int(page_number.strip())
+    elif not isinstance(page_number, int) or isinstance(page_number, bool):
+        raise _page_error(index, f"invalid page number {page_number!r}")
+    normalized["page_number"] = page_number
+
+    page_type = normalized.get("type")
+    if isinstance(page_type, str):
+        # Other types are kept as they are and count as "unknown"
+        if page_type.strip().lower() in PAGE_TYPES:
+            normalized["type"] = page_type.strip().lower()
+    elif page_type is not None:
+        raise _page_error(index, "'type' must be text")
+
+    normalized["name"] = _text(normalized, "name", index)
+    normalized["section"] = _text(normalized, "section", index)
+
+    if "fractional_ads" in normalized:
+        ads = normalized["fractional_ads"]
+        if not isinstance(ads, list) or not all(isinstance(ad, dict) for ad in ads):
+            raise _page_error(index, "'fractional_ads' must be a list of objects")
+
+    return normalized
+
+
+def parse_layout_upload(
+    stream, max_bytes: int, max_pages: int
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Parse, validate and normalize an uploaded flatplan.
+
+    Args:
+        stream: A binary file-like object with the uploaded JSON
+        max_bytes: The maximum accepted file size in bytes
+        max_pages: The maximum accepted number of pages
+
+    Returns:
+        A tuple containing the pages in canonical form (or None if invalid) and an error message (or None if valid)
+    """
+    pages = []
+    try:
+        for index, page in enumerate(iter_json_array(stream, max_bytes)):
+            if index >= max_pages:
+                raise _page_error(index, f"too many pages (limit {max_pages})")
+            pages.append(normalize_page(page, index))
+    except LayoutImportError as e:
+        return None, str(e)
+
+    return canonical_pages(pages), None
+
+
+def parse_layout_file(
+    path: str, max_bytes: int, max_pages: int
+) -> Tuple[
+    str, Optional[List[Dict[str, Any]]], Optional[Dict[str, Any]], Optional[str]
+]:
+    """Parse a flatplan JSON file and compute its analytics.
+
+    Used by ``flask layouts import`` in worker processes, so everything
+    CPU-bound happens outside the process writing to MongoDB.
+
+    Args:
+        path: The path of the JSON file
+        max_bytes: The maximum accepted file size in bytes
+        max_pages: The maximum accepted number of pages
+
+    Returns:
+        A tuple containing the path, the normalized pages and their analytics (or None if invalid), and an error message (or None if valid)
+    """
+    try:
+        with open(path, "rb") as f:
+            pages, error = parse_layout_upload(f, max_bytes, max_pages)
+    except OSError as e:
+        return path, None, None, str(e)
+
+    if error:
+        return path, None, None, error
+    return path, pages, compute_analytics(pages), None
@@ -0,0 +1,705 @@
+"""Page-level patch operations for layouts.
+
+The layout editor sends a list of operations describing what changed since
+the revision it loaded instead of the whole page list. This module validates
+those operations and translates them into a single MongoDB update pipeline so
+they can be applied server-side in one atomic round-trip.
+
+Pages written by a patch are normalized first (see ``models.page``) and the
+pipeline renumbers the layout, so a layout stored in canonical form stays in
+canonical form.
+
+The pages a patch deletes, updates or moves are read first (see
+``touched_indexes``), so the same update keeps the stored analytics current
+(see ``patch_analytics_delta``) and the splices it makes can be recorded in
+the version history without reading the whole layout back (see
+``patch_changes``).
+
+Single-page writes from the page API read the page they write and its
+index (see ``page_write_projection``), then use the array update operators
+(``$push``, ``$set`` of the page's index, ``$pop``) when they leave the
+other pages' numbers unchanged, and only fall back to a renumbering
+pipeline when the order changes (see ``appended_page`` and ``replaced_page``).
+
+Supported operations (indexes refer to the page list *after* the previous
+operation has been applied):
+
+    {"op": "insert", "index": 3, "page": {...}}
+    {"op": "delete", "index": 3}
+    {"op": "move", "from": 3, "to": 10}
+    {"op": "update", "index": 3, "fields": {"name": "...", ...}}
+"""
+
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+
+from models.page import canonical_page, page_type_name
+from utils.analytics import (
+    analytics_delta,
+    analytics_delta_stage,
+    page_zero_expression,
+)
+
+PATCH_OPERATIONS = ("insert", "delete", "move", "update")
+
+
+def validate_patch_ops(
+    ops: Any, max_ops: int
+) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+    """Validate a list of patch operations received from a client.
+
+    Args:
+        ops: The decoded ``ops`` value from the request body
+        max_ops: The maximum number of operations accepted in one patch
+
+    Returns:
+        A tuple containing the cleaned operations (or None if invalid) and an error message (or None if valid)
+    """
+    if not isinstance(ops, list):
+        return None, "ops must be a list"
+    if len(ops) > max_ops:
+        return None, f"Too many operations in one patch (limit {max_ops})"
+
+    cleaned = []
+    for position, op in enumerate(ops):
+        if not isinstance(op, dict) or op.get("op") not in PATCH_OPERATIONS:
+            return None, f"Operation {position}: unknown operation"
+
+        kind = op["op"]
+        index_keys = ("from", "to") if kind == "move" else ("index",)
+        for key in index_keys:
+            value = op.get(key)
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                return (
+                    None,
+                    f"Operation {position}: '{key}' must be a non-negative integer",
+                )
+
+        if kind == "insert":
+            if not isinstance(op.get("page"), dict):
+                return None, f"Operation {position}: 'page' must be an object"
+            cleaned.append(
+                {"op": kind, "index": op["index"], "page": canonical_page(op["page"])}
+            )
+        elif kind == "update":
+            fields = op.get("fields")
+            if not isinstance(fields, dict) or not fields:
+                return (
+                    None,
+                    f"Operation {position}: 'fields' must be a non-empty object",
+                )
+            for key in fields:
+                if not isinstance(key, str) or key.startswith("$") or "." in key:
+                    return None, f"Operation {position}: invalid field name {key!r}"
+            cleaned.append(
+                {"op": kind, "index": op["index"], "fields": canonical_fields(fields)}
+            )
+        elif kind == "delete":
+            cleaned.append({"op": kind, "index": op["index"]})
+        else:
+            cleaned.append({"op": kind, "from": op["from"], "to": op["to"]})
+
+    return cleaned, None
+
+
+def canonical_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Normalize the fields of an update operation like a stored page.
+
+    Page numbers are dropped because the pipeline renumbers the layout.
+
+    Args:
+        fields: The validated fields of an update operation
+
+    Returns:
+        The fields to merge into the page
+    """
+    fields = {
+        key: value
+        for key, value in fields.items()
+        if key not in ("page_number", "page number")
+    }
+    if isinstance(fields.get("name"), str):
+        fields["name"] = fields["name"].strip()
+    if "type" in fields and page_type_name(fields["type"]) != "unknown":
+        fields["type"] = page_type_name(fields["type"])
+    return fields
+
+
+def required_layout_size(ops: List[Dict[str, Any]]) -> int:
+    """Calculate the minimum page count the stored layout needs for a patch to apply.
+
+    Args:
+        ops: Validated patch operations
+
+    Returns:
+        The smallest original layout length for which every index is in range
+    """
+    required = 0
+    size_delta = 0
+
+    for op in ops:
+        if op["op"] == "insert":
+            # Inserting at the end of the list is allowed
+            required = max(required, op["index"] - size_delta)
+            size_delta += 1
+        elif op["op"] == "move":
+            required = max(required, max(op["from"], op["to"]) + 1 - size_delta)
+        else:
+            required = max(required, op["index"] + 1 - size_delta)
+            if op["op"] == "delete":
+                size_delta -= 1
+
+    return required
+
+
+def _head(array: Any, index: int) -> Dict[str, Any]:
+    """Expression for the first ``index`` elements of an array."""
+    return {"$slice": [array, index]} if index else {"$literal": []}
+
+
+def _tail(array: Any, index: int) -> Dict[str, Any]:
+    """Expression for the elements of an array from ``index`` onwards."""
+    return {"$slice": [array, index, {"$max": [{"$size": array}, 1]}]}
+
+
+def _op_expression(op: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the aggregation expression producing the page list after one operation."""
+    pages = "$layout"
+
+    if op["op"] == "insert":
+        index = op["index"]
+        return {
+            "$concatArrays": [
+                _head(pages, index),
+                [{"$literal": op["page"]}],
+                _tail(pages, index),
+            ]
+        }
+
+    if op["op"] == "delete":
+        index = op["index"]
+        return {"$concatArrays": [_head(pages, index), _tail(pages, index + 1)]}
+
+    if op["op"] == "update":
+        index = op["index"]
+        return {
+            "$concatArrays": [
+                _head(pages, index),
+                [
+                    {
+                        "$mergeObjects": [
+                            {"$arrayElemAt": [pages, index]},
+                            {"$literal": op["fields"]},
+                        ]
+                    }
+                ],
+                _tail(pages, index + 1),
+            ]
+        }
+
+    # Move: take the page out, then insert it at its new position
+    source, target = op["from"], op["to"]
+    return {
+        "$let": {
+            "vars": {
+                "page": {"$arrayElemAt": [pages, source]},
+                "rest": {
+                    "$concatArrays": [_head(pages, source), _tail(pages, source + 1)]
+                },
+            },
+            "in": {
+                "$concatArrays": [
+                    _head("$$rest", target),
+                    ["$$page"],
+                    _tail("$$rest", target),
+                ]
+            },
+        }
+    }
+
+
+def insert_page_expression(
+    page: Dict[str, Any], index: Optional[int] = None
+) -> Dict[str, Any]:
+    """Expression for the page list with a page inserted.
+
+    Args:
+        page: The page to insert
+        index: The position to insert it at, or None to append it
+
+    Returns:
+        An aggregation expression producing the new page list
+    """
+    if index is None:
+        return {"$concatArrays": ["$layout", [{"$literal": page}]]}
+    return _op_expression({"op": "insert", "index": index, "page": page})
+
+
+def page_index_expression(page_id: str) -> Dict[str, Any]:
+    """Expression for the index of the first page with an ID (-1 if none has it)."""
+    return {
+        "$indexOfArray": [
+            {"$map": {"input": "$layout", "as": "p", "in": "$$p.id"}},
+            page_id,
+        ]
+    }
+
+
+def replace_page_expression(page_id: str, page: Dict[str, Any]) -> Dict[str, Any]:
+    """Expression for the page list with the first page with an ID replaced.
+
+    Args:
+        page_id: The ``id`` of the page to replace
+        page: The new page
+
+    Returns:
+        An aggregation expression producing the new page list
+    """
+    return {
+        "$let": {
+            "vars": {"index": page_index_expression(page_id)},
+            "in": {
+                "$map": {
+                    "input": {"$range": [0, {"$size": "$layout"}]},
+                    "as": "i",
+                    "in": {
+                        "$cond": [
+                            {"$eq": ["$$i", "$$index"]},
+                            {"$literal": page},
+                            {"$arrayElemAt": ["$layout", "$$i"]},
+                        ]
+                    },
+                }
+            },
+        }
+    }
+
+
+def page_count_expression() -> Dict[str, Any]:
+    """Expression for the number of pages in a layout."""
+    return {"$size": {"$ifNull": ["$layout", []]}}
+
+
+def page_write_projection(page_id: Optional[str] = None) -> Dict[str, Any]:
+    """Build the projection reading what a single-page write depends on.
+
+    Only the page written (or the last page) is returned, not the page list.
+
+    Args:
+        page_id: The ``id`` of the page to replace or remove, or None to
+            read what appending a page needs
+
+    Returns:
+        A projection returning ``revision``, ``schema_version`` and
+        ``page_count``, plus the first page with the ID as ``page`` and its
+        ``index``, or the ``last_page``
+    """
+    projection = {
+        "revision": 1,
+        "schema_version": 1,
+        "page_count": page_count_expression(),
+    }
+    if page_id is None:
+        projection["last_page"] = {"$arrayElemAt": ["$layout", -1]}
+    else:
+        index = page_index_expression(page_id)
+        projection["index"] = index
+        projection["page"] = {"$arrayElemAt": ["$layout", index]}
+    return projection
+
+
+def remove_page_expression(page_id: str) -> Dict[str, Any]:
+    """Expression for the page list without the first page with an ID.
+
+    Only one page is removed, matching the page the analytics delta is
+    computed from, even if an older client created two pages with one ID.
+
+    Args:
+        page_id: The ``id`` of the page to remove
+
+    Returns:
+        An aggregation expression producing the new page list
+    """
+    return {
+        "$let": {
+            "vars": {"index": page_index_expression(page_id)},
+            "in": {
+                "$map": {
+                    "input": {
+                        "$filter": {
+                            "input": {"$range": [0, {"$size": "$layout"}]},
+                            "as": "i",
+                            "cond": {"$ne": ["$$i", "$$index"]},
+                        }
+                    },
+                    "as": "i",
+                    "in": {"$arrayElemAt": ["$layout", "$$i"]},
+                }
+            },
+        }
+    }
+
+
+def renumber_pages_stage() -> Dict[str, Any]:
+    """Build a pipeline stage that renumbers pages like ``normalize_pages``.
+
+    Pages are numbered by position from 1; Page 0 keeps number 0 and is
+    skipped, so renumbering never changes which pages the analytics count.
+
+    Returns:
+        An update pipeline stage setting ``page_number`` from each page's position
+    """
+    indexes = {"$range": [0, {"$size": "$layout"}]}
+    is_zero = {"$arrayElemAt": ["$$zero", "$$i"]}
+    # Number of Page 0 entries before page i
+    zeros_before = {
+        "$size": {
+            "$filter": {"input": "$$zeros", "as": "z", "cond": {"$lt": ["$$z", "$$i"]}}
+        }
+    }
+    number = {"$subtract": [{"$add": ["$$i", 1]}, zeros_before]}
+
+    return {
+        "$set": {
+            "layout": {
+                "$let": {
+                    "vars": {
+                        "zero": {
+                            "$map": {
+                                "input": "$layout",
+                                "as": "page",
+                                "in": page_zero_expression("$$page"),
+                            }
+                        }
+                    },
+                    "in": {
+                        "$let": {
+                            "vars": {
+                                "zeros": {
+                                    "$filter": {
+                                        "input": indexes,
+                                        "as": "i",
+                                        "cond": is_zero,
+                                    }
+                                }
+                            },
+                            "in": {
+                                "$map": {
+                                    "input": indexes,
+                                    "as": "i",
+                                    "in": {
+                                        "$mergeObjects": [
+                                            {"$arrayElemAt": ["$layout", "$$i"]},
+                                            {
+                                                "page_number": {
+                                                    "$cond": [is_zero, 0, number]
+                                                }
+                                            },
+                                        ]
+                                    },
+                                }
+                            },
+                        }
+                    },
+                }
+            }
+        }
+    }
+
+
+def build_patch_pipeline(
+    ops: List[Dict[str, Any]],
+    modified_date: datetime,
+    analytics_delta: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """Translate patch operations into an update pipeline.
+
+    Args:
+        ops: Validated patch operations
+        modified_date: The timestamp to record as the layout's modified date
+        analytics_delta: The change to the stored analytics, from
+            ``patch_analytics_delta``
+
+    Returns:
+        A list of pipeline stages suitable for ``update_one``/``find_one_and_update``
+    """
+    pipeline = [{"$set": {"layout": _op_expression(op)}} for op in ops]
+    pipeline.append(renumber_pages_stage())
+    pipeline.append(
+        {
+            "$set": {
+                "modified_date": {"$literal": modified_date},
+                "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]},
+            }
+        }
+    )
+    if analytics_delta:
+        pipeline.append(analytics_delta_stage(analytics_delta))
+    return pipeline
+
+
+def apply_patch_ops(
+    pages: List[Dict[str, Any]], ops: List[Dict[str, Any]]
+) -> Optional[List[Dict[str, Any]]]:
+    """Apply patch operations to a page list in the app.
+
+    Used for layouts whose pages are not stored as an array the update
+    pipeline can work on (see ``utils.layout_clones``). Pages are not
+    renumbered.
+
+    Args:
+        pages: The current pages
+        ops: Validated patch operations
+
+    Returns:
+        The new page list, or None if an index is out of range
+    """
+    if len(pages) < required_layout_size(ops):
+        return None
+
+    pages = list(pages)
+    for op in ops:
+        if op["op"] == "insert":
+            pages.insert(op["index"], op["page"])
+        elif op["op"] == "delete":
+            del pages[op["index"]]
+        elif op["op"] == "update":
+            pages[op["index"]] = {**pages[op["index"]], **op["fields"]}
+        else:
+            pages.insert(op["to"], pages.pop(op["from"]))
+    return pages
+
+
+def _replay(
+    ops: List[Dict[str, Any]], stored: Dict[int, Any]
+) -> Tuple[int, List[Any], Dict[Any, Any]]:
+    """Replay patch operations on page positions rather than on the pages.
+
+    Only the first ``required_layout_size(ops)`` pages can be reached by the
+    operations; the pages after them keep their order. Stored pages are
+    identified by their index before the patch and inserted pages by
+    ``("insert", n)``, ``n`` being the operation's position in the patch.
+
+    Args:
+        ops: Validated patch operations
+        stored: The stored pages the operations touch, by index (see
+            ``touched_indexes``); may be empty when only positions are needed
+
+    Returns:
+        The number of pages reached, their identifiers in their new order
+        (deleted pages left out), and the content of every page the patch
+        deleted, inserted, updated or moved, as it is after the patch
+    """
+    size = required_layout_size(ops)
+    order: List[Any] = list(range(size))
+    touched: Dict[Any, Any] = {}
+
+    for number, op in enumerate(ops):
+        if op["op"] == "insert":
+            key = ("insert", number)
+            touched[key] = op["page"]
+            order.insert(op["index"], key)
+        elif op["op"] == "move":
+            key = order.pop(op["from"])
+            touched.setdefault(key, stored.get(key))
+            order.insert(op["to"], key)
+        else:
+            key = order[op["index"]]
+            page = touched.setdefault(key, stored.get(key))
+            if op["op"] == "delete":
+                del order[op["index"]]
+            else:
+                # Like $mergeObjects, which ignores a missing page
+                page = page if isinstance(page, dict) else {}
+                touched[key] = {**page, **op["fields"]}
+
+    return size, order, touched
+
+
+def touched_indexes(ops: List[Dict[str, Any]]) -> List[int]:
+    """List the stored pages a patch deletes, updates or moves.
+
+    Args:
+        ops: Validated patch operations
+
+    Returns:
+        The pages' indexes before the patch, in ascending order
+    """
+    _, _, touched = _replay(ops, {})
+    return sorted(key for key in touched if isinstance(key, int))
+
+
+def stored_pages_projection(indexes: List[int]) -> Dict[str, Any]:
+    """Build a projection reading the pages at some indexes as ``pages``.
+
+    Args:
+        indexes: The indexes from ``touched_indexes``
+
+    Returns:
+        A projection for ``find_one``, also returning ``revision``
+    """
+    return {
+        "revision": 1,
+        "pages": {
+            "$map": {
+                "input": {"$literal": indexes},
+                "as": "i",
+                "in": {"$arrayElemAt": ["$layout", "$$i"]},
+            }
+        },
+    }
+
+
+def patch_changes(
+    ops: List[Dict[str, Any]], stored: Dict[int, Any]
+) -> List[Dict[str, Any]]:
+    """Describe a patch as splices of the layout it applies to.
+
+    The splices have the form of ``models.page.diff_pages``, so they can be
+    recorded in the version history without comparing the pages. Pages the
+    patch did not touch keep their relative order, so everything between
+    two of them is removed and replaced with the touched pages now there.
+
+    Args:
+        ops: Validated patch operations
+        stored: The pages at ``touched_indexes(ops)``, by index, as stored
+
+    Returns:
+        The splices, in ascending ``at`` order, with the inserted pages in
+        canonical form
+    """
+    size, order, touched = _replay(ops, stored)
+
+    changes = []
+    at = 0
+    inserted: List[Dict[str, Any]] = []
+    for key in order + [size]:
+        if key in touched:
+            inserted.append(canonical_page(touched[key]))
+            continue
+        # An untouched page, or the end of the pages the patch reaches
+        if key > at or inserted:
+            changes.append({"at": at, "remove": key - at, "insert": inserted})
+        at = key + 1
+        inserted = []
+    return changes
+
+
+def patch_analytics_delta(
+    ops: List[Dict[str, Any]], stored: Dict[int, Any]
+) -> Dict[str, float]:
+    """Build the change a patch makes to the stored analytics.
+
+    Every page the patch touched is counted out as it was stored and back in
+    as it is after the patch, so moved pages cancel out.
+
+    Args:
+        ops: Validated patch operations
+        stored: The pages at ``touched_indexes(ops)``, by index, as stored
+
+    Returns:
+        The ``$inc`` document from ``analytics_delta``
+    """
+    _, order, touched = _replay(ops, stored)
+    removed = [stored.get(key) for key in touched if isinstance(key, int)]
+    added = [touched[key] for key in order if key in touched]
+    return analytics_delta(
+        removed=[page for page in removed if isinstance(page, dict)],
+        added=[page for page in added if isinstance(page, dict)],
+    )
+
+
+def page_write_update(
+    modified_date: datetime, analytics_delta: Optional[Dict[str, float]] = None
+) -> Dict[str, Any]:
+    """Build the update recording a single-page write made with array operators.
+
+    Args:
+        modified_date: The timestamp to record as the layout's modified date
+        analytics_delta: The change to the stored analytics, if any
+
+    Returns:
+        The ``$set``/``$inc`` update to add the array operator to
+    """
+    return {
+        "$set": {"modified_date": modified_date},
+        "$inc": {"revision": 1, **(analytics_delta or {})},
+    }
+
+
+def appended_page(
+    page: Dict[str, Any], last_page: Optional[Dict[str, Any]]
+) -> Optional[Dict[str, Any]]:
+    """Number a page appended to a canonical layout without renumbering it.
+
+    Args:
+        page: The page to append, from ``canonical_page``
+        last_page: The layout's current last page, or None if it is empty
+
+    Returns:
+        The page with its number, or None if the number depends on pages
+        before the last one (the last page is Page 0 or has no number)
+    """
+    if page.get("page_number") == 0:
+        return page
+    if last_page is None:
+        return {**page, "page_number": 1}
+
+    number = last_page.get("page_number")
+    if not isinstance(number, int) or isinstance(number, bool) or number < 1:
+        return None
+    return {**page, "page_number": number + 1}
+
+
+def replaced_page(
+    page: Dict[str, Any], old_page: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """Give a replacement page the number of the page it replaces.
+
+    Args:
+        page: The new page, from ``canonical_page``
+        old_page: The stored page it replaces
+
+    Returns:
+        The page with its number, or None if the replacement turns a page
+        into Page 0 or back, which renumbers the pages after it
+    """
+    if (page.get("page_number") == 0) != (old_page.get("page_number") == 0):
+        return None
+    if "page_number" not in old_page:
+        return None
+    return {**page, "page_number": old_page["page_number"]}
+
+
+def build_page_write_pipeline(
+    layout: Dict[str, Any],
+    modified_date: datetime,
+    analytics_delta: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """Build the update pipeline for a single-page write from the page API.
+
+    Used when the write changes the order of the pages; the pipeline
+    rewrites and renumbers the whole page list.
+
+    Args:
+        layout: An expression producing the new page list
+            (see ``insert_page_expression`` and friends)
+        modified_date: The timestamp to record as the layout's modified date
+        analytics_delta: The change to the stored analytics, if known
+
+    Returns:
+        A list of pipeline stages suitable for ``find_one_and_update``
+    """
+    pipeline = [
+        {"$set": {"layout": layout}},
+        renumber_pages_stage(),
+        {
+            "$set": {
+                "modified_date": {"$literal": modified_date},
+                "revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]},
+            }
+        },
+    ]
+    if analytics_delta:
+        pipeline.append(analytics_delta_stage(analytics_delta))
+    return pipeline
@@ -0,0 +1,459 @@
+"""Version history for layouts.
+
+Every write to a layout's pages records a version in ``layout_versions``.
+Versions are stored as page-level deltas against the previous version, with
+a full snapshot whenever the deltas since the last snapshot reach
+``LAYOUT_VERSION_SNAPSHOT_INTERVAL`` or would together hold more pages than
+a snapshot. Rebuilding any version therefore reads one snapshot and a
+bounded number of deltas, and storage grows with the amount of change rather
+than with the size of the layout.
+
+Pages are compared without their page numbers, which follow from their
+position (see ``models.page.normalize_pages``), so inserting a page does not
+make every page after it look changed. Rebuilt versions are renumbered.
+
+A delta is the list of splices (see ``models.page.diff_pages``) turning the
+previous version's pages into this version's. Writers that know what they
+changed (the page API and patch saves) pass those splices to
+``record_version``, which then stores them without reading the layout or
+comparing pages; only writers replacing every page are diffed.
+
+Versions older than ``LAYOUT_VERSION_RETENTION_DAYS`` are dropped (keeping at
+least ``LAYOUT_VERSION_KEEP`` per layout) whenever a snapshot is written, and
+for every layout by ``flask layouts compact-versions``.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from extensions import layout_versions, layouts
+from models.page import (
+    apply_delta,
+    canonical_pages,
+    diff_pages,
+    page_key,
+    unnumbered_page,
+)
+from utils.layout_clones import PAGES_PROJECTION, base_pages, is_based
+from utils.layout_helpers import canonical_layout_pages
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+# Fields returned when listing versions (everything but the pages)
+SUMMARY_PROJECTION = {
+    "revision": 1,
+    "created_at": 1,
+    "user_id": 1,
+    "kind": 1,
+    "page_count": 1,
+    "added": 1,
+    "removed": 1,
+}
+
+
+# Layouts this process has seen a history for, so ``ensure_baseline`` only
+# queries once per layout (a history is only deleted with its layout)
+HISTORY_CACHE_SIZE = 10000
+_with_history: "OrderedDict[ObjectId, None]" = OrderedDict()
+_with_history_lock = threading.Lock()
+
+
+def _has_history(layout_id: ObjectId) -> bool:
+    """Check whether this process has already seen a history for a layout."""
+    with _with_history_lock:
+        if layout_id not in _with_history:
+            return False
+        _with_history.move_to_end(layout_id)
+        return True
+
+
+def _remember_history(layout_id: ObjectId) -> None:
+    """Note that a layout has a history, forgetting the oldest entries if full."""
+    with _with_history_lock:
+        _with_history[layout_id] = None
+        _with_history.move_to_end(layout_id)
+        while len(_with_history) > HISTORY_CACHE_SIZE:
+            _with_history.popitem(last=False)
+
+
+def _aware(value: datetime) -> datetime:
+    """Treat a naive datetime read from MongoDB as UTC."""
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _version_pages(
+    layout_id: ObjectId, revision: int
+) -> Optional[List[Dict[str, Any]]]:
+    """Rebuild the stored (unnumbered) pages of a version.
+
+    Returns:
+        The pages, or None if the version is not in the history
+    """
+    snapshot = layout_versions.find_one(
+        {"layout_id": layout_id, "revision": {"$lte": revision}, "kind": SNAPSHOT},
+        {"revision": 1, "pages": 1, "base": 1, "changes": 1},
+        sort=[("revision", DESCENDING)],
+    )
+    if not snapshot:
+        return None
+
+    if is_based(snapshot):
+        pages = apply_delta(base_pages(snapshot["base"]), snapshot["changes"])
+    else:
+        pages = snapshot["pages"]
+    found = snapshot["revision"]
+    if found == revision:
+        return pages
+
+    deltas = layout_versions.find(
+        {"layout_id": layout_id, "revision": {"$gt": found, "$lte": revision}},
+        {"revision": 1, "changes": 1},
+        sort=[("revision", ASCENDING)],
+    )
+    for delta in deltas:
+        pages = apply_delta(pages, delta["changes"])
+        found = delta["revision"]
+
+    return pages if found == revision else None
+
+
+def load_version(layout_id: ObjectId, revision: int) -> Optional[List[Dict[str, Any]]]:
+    """Rebuild the pages of a layout as they were at a revision.
+
+    Args:
+        layout_id: The ID of the layout
+        revision: The revision to rebuild
+
+    Returns:
+        The pages in canonical form, or None if the revision is not in the history
+    """
+    pages = _version_pages(layout_id, revision)
+    return None if pages is None else canonical_pages(pages)
+
+
+def _insert_version(version: Dict[str, Any]) -> bool:
+    """Store a version; False if another writer recorded that revision first."""
+    try:
+        layout_versions.insert_one(version)
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+def ensure_baseline(layout_id: ObjectId, account_id: ObjectId) -> None:
+    """Snapshot a layout that has no history yet, before it is overwritten.
+
+    Layouts created before version history (or whose history has been
+    deleted) would otherwise lose the state they had before their next
+    write. Each process only looks a layout's history up once.
+
+    Args:
+        layout_id: The ID of the layout about to be written
+        account_id: The ID of the account that owns it
+    """
+    if _has_history(layout_id):
+        return
+    if layout_versions.find_one({"layout_id": layout_id}, {"_id": 1}):
+        _remember_history(layout_id)
+        return
+
+    layout_doc = layouts.find_one(
+        {"_id": layout_id, "account_id": account_id},
+        {**PAGES_PROJECTION, "revision": 1},
+    )
+    if not layout_doc:
+        return
+
+    version = {
+        "layout_id": layout_id,
+        "revision": layout_doc.get("revision", 0),
+        "created_at": datetime.now(timezone.utc),
+        "user_id": None,
+        "kind": SNAPSHOT,
+        "chain": 0,
+        "chain_size": 0,
+    }
+    if is_based(layout_doc):
+        # A clone's first snapshot shares its base rather than copying it
+        version["base"] = layout_doc["base"]
+        version["changes"] = layout_doc.get("overrides") or []
+        version["page_count"] = len(canonical_layout_pages(layout_doc))
+    else:
+        pages = [unnumbered_page(page) for page in canonical_layout_pages(layout_doc)]
+        version["pages"] = pages
+        version["page_count"] = len(pages)
+    _insert_version(version)
+    _remember_history(layout_id)
+
+
+def record_version(
+    layout_id: ObjectId,
+    revision: int,
+    pages: Optional[List[Dict[str, Any]]] = None,
+    user_id: Optional[str] = None,
+    changes: Optional[List[Dict[str, Any]]] = None,
+) -> Optional[Dict[str, Any]]:
+    """Record the version produced by a write.
+
+    A writer that knows what it changed passes the splices it applied to
+    the previous revision as ``changes``; they are stored as they are if
+    that revision is the latest recorded one. Otherwise the delta is
+    computed against the latest recorded version, so a write that was not
+    recorded (e.g. by ``flask layouts import``) only makes the next delta
+    larger.
+
+    Args:
+        layout_id: The ID of the layout that was written
+        revision: The revision the write produced
+        pages: The pages written, or None to read them from the layout
+            (for writes applied server-side by an update pipeline)
+        user_id: The ID of the user who made the change
+        changes: The splices the write applied to revision ``revision - 1``,
+            with the inserted pages in canonical form, if known
+
+    Returns:
+        The stored version, or None if the revision was already recorded or
+        has been overwritten since. Unless it is the layout's first version,
+        it has the ``changes`` from ``base_revision`` even if it was stored
+        as a snapshot.
+    """
+    latest = layout_versions.find_one(
+        {"layout_id": layout_id},
+        {"revision": 1, "chain": 1, "chain_size": 1, "page_count": 1},
+        sort=[("revision", DESCENDING)],
+    )
+    if latest and latest["revision"] >= revision:
+        return None
+
+    version = {
+        "layout_id": layout_id,
+        "revision": revision,
+        "created_at": datetime.now(timezone.utc),
+        "user_id": ObjectId(user_id) if user_id else None,
+    }
+
+    if changes is not None and latest and latest["revision"] == revision - 1:
+        changes = [
+            {**change, "insert": [unnumbered_page(page) for page in change["insert"]]}
+            for change in changes
+        ]
+        page_count = latest["page_count"] + sum(
+            len(change["insert"]) - change["remove"] for change in changes
+        )
+    else:
+        if pages is None:
+            layout_doc = layouts.find_one(
+                {"_id": layout_id, "revision": revision}, PAGES_PROJECTION
+            )
+            if not layout_doc:
+                # A later write has replaced this revision and records its own
+                return None
+            pages = canonical_layout_pages(layout_doc)
+        pages = [unnumbered_page(page) for page in pages]
+        page_count = len(pages)
+
+        base = _version_pages(layout_id, latest["revision"]) if latest else None
+        changes = None if base is None else diff_pages(base, pages)
+    version["page_count"] = page_count
+
+    if changes is not None:
+        inserted = sum(len(change["insert"]) for change in changes)
+        version["added"] = inserted
+        version["removed"] = sum(change["remove"] for change in changes)
+
+        chain = latest.get("chain", 0) + 1
+        chain_size = latest.get("chain_size", 0) + inserted
+        if (
+            chain <= current_app.config["LAYOUT_VERSION_SNAPSHOT_INTERVAL"]
+            and chain_size < page_count
+        ):
+            version.update(
+                kind=DELTA,
+                base_revision=latest["revision"],
+                changes=changes,
+                chain=chain,
+                chain_size=chain_size,
+            )
+
+    if "kind" not in version:
+        if pages is None:
+            # Rebuilt from the history rather than read from the layout,
+            # which may have been written again since
+            pages = _version_pages(layout_id, latest["revision"])
+            if pages is None:
+                return None
+            pages = apply_delta(pages, changes)
+        version.update(kind=SNAPSHOT, pages=pages, chain=0, chain_size=0)
+
+    if not _insert_version(version):
+        return None
+    _remember_history(layout_id)
+
+    if version["kind"] == SNAPSHOT:
+        compact_versions(layout_id)
+        if changes is not None:
+            version.update(base_revision=latest["revision"], changes=changes)
+    return version
+
+
+def list_versions(
+    layout_id: ObjectId, limit: int, before: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """List a layout's versions, newest first, without their pages.
+
+    Args:
+        layout_id: The ID of the layout
+        limit: The maximum number of versions to return
+        before: Only return versions older than this revision
+
+    Returns:
+        The version summaries
+    """
+    query: Dict[str, Any] = {"layout_id": layout_id}
+    if before is not None:
+        query["revision"] = {"$lt": before}
+    return list(
+        layout_versions.find(query, SUMMARY_PROJECTION)
+        .sort("revision", DESCENDING)
+        .limit(limit)
+    )
+
+
+def format_version(version: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a version summary to JSON-friendly values.
+
+    Args:
+        version: A version document projected with ``SUMMARY_PROJECTION``
+
+    Returns:
+        The summary with string IDs and an ISO 8601 creation time
+    """
+    return {
+        "revision": version["revision"],
+        "created_at": _aware(version["created_at"]).isoformat(),
+        "user_id": str(version["user_id"]) if version.get("user_id") else None,
+        "kind": version["kind"],
+        "page_count": version["page_count"],
+        "added": version.get("added"),
+        "removed": version.get("removed"),
+    }
+
+
+def previous_revision(layout_id: ObjectId, revision: int) -> Optional[int]:
+    """Find the version recorded before a revision.
+
+    Returns:
+        The previous revision number, or None if it is the oldest version
+    """
+    version = layout_versions.find_one(
+        {"layout_id": layout_id, "revision": {"$lt": revision}},
+        {"revision": 1},
+        sort=[("revision", DESCENDING)],
+    )
+    return version["revision"] if version else None
+
+
+def diff_versions(
+    layout_id: ObjectId, from_revision: int, to_revision: int
+) -> Optional[List[Dict[str, Any]]]:
+    """Describe the page changes between two versions.
+
+    Args:
+        layout_id: The ID of the layout
+        from_revision: The older revision
+        to_revision: The newer revision
+
+    Returns:
+        The changes, each with the pages removed from and inserted into the
+        older version at ``at``, or None if either revision is not in the history
+    """
+    old = load_version(layout_id, from_revision)
+    new = load_version(layout_id, to_revision)
+    if old is None or new is None:
+        return None
+
+    return [
+        {
+            "at": change["at"],
+            "removed": old[change["at"] : change["at"] + change["remove"]],
+            "inserted": change["insert"],
+        }
+        for change in diff_pages(
+            old, new, key=lambda page: page_key(unnumbered_page(page))
+        )
+    ]
+
+
+def compact_versions(layout_id: ObjectId, now: Optional[datetime] = None) -> int:
+    """Drop a layout's versions that are past the retention settings.
+
+    The oldest version kept is turned into a snapshot first, so every
+    remaining version can still be rebuilt.
+
+    Args:
+        layout_id: The ID of the layout
+        now: The current time (defaults to now)
+
+    Returns:
+        The number of versions deleted
+    """
+    config = current_app.config
+    keep = max(config["LAYOUT_VERSION_KEEP"], 1)
+    cutoff = (now or datetime.now(timezone.utc)) - timedelta(
+        days=config["LAYOUT_VERSION_RETENTION_DAYS"]
+    )
+
+    versions = list(
+        layout_versions.find(
+            {"layout_id": layout_id},
+            {"revision": 1, "created_at": 1, "kind": 1},
+            sort=[("revision", DESCENDING)],
+        )
+    )
+    expired = next(
+        (
+            index
+            for index in range(keep, len(versions))
+            if _aware(versions[index]["created_at"]) < cutoff
+        ),
+        None,
+    )
+    if expired is None:
+        return 0
+
+    oldest_kept = versions[expired - 1]
+    if oldest_kept["kind"] != SNAPSHOT:
+        pages = _version_pages(layout_id, oldest_kept["revision"])
+        if pages is None:
+            return 0
+        layout_versions.update_one(
+            {"_id": oldest_kept["_id"]},
+            {
+                "$set": {"kind": SNAPSHOT, "pages": pages, "chain": 0, "chain_size": 0},
+                "$unset": {"changes": "", "base_revision": ""},
+            },
+        )
+
+    result = layout_versions.delete_many(
+        {"layout_id": layout_id, "revision": {"$lt": oldest_kept["revision"]}}
+    )
+    return result.deleted_count
+
+
+def delete_versions(layout_id: ObjectId) -> None:
+    """Delete the history of a deleted layout.
+
+    Args:
+        layout_id: The ID of the layout
+    """
+    layout_versions.delete_many({"layout_id": layout_id})
+    with _with_history_lock:
+        _with_history.pop(layout_id, None)
@@ -0,0 +1,350 @@
+"""Live change events for the editors of a layout.
+
+Every write to a layout publishes an event, and the layout editor listens
+for the events of its layout over server-sent events
+(``GET /api/layout/<id>/events``, see ``routes.api``). Page writes carry
+the splices turning the previous version's pages into the new ones (the
+same ``changes`` as ``utils.layout_versions`` records), so an editor that is
+up to date applies them to its page grid without reloading.
+
+Events are fanned out to the subscribers in each process. Two backends are
+available, selected with ``LIVE_UPDATES_BACKEND``:
+
+- ``memory``: events only reach editors connected to the process that made
+  the write (the development server, or a single threaded worker)
+- ``mongodb``: events are written to the capped ``layout_events`` collection
+  and a thread in each worker process tails it, so every worker on the host
+  sees every event. Tailable cursors do not need a replica set.
+
+``none`` disables live updates; editors then only see changes on reload.
+
+Each stream occupies a worker thread for as long as it is open, so a process
+accepts at most ``LIVE_UPDATES_MAX_STREAMS`` streams and refuses the rest
+(the editor retries later), leaving the other threads for normal requests.
+
+Event types:
+
+- ``pages``: ``revision``, ``base_revision`` (the version the changes apply
+  to), ``changes`` and ``page_count``
+- ``details``: ``revision`` and the layout's new publication and issue names
+  and publication date
+- ``changed``: ``revision`` only, for writes whose changes are not known;
+  editors behind that revision reload
+- ``deleted``: the layout was deleted
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Any, Optional
+
+from bson import ObjectId
+from flask import Flask, current_app
+from pymongo import CursorType, DESCENDING
+from pymongo.errors import CollectionInvalid, PyMongoError
+
+from extensions import db
+
+PAGES = "pages"
+DETAILS = "details"
+CHANGED = "changed"
+DELETED = "deleted"
+
+# Capped collection used by the mongodb backend
+EVENTS_COLLECTION = "layout_events"
+
+# Milliseconds browsers wait before reconnecting to a closed stream
+RETRY_MILLISECONDS = 3000
+
+
+class Subscription:
+    """Events for one connected editor, buffered until its stream sends them.
+
+    A subscriber that falls more than ``queue_size`` events behind is marked
+    as ``overflowed`` and stops receiving events; its stream then tells the
+    editor to reload instead.
+    """
+
+    def __init__(self, layout_id: str, queue_size: int):
+        self.layout_id = layout_id
+        self.overflowed = False
+        self._events: "queue.Queue[Dict[str, Any]]" = queue.Queue(queue_size)
+
+    def put(self, event: Dict[str, Any]) -> None:
+        """Queue an event without blocking the publisher."""
+        if self.overflowed:
+            return
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait for the next event.
+
+        Args:
+            timeout: Seconds to wait
+
+        Returns:
+            The event, or None if none arrived in time
+        """
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LayoutEvents:
+    """Front end for publishing and subscribing to layout events."""
+
+    def __init__(self):
+        self.backend = "none"
+        self.queue_size = 100
+        self.capped_bytes = 16 * 1024 * 1024
+        self.max_streams = 0
+        self.published = 0
+        self.rejected = 0
+        self._subscribers: Dict[str, List[Subscription]] = {}
+        self._lock = threading.Lock()
+        self._app: Optional[Flask] = None
+        self._tailer: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._collection_ready = False
+
+    def configure(
+        self, backend: str, queue_size: int, capped_bytes: int, max_streams: int = 0
+    ) -> None:
+        """Select the backend.
+
+        Args:
+            backend: "memory", "mongodb" or "none"
+            queue_size: Events buffered per subscriber before it must reload
+            capped_bytes: The size of the capped collection used by "mongodb"
+            max_streams: Subscriptions accepted at once by this process
+                (0 for no limit)
+        """
+        if backend not in ("memory", "mongodb", "none"):
+            raise ValueError(f"Unknown live updates backend: {backend}")
+        self.backend = backend
+        self.queue_size = queue_size
+        self.capped_bytes = capped_bytes
+        self.max_streams = max_streams
+
+    @property
+    def enabled(self) -> bool:
+        """Whether events are published at all."""
+        return self.backend != "none"
+
+    def subscribe(self, app: Flask, layout_id: Any) -> Optional[Subscription]:
+        """Start receiving a layout's events.
+
+        Args:
+            app: The application, used by the mongodb backend's tailing thread
+            layout_id: The layout's ID
+
+        Returns:
+            The subscription; pass it to ``unsubscribe`` when the stream ends.
+            None if this process already has ``max_streams`` subscriptions.
+        """
+        subscription = Subscription(str(layout_id), self.queue_size)
+        with self._lock:
+            if self.max_streams and self._count() >= self.max_streams:
+                self.rejected += 1
+                return None
+            self._subscribers.setdefault(subscription.layout_id, []).append(
+                subscription
+            )
+        if self.backend == "mongodb":
+            self._start_tailer(app)
+        return subscription
+
+    def _count(self) -> int:
+        """Count this process's subscriptions (called with the lock held)."""
+        return sum(len(group) for group in self._subscribers.values())
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """Stop delivering events to a subscription."""
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.layout_id, [])
+            if subscription in subscribers:
+                subscribers.remove(subscription)
+            if not subscribers:
+                self._subscribers.pop(subscription.layout_id, None)
+
+    def publish(self, layout_id: Any, event: Dict[str, Any]) -> None:
+        """Send an event to every editor of a layout.
+
+        Called after the write is stored, so a failure is logged rather than
+        raised; editors that miss an event reload when they see the next one.
+
+        Args:
+            layout_id: The layout's ID
+            event: The event, with a ``type`` and usually a ``revision``
+        """
+        if self.backend == "memory":
+            self._deliver(str(layout_id), event)
+        elif self.backend == "mongodb":
+            try:
+                self._ensure_collection()
+                db[EVENTS_COLLECTION].insert_one(
+                    {"layout_id": str(layout_id), "event": event}
+                )
+            except PyMongoError as e:
+                current_app.logger.warning(f"Could not publish layout event: {e}")
+                return
+        else:
+            return
+        self.published += 1
+
+    def _deliver(self, layout_id: str, event: Dict[str, Any]) -> None:
+        """Hand an event to this process's subscribers of a layout."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(layout_id, ()))
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def _ensure_collection(self) -> None:
+        """Create the capped events collection if it does not exist yet."""
+        if self._collection_ready:
+            return
+        try:
+            db.create_collection(EVENTS_COLLECTION, capped=True, size=self.capped_bytes)
+        except CollectionInvalid:
+            pass
+        self._collection_ready = True
+
+    def _start_tailer(self, app: Flask) -> None:
+        """Start the thread tailing the events collection in this process."""
+        with self._lock:
+            if (
+                self._tailer is not None
+                and self._tailer.is_alive()
+                and self._pid == os.getpid()
+            ):
+                return
+            self._app = app
+            self._pid = os.getpid()
+            self._tailer = threading.Thread(
+                target=self._tail, name="layout-events", daemon=True
+            )
+            self._tailer.start()
+
+    def _tail(self) -> None:
+        """Deliver the events in the capped collection, for as long as the process runs.
+
+        The collection is read in insertion (``$natural``) order. The IDs of
+        events published by different processes are not in that order, so a
+        cursor that has to be reopened reads the collection again and skips
+        to the last event it delivered instead of querying for later IDs. If
+        that event has been overwritten in the meantime, the events after
+        it are lost and this process's subscribers are told to reload.
+        """
+        app = self._app
+        started = False
+        last_id: Optional[ObjectId] = None
+        while True:
+            try:
+                self._ensure_collection()
+                collection = db[EVENTS_COLLECTION]
+                if not started:
+                    # Only events published from now on are delivered
+                    latest = collection.find_one(
+                        {}, {"_id": 1}, sort=[("$natural", DESCENDING)]
+                    )
+                    last_id = latest["_id"] if latest else None
+                    started = True
+                cursor = collection.find(
+                    {},
+                    cursor_type=CursorType.TAILABLE_AWAIT,
+                    max_await_time_ms=5000,
+                )
+                skipping = last_id is not None
+                while cursor.alive:
+                    for document in cursor:
+                        if skipping:
+                            skipping = document["_id"] != last_id
+                            continue
+                        last_id = document["_id"]
+                        self._deliver(document["layout_id"], document["event"])
+                    if skipping:
+                        # Caught up without finding the last event delivered
+                        self._lose_events()
+                        skipping = False
+            except PyMongoError as e:
+                app.logger.warning(f"Layout events tail error: {e}")
+            # A tailable cursor dies when it reaches the end of an empty or
+            # rolled-over collection; start a new one shortly
+            time.sleep(1)
+
+    def _lose_events(self) -> None:
+        """Make this process's subscribers reload after events were missed."""
+        with self._lock:
+            subscribers = [
+                subscription
+                for group in self._subscribers.values()
+                for subscription in group
+            ]
+        for subscription in subscribers:
+            subscription.overflowed = True
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the connected editors and the events published by this process.
+
+        Returns:
+            A dictionary of live update statistics
+        """
+        with self._lock:
+            subscribers = self._count()
+            layouts = len(self._subscribers)
+        return {
+            "backend": self.backend,
+            "subscribers": subscribers,
+            "max_streams": self.max_streams,
+            "layouts": layouts,
+            "published": self.published,
+            "rejected": self.rejected,
+        }
+
+
+def pages_event(revision: int, version: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the event for a write to a layout's pages.
+
+    Args:
+        revision: The revision the write produced
+        version: The version returned by ``record_version``, or None if the
+            write was not recorded
+
+    Returns:
+        A ``pages`` event, or a ``changed`` event if the changes are not known
+    """
+    if not version or "changes" not in version:
+        return {"type": CHANGED, "revision": revision}
+    return {
+        "type": PAGES,
+        "revision": revision,
+        "base_revision": version["base_revision"],
+        "changes": version["changes"],
+        "page_count": version["page_count"],
+    }
+
+
+def format_event(event: Dict[str, Any]) -> str:
+    """Encode an event as a server-sent event, with its revision as the ID.
+
+    Args:
+        event: The event
+
+    Returns:
+        The ``text/event-stream`` chunk
+    """
+    lines = [f"event: {event['type']}"]
+    if event.get("revision") is not None:
+        lines.append(f"id: {event['revision']}")
+    lines.append(f"data: {json.dumps(event, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+# Configured by create_app; used by the layout writers and the events stream
+layout_events = LayoutEvents()
@@ -0,0 +1,293 @@
+"""Persistent queue for outbound email.
+
+Requests never talk to the SMTP server. ``enqueue_mail`` stores the message
+in the ``mail_queue`` collection and wakes a background worker thread, which
+claims due messages in batches and sends each batch over a single SMTP
+connection. Failed deliveries are retried with exponential backoff until
+``MAIL_QUEUE_MAX_ATTEMPTS`` is reached, and every message records its
+status (``pending``, ``sending``, ``sent`` or ``failed``), attempts and last
+error. Because the queue lives in MongoDB, messages survive restarts and any
+worker process can deliver them; ``flask mail drain`` delivers the queue
+from the command line.
+
+Bodies carry password reset links, so a message's body is removed as soon
+as it is sent or given up on, and finished messages are deleted after
+``MAIL_RETENTION_SECONDS`` by a TTL index on ``finished_at`` (see
+``utils.indexes``).
+"""
+
+import os
+import smtplib
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional
+
+from bson import ObjectId
+from flask import Flask, current_app
+from flask_mail import BadHeaderError, Message
+from pymongo import ReturnDocument
+
+from extensions import mail, mail_queue
+from utils.metrics import SMTP_SEND_DURATION, metrics
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+STATUSES = (PENDING, SENDING, SENT, FAILED)
+
+# Errors that reject a single message without affecting the connection
+MESSAGE_ERRORS = (
+    smtplib.SMTPRecipientsRefused,
+    smtplib.SMTPSenderRefused,
+    smtplib.SMTPDataError,
+    BadHeaderError,
+)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue_mail(subject: str, recipients: List[str], body: str) -> ObjectId:
+    """Queue an email for background delivery.
+
+    Args:
+        subject: The message subject
+        recipients: The recipients' email addresses
+        body: The plain-text body
+
+    Returns:
+        The ObjectId of the queued message
+    """
+    now = _now()
+    message_id = mail_queue.insert_one(
+        {
+            "subject": subject,
+            "recipients": list(recipients),
+            "body": body,
+            "status": PENDING,
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+        }
+    ).inserted_id
+
+    if current_app.config["MAIL_QUEUE_WORKER"]:
+        mail_worker.start(current_app._get_current_object())
+        mail_worker.wake()
+    return message_id
+
+
+def claim_batch(limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+    """Claim up to ``limit`` messages that are due for delivery.
+
+    Messages left in ``sending`` by a worker that died are claimed again once
+    their lease has expired.
+
+    Args:
+        limit: The maximum number of messages to claim
+        lease_seconds: How long a claim is held before it may be taken over
+
+    Returns:
+        The claimed message documents
+    """
+    now = _now()
+    claim_id = uuid.uuid4().hex
+    claimed = []
+    while len(claimed) < limit:
+        message = mail_queue.find_one_and_update(
+            {
+                "$or": [
+                    {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                    {
+                        "status": SENDING,
+                        "locked_at": {"$lte": now - timedelta(seconds=lease_seconds)},
+                    },
+                ]
+            },
+            {
+                "$set": {"status": SENDING, "locked_at": now, "claim": claim_id},
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if message is None:
+            break
+        claimed.append(message)
+    return claimed
+
+
+def _record_failure(message: Dict[str, Any], error: Exception) -> None:
+    """Schedule a retry with exponential backoff, or give up on the message."""
+    config = current_app.config
+    attempts = message.get("attempts", 1)
+    update: Dict[str, Any] = {"last_error": str(error) or type(error).__name__}
+
+    # 5xx replies are permanent, so retrying would not help
+    permanent = getattr(error, "smtp_code", 0) >= 500
+
+    unset = {"locked_at": "", "claim": ""}
+
+    if permanent or attempts >= config["MAIL_QUEUE_MAX_ATTEMPTS"]:
+        update["status"] = FAILED
+        update["finished_at"] = _now()
+        unset["body"] = ""
+        current_app.logger.error(
+            f"Giving up on email {message['_id']} after {attempts} attempts: {error}"
+        )
+    else:
+        delay = config["MAIL_QUEUE_RETRY_DELAY"] * 2 ** (attempts - 1)
+        update["status"] = PENDING
+        update["next_attempt_at"] = _now() + timedelta(seconds=delay)
+
+    mail_queue.update_one(
+        {"_id": message["_id"], "claim": message["claim"]},
+        {"$set": update, "$unset": unset},
+    )
+
+
+def _observe_send(started: float, outcome: str) -> None:
+    """Record how long an SMTP send took."""
+    metrics.observe(SMTP_SEND_DURATION, (outcome,), time.perf_counter() - started)
+
+
+def deliver_batch() -> int:
+    """Claim a batch of due messages and send them over one SMTP connection.
+
+    Must be called inside an application context.
+
+    Returns:
+        The number of messages claimed (sent or rescheduled)
+    """
+    config = current_app.config
+    messages = claim_batch(
+        config["MAIL_QUEUE_BATCH_SIZE"], config["MAIL_QUEUE_LEASE_SECONDS"]
+    )
+    if not messages:
+        return 0
+
+    remaining = list(messages)
+    try:
+        with mail.connect() as connection:
+            while remaining:
+                message = remaining.pop(0)
+                started = time.perf_counter()
+                try:
+                    connection.send(
+                        Message(
+                            message["subject"],
+                            recipients=message["recipients"],
+                            body=message["body"],
+                        )
+                    )
+                except MESSAGE_ERRORS as e:
+                    # The server rejected this message; the connection is fine
+                    _observe_send(started, "rejected")
+                    _record_failure(message, e)
+                    continue
+                except Exception:
+                    _observe_send(started, "failed")
+                    remaining.insert(0, message)
+                    raise
+                _observe_send(started, "sent")
+
+                sent_at = _now()
+                mail_queue.update_one(
+                    {"_id": message["_id"], "claim": message["claim"]},
+                    {
+                        "$set": {
+                            "status": SENT,
+                            "sent_at": sent_at,
+                            "finished_at": sent_at,
+                        },
+                        "$unset": {
+                            "locked_at": "",
+                            "claim": "",
+                            "last_error": "",
+                            "body": "",
+                        },
+                    },
+                )
+    except Exception as e:
+        # Connecting failed or the connection dropped: retry everything unsent
+        for message in remaining:
+            _record_failure(message, e)
+
+    return len(messages)
+
+
+def queue_stats() -> Dict[str, int]:
+    """Count queued messages by status.
+
+    Returns:
+        A dictionary mapping each status to its number of messages
+    """
+    counts = {status: 0 for status in STATUSES}
+    for group in mail_queue.aggregate(
+        [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    ):
+        counts[group["_id"]] = group["count"]
+    return counts
+
+
+class MailWorker:
+    """A background thread that delivers the mail queue.
+
+    The thread is started on first use in each process (and again after a
+    fork, since threads do not survive one), sleeps until it is woken by
+    ``enqueue_mail`` or the poll interval elapses, and drains every due
+    message before sleeping again.
+    """
+
+    def __init__(self):
+        self._app: Optional[Flask] = None
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self, app: Flask) -> None:
+        """Start the worker for this process if it is not running.
+
+        Args:
+            app: The application whose mail settings are used
+        """
+        with self._lock:
+            if (
+                self._thread is not None
+                and self._thread.is_alive()
+                and self._pid == os.getpid()
+            ):
+                return
+            self._app = app
+            self._pid = os.getpid()
+            self._wake = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, name="mail-queue", daemon=True
+            )
+            self._thread.start()
+
+    def wake(self) -> None:
+        """Ask the worker to look for due messages now."""
+        self._wake.set()
+
+    def _run(self) -> None:
+        app = self._app
+        while True:
+            with app.app_context():
+                try:
+                    while deliver_batch():
+                        pass
+                except Exception as e:
+                    app.logger.error(f"Mail queue worker error: {e}")
+            self._wake.wait(app.config["MAIL_QUEUE_POLL_INTERVAL"])
+            self._wake.clear()
+
+
+# Started in each process by enqueue_mail and the app's before_request hook
+mail_worker = MailWorker()
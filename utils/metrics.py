@@ -0,0 +1,504 @@
+"""Request, MongoDB and mail metrics in the Prometheus text format.
+
+``GET /metrics`` (see ``routes.main``) reports:
+
+- ``flatplan_http_requests_total``, ``flatplan_http_request_duration_seconds``
+  and ``flatplan_http_response_size_bytes`` per endpoint (``layout.view_layout``,
+  ``api.add_page``, ...), recorded by request hooks. The duration of a
+  streamed response is the time until it starts streaming, and only
+  responses of known length have a size.
+- ``flatplan_mongodb_commands_total`` and
+  ``flatplan_mongodb_command_duration_seconds`` per collection and command,
+  from a pymongo command listener.
+- ``flatplan_smtp_send_duration_seconds`` per outcome, from the mail queue.
+- The hit and miss counters of the user and fragment caches, the MongoDB
+  connection pool and the live update subscribers, read when the metrics
+  are collected.
+
+Recording a value takes a lock and a dictionary update, so the metrics stay
+on in production. Metrics are kept per process. When several workers serve
+the app, set ``METRICS_DIR`` to a directory on the host: each worker writes
+its values there every ``METRICS_FLUSH_SECONDS``, and ``/metrics`` adds up
+every worker's. The values of workers that have exited are folded into an
+archive file, so totals do not drop when a worker is replaced.
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from typing import Dict, List, Any, Optional, Sequence, Tuple
+
+from flask import Flask, g, request
+from pymongo.monitoring import CommandListener
+
+from utils.fragment_cache import fragment_cache
+from utils.live_updates import layout_events
+from utils.mongo_client import mongo
+from utils.user_cache import user_cache
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+ARCHIVE_FILE = "archive.json"
+LOCK_FILE = ".lock"
+
+
+class Metric:
+    """A named family of values, one per combination of label values."""
+
+    def __init__(
+        self,
+        kind: str,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = (),
+    ):
+        self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple[str, ...], Any] = {}
+
+    def inc(self, labels: Tuple[str, ...], amount: float = 1) -> None:
+        """Add to a counter (called with the registry's lock held)."""
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        """Count a value in a histogram (called with the registry's lock held).
+
+        A histogram's value is its per-bucket counts (the last one for values
+        above every bucket), then the sum and the number of observations.
+        """
+        counts = self.values.get(labels)
+        if counts is None:
+            counts = self.values[labels] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+
+class Metrics:
+    """The registry of a process's metrics."""
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = ""
+        self.flush_seconds = 10.0
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed = 0.0
+        self._pid: Optional[int] = None
+        self._token = ""
+
+    def configure(self, enabled: bool, directory: str, flush_seconds: float) -> None:
+        """Turn collection on or off and choose where workers share values.
+
+        Args:
+            enabled: Whether values are recorded
+            directory: The directory shared by the workers on the host, or
+                "" to report this process only
+            flush_seconds: How often a worker writes its values there
+        """
+        self.enabled = enabled
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        if enabled and directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _define(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str]):
+        """Define a counter."""
+        return self._define(Metric(COUNTER, name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float],
+    ):
+        """Define a histogram."""
+        return self._define(Metric(HISTOGRAM, name, documentation, labelnames, buckets))
+
+    def inc(self, metric: Metric, labels: Tuple[str, ...], amount: float = 1) -> None:
+        """Add to a counter."""
+        if self.enabled:
+            with self._lock:
+                metric.inc(labels, amount)
+
+    def observe(self, metric: Metric, labels: Tuple[str, ...], value: float) -> None:
+        """Count a value in a histogram."""
+        if self.enabled:
+            with self._lock:
+                metric.observe(labels, value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Copy this process's recorded and collected values.
+
+        Returns:
+            A JSON-serializable dictionary mapping each metric name to its
+            kind, help text, label names, buckets and values
+        """
+        with self._lock:
+            families = {
+                metric.name: {
+                    "kind": metric.kind,
+                    "help": metric.documentation,
+                    "labels": list(metric.labelnames),
+                    "buckets": list(metric.buckets),
+                    "values": [
+                        [list(labels), list(value) if metric.buckets else value]
+                        for labels, value in metric.values.items()
+                    ],
+                }
+                for metric in self._metrics.values()
+            }
+        families.update(collect_stats())
+        return families
+
+    def maybe_flush(self) -> None:
+        """Write this worker's values to the shared directory if they are due."""
+        if self.directory and time.monotonic() - self._flushed >= self.flush_seconds:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write this worker's values to the shared directory."""
+        with self._flush_lock:
+            self._flushed = time.monotonic()
+            if self._pid != os.getpid():
+                # A forked worker starts its own file
+                self._pid = os.getpid()
+                self._token = uuid.uuid4().hex[:8]
+            path = os.path.join(self.directory, f"{self._pid}-{self._token}.json")
+            temporary = f"{path}.tmp"
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temporary, path)
+
+    def collect(self) -> Dict[str, Any]:
+        """Gather the values to report: this process's, or every worker's.
+
+        Returns:
+            A snapshot in the form returned by ``snapshot``
+        """
+        if not self.directory:
+            return self.snapshot()
+
+        import fcntl
+
+        self.flush()
+        with open(os.path.join(self.directory, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+            archive = _read(archive_path)
+            archived = False
+            live = []
+            for path in glob.glob(os.path.join(self.directory, "*-*.json")):
+                snapshot = _read(path)
+                if _pid_alive(int(os.path.basename(path).split("-")[0])):
+                    live.append(snapshot)
+                    continue
+                # Gauges describe a running process; the rest carries over
+                merge(
+                    archive,
+                    {n: f for n, f in snapshot.items() if f["kind"] != GAUGE},
+                )
+                archived = True
+                os.remove(path)
+            if archived:
+                with open(f"{archive_path}.tmp", "w", encoding="utf-8") as f:
+                    json.dump(archive, f)
+                os.replace(f"{archive_path}.tmp", archive_path)
+
+        for snapshot in live:
+            merge(archive, snapshot)
+        return archive
+
+
+def _read(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def merge(total: Dict[str, Any], snapshot: Dict[str, Any]) -> None:
+    """Add a snapshot's values to another snapshot, in place.
+
+    Args:
+        total: The snapshot added to
+        snapshot: The snapshot to add
+    """
+    for name, family in snapshot.items():
+        target = total.setdefault(name, dict(family, values=[]))
+        index = {tuple(labels): value for labels, value in target["values"]}
+        for labels, value in family["values"]:
+            key = tuple(labels)
+            current = index.get(key)
+            if current is None:
+                index[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                index[key] = [a + b for a, b in zip(current, value)]
+            else:
+                index[key] = current + value
+        target["values"] = [[list(labels), value] for labels, value in index.items()]
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = (
+            str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render(families: Dict[str, Any]) -> str:
+    """Format a snapshot in the Prometheus text exposition format.
+
+    Args:
+        families: A snapshot from ``Metrics.collect``
+
+    Returns:
+        The ``text/plain; version=0.0.4`` document
+    """
+    lines: List[str] = []
+    for name in sorted(families):
+        family = families[name]
+        names = family["labels"]
+        lines.append(f"# HELP {name} {family['help']}")
+        lines.append(f"# TYPE {name} {family['kind']}")
+        for labels, value in sorted(family["values"], key=lambda item: item[0]):
+            if family["kind"] != HISTOGRAM:
+                lines.append(
+                    f"{name}{_format_labels(names, labels)} {_format_value(value)}"
+                )
+                continue
+            cumulative = 0
+            bounds = family["buckets"] + [float("inf")]
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                bucket_labels = _format_labels(
+                    names + ["le"], labels + [_format_value(bound)]
+                )
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(names, labels)
+            lines.append(f"{name}_sum{label_text} {_format_value(value[-2])}")
+            lines.append(f"{name}_count{label_text} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# Configured by create_app; recorded by the request hooks, the MongoDB
+# command listener and the mail queue
+metrics = Metrics()
+
+HTTP_REQUESTS = metrics.counter(
+    "flatplan_http_requests_total",
+    "Requests handled, by endpoint, method and status",
+    ("endpoint", "method", "status"),
+)
+HTTP_DURATION = metrics.histogram(
+    "flatplan_http_request_duration_seconds",
+    "Time to produce a response, by endpoint",
+    ("endpoint",),
+    DURATION_BUCKETS,
+)
+HTTP_RESPONSE_SIZE = metrics.histogram(
+    "flatplan_http_response_size_bytes",
+    "Size of response bodies of known length, by endpoint",
+    ("endpoint",),
+    SIZE_BUCKETS,
+)
+MONGODB_COMMANDS = metrics.counter(
+    "flatplan_mongodb_commands_total",
+    "MongoDB commands run, by collection, command and outcome",
+    ("collection", "command", "outcome"),
+)
+MONGODB_DURATION = metrics.histogram(
+    "flatplan_mongodb_command_duration_seconds",
+    "MongoDB command round-trip time, by collection and command",
+    ("collection", "command"),
+    DURATION_BUCKETS,
+)
+SMTP_SEND_DURATION = metrics.histogram(
+    "flatplan_smtp_send_duration_seconds",
+    "Time to send a message to the SMTP server, by outcome",
+    ("outcome",),
+    DURATION_BUCKETS,
+)
+
+
+def _family(kind: str, documentation: str, labelnames: Sequence[str], values):
+    return {
+        "kind": kind,
+        "help": documentation,
+        "labels": list(labelnames),
+        "buckets": [],
+        "values": [[list(labels), value] for labels, value in values],
+    }
+
+
+def collect_stats() -> Dict[str, Any]:
+    """Read the statistics other components keep about themselves.
+
+    Returns:
+        Metric families in the form returned by ``Metrics.snapshot``
+    """
+    caches = {"user": user_cache.stats(), "fragment": fragment_cache.stats()}
+    pool = mongo.stats()
+    events = layout_events.stats()
+    return {
+        "flatplan_cache_hits_total": _family(
+            COUNTER,
+            "Cache lookups that found an entry, by cache",
+            ("cache",),
+            [((name,), stats["hits"]) for name, stats in caches.items()],
+        ),
+        "flatplan_cache_misses_total": _family(
+            COUNTER,
+            "Cache lookups that found no entry, by cache",
+            ("cache",),
+            [((name,), stats["misses"]) for name, stats in caches.items()],
+        ),
+        "flatplan_mongodb_pool_checkouts_total": _family(
+            COUNTER,
+            "Connections checked out of the MongoDB pool",
+            (),
+            [((), pool["checkouts"])],
+        ),
+        "flatplan_mongodb_pool_checkout_failures_total": _family(
+            COUNTER,
+            "Connection checkouts that failed or timed out",
+            (),
+            [((), pool["checkout_failures"])],
+        ),
+        "flatplan_mongodb_pool_wait_seconds_total": _family(
+            COUNTER,
+            "Time spent waiting for a MongoDB connection",
+            (),
+            [((), pool["wait_seconds"])],
+        ),
+        "flatplan_mongodb_pool_checked_out": _family(
+            GAUGE,
+            "MongoDB connections in use",
+            (),
+            [((), pool["checked_out"])],
+        ),
+        "flatplan_mongodb_pool_open_connections": _family(
+            GAUGE,
+            "Open MongoDB connections",
+            (),
+            [((), pool["open_connections"])],
+        ),
+        "flatplan_live_update_subscribers": _family(
+            GAUGE,
+            "Editors connected to a live update stream",
+            (),
+            [((), events["subscribers"])],
+        ),
+        "flatplan_live_update_events_published_total": _family(
+            COUNTER,
+            "Live update events published",
+            (),
+            [((), events["published"])],
+        ),
+        "flatplan_live_update_streams_rejected_total": _family(
+            COUNTER,
+            "Live update streams refused because the process had too many open",
+            (),
+            [((), events["rejected"])],
+        ),
+    }
+
+
+class CommandMetrics(CommandListener):
+    """Records the count and duration of MongoDB commands."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def started(self, event) -> None:
+        # Commands name their collection, except getMore, which has the
+        # cursor ID there; a thread waits for each command it starts
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        self._local.collection = collection if isinstance(collection, str) else ""
+
+    def _record(self, event, outcome: str) -> None:
+        collection = getattr(self._local, "collection", "")
+        seconds = event.duration_micros / 1e6
+        metrics.inc(MONGODB_COMMANDS, (collection, event.command_name, outcome))
+        metrics.observe(MONGODB_DURATION, (collection, event.command_name), seconds)
+
+    def succeeded(self, event) -> None:
+        self._record(event, "ok")
+
+    def failed(self, event) -> None:
+        self._record(event, "error")
+
+
+def instrument_app(app: Flask) -> None:
+    """Record the count, duration and response size of every request.
+
+    Args:
+        app: The application
+    """
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        endpoint = request.endpoint or "unmatched"
+        metrics.inc(
+            HTTP_REQUESTS, (endpoint, request.method, str(response.status_code))
+        )
+        metrics.observe(HTTP_DURATION, (endpoint,), time.perf_counter() - started)
+        size = response.content_length
+        if size is None and not response.is_streamed:
+            size = response.calculate_content_length()
+        if size is not None:
+            metrics.observe(HTTP_RESPONSE_SIZE, (endpoint,), size)
+        metrics.maybe_flush()
+        return response
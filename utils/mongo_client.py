@@ -0,0 +1,212 @@
+"""The application's MongoDB client.
+
+One ``MongoClient`` is shared by every module through the proxies in
+``extensions`` (``db``, ``users``, ``layouts``, ...). ``create_app``
+configures it from the ``MONGODB_*`` settings; the client itself is only
+created on first use, so importing the app does not need MongoDB to be
+reachable.
+
+A client must not be carried across ``fork()``: its pooled sockets and
+monitoring threads belong to the parent. When a pre-fork server (gunicorn)
+starts a worker, the first use in the worker creates a new client. The
+parent's client is left alone rather than closed, since closing it from the
+child would end sessions the parent still owns.
+
+Connection pool events are counted to report checkouts and the time spent
+waiting for a connection (``stats``).
+"""
+
+import os
+import threading
+from typing import Dict, Any, Optional
+
+from pymongo import MongoClient
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.monitoring import ConnectionPoolListener
+from werkzeug.local import LocalProxy
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts connection pool events for the pools of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checked_out = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.pools_cleared = 0
+
+    def connection_checked_out(self, event) -> None:
+        # The event's duration is the time spent waiting for the connection
+        with self._lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.wait_seconds += event.duration
+            self.max_wait_seconds = max(self.max_wait_seconds, event.duration)
+
+    def connection_check_out_failed(self, event) -> None:
+        with self._lock:
+            self.checkout_failures += 1
+            self.wait_seconds += event.duration
+
+    def connection_checked_in(self, event) -> None:
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event) -> None:
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_closed(self, event) -> None:
+        with self._lock:
+            self.connections_closed += 1
+
+    def pool_cleared(self, event) -> None:
+        with self._lock:
+            self.pools_cleared += 1
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Read the counters.
+
+        Returns:
+            A dictionary of pool statistics
+        """
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checked_out": self.checked_out,
+                "wait_seconds": self.wait_seconds,
+                "average_wait_seconds": (
+                    self.wait_seconds / self.checkouts if self.checkouts else 0.0
+                ),
+                "max_wait_seconds": self.max_wait_seconds,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "open_connections": self.connections_created - self.connections_closed,
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+class MongoClientManager:
+    """Creates the process's ``MongoClient`` on first use, once per process."""
+
+    def __init__(self):
+        self.uri: Optional[str] = None
+        self.database_name = "flatplan"
+        self.options: Dict[str, Any] = {}
+        self.pool_stats = PoolStats()
+        self._client: Optional[MongoClient] = None
+        self._database: Optional[Database] = None
+        self._collections: Dict[str, Collection] = {}
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def configure(self, uri: str, database_name: str, **options: Any) -> None:
+        """Set the connection settings; the client is created on first use.
+
+        Args:
+            uri: The MongoDB connection string
+            database_name: The database the application uses
+            **options: Keyword arguments for ``MongoClient`` (pool size,
+                timeouts, compressors, retryWrites, event_listeners, ...)
+        """
+        with self._lock:
+            self.uri = uri
+            self.database_name = database_name
+            self.options = options
+            self._client = None
+            self._database = None
+            self._collections = {}
+            self._pid = None
+
+    def _connect(self) -> None:
+        """Create this process's client (called with the lock held)."""
+        if self.uri is None:
+            raise RuntimeError("MongoDB is not configured; call create_app() first")
+        self.pool_stats = PoolStats()
+        options = dict(self.options)
+        listeners = [self.pool_stats, *options.pop("event_listeners", ())]
+        self._client = MongoClient(self.uri, event_listeners=listeners, **options)
+        self._database = self._client.get_database(self.database_name)
+        self._collections = {}
+        self._pid = os.getpid()
+
+    def get_client(self) -> MongoClient:
+        """Return this process's client, creating it if needed."""
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._connect()
+        return self._client
+
+    def get_database(self) -> Database:
+        """Return the application's database on this process's client."""
+        if self._pid != os.getpid():
+            self.get_client()
+        return self._database
+
+    def collection(self, name: str) -> Collection:
+        """Return a proxy to a collection of the application's database.
+
+        The proxy resolves the collection on every use, so it can be
+        imported before the client exists and stays valid after a fork.
+        """
+        return LocalProxy(lambda: self._collection(name))
+
+    def _collection(self, name: str) -> Collection:
+        if self._pid != os.getpid():
+            self.get_client()
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = self._database[name]
+        return collection
+
+    @property
+    def connected(self) -> bool:
+        """Whether this process has created its client."""
+        return self._client is not None and self._pid == os.getpid()
+
+    def close(self) -> None:
+        """Close this process's client; the next use creates a new one."""
+        with self._lock:
+            if self.connected:
+                self._client.close()
+            self._client = None
+            self._database = None
+            self._pid = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Report the pool settings and usage of this process's client.
+
+        Returns:
+            A dictionary of connection pool statistics
+        """
+        stats = self.pool_stats.snapshot()
+        stats["connected"] = self.connected
+        stats["max_pool_size"] = self.options.get("maxPoolSize", 100)
+        return stats
+
+
+# Configured by create_app; used through the proxies in extensions
+mongo = MongoClientManager()
@@ -0,0 +1,573 @@
+"""Server-side proof rendering of flatplans as PDF and PNG.
+
+The browser export (html2canvas + jsPDF) rasterizes the whole page grid in
+the client, which is slow and memory hungry on big issues. This module draws
+the flatplan straight from the layout document instead:
+
+- ``proof_sheets`` lays the pages out as spreads and produces a display list
+  of rectangles and text for each sheet;
+- ``render_pdf`` writes the sheets as vector PDF pages using the standard
+  Helvetica fonts, so nothing has to be embedded;
+- ``render_png`` rasterizes a single sheet holding every page, using a small
+  built-in bitmap font, and encodes it with zlib.
+
+Both writers are pure Python, so the app needs no imaging libraries.
+"""
+
+import struct
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Optional, Tuple
+
+from models.page import FRACTIONAL_SIZES, Page, parse_pages
+from utils.layout_helpers import layout_display_items
+
+PROOF_FORMATS = {"pdf": "application/pdf", "png": "image/png"}
+
+Color = Tuple[int, int, int]
+
+# Geometry in points (1/72 inch); sheets are A4 landscape
+SHEET_WIDTH = 842
+SHEET_HEIGHT = 595
+MARGIN = 36
+HEADER_HEIGHT = 36
+PAGE_WIDTH = 72
+PAGE_HEIGHT = 96
+SPREAD_GAP = 16
+ROW_GAP = 26
+
+# Colors match static/style.css and static/layout.css
+PAGE_COLORS: Dict[str, Color] = {
+    "edit": (0xB1, 0xFC, 0xFE),
+    "ad": (0xFF, 0xFF, 0xA6),
+    "bonus": (0x99, 0x99, 0xF8),
+    "promo": (0xB1, 0xFC, 0xA3),
+    "mixed": (0xF3, 0xF4, 0xF6),
+    "placeholder": (0xF2, 0xF2, 0xF2),
+    "unknown": (0xEE, 0xEE, 0xEE),
+}
+UNIT_COLORS: Dict[str, Color] = {"edit": (0xB1, 0xFC, 0xFE), "ad": (0xF1, 0x9E, 0x9C)}
+BORDER_COLOR: Color = (0xD1, 0xD5, 0xDB)
+FORM_BREAK_COLOR: Color = (0xEB, 0x64, 0xEB)
+TEXT_COLOR: Color = (0x1F, 0x29, 0x37)
+MUTED_COLOR: Color = (0x6B, 0x72, 0x80)
+WHITE: Color = (0xFF, 0xFF, 0xFF)
+
+# Where each fractional unit position sits on a page, as (x, y, w, h)
+# fractions of the page; "top"/"bottom"/"left"/"right" are sized by the unit
+UNIT_QUADRANTS = {
+    "top-left": (0.0, 0.0, 0.5, 0.5),
+    "top-right": (0.5, 0.0, 0.5, 0.5),
+    "bottom-left": (0.0, 0.5, 0.5, 0.5),
+    "bottom-right": (0.5, 0.5, 0.5, 0.5),
+}
+
+
+def _spreads_per_row() -> int:
+    """Number of two-page spreads that fit across a sheet."""
+    usable = SHEET_WIDTH - 2 * MARGIN + SPREAD_GAP
+    return max(1, usable // (2 * PAGE_WIDTH + SPREAD_GAP))
+
+
+def _rows_per_sheet() -> int:
+    """Number of rows of spreads that fit on a PDF sheet."""
+    usable = SHEET_HEIGHT - 2 * MARGIN - HEADER_HEIGHT + ROW_GAP
+    return max(1, usable // (PAGE_HEIGHT + ROW_GAP))
+
+
+def _fit_text(text: str, size: float, width: float) -> str:
+    """Truncate text to roughly fit a width (Helvetica averages ~0.55em)."""
+    max_chars = int(width / (size * 0.55))
+    if len(text) <= max_chars:
+        return text
+    return text[: max(0, max_chars - 3)].rstrip() + "..."
+
+
+def _page_fill(item: Page) -> Color:
+    """Pick a page's background color the same way the spread grid does."""
+    if item.kind == "ad" and item.section in ("Bonus", "Promo"):
+        return PAGE_COLORS[item.section.lower()]
+    return PAGE_COLORS[item.kind]
+
+
+def _unit_rect(
+    unit: Dict[str, Any], stacked: float
+) -> Tuple[float, float, float, float]:
+    """Place a fractional unit on its page, as fractions of the page box."""
+    position = unit.get("position")
+    fraction = FRACTIONAL_SIZES.get(unit.get("size", "1/4"), 0.25)
+    if position in UNIT_QUADRANTS:
+        return UNIT_QUADRANTS[position]
+    if position == "top":
+        return 0.0, 0.0, 1.0, fraction
+    if position == "left":
+        return 0.0, 0.0, fraction, 1.0
+    if position == "right":
+        return 1.0 - fraction, 0.0, fraction, 1.0
+    if position == "bottom":
+        return 0.0, 1.0 - fraction, 1.0, fraction
+    # Units without a position are stacked up from the bottom of the page
+    return 0.0, max(0.0, 1.0 - stacked - fraction), 1.0, fraction
+
+
+def _page_ops(item: Page, x: float, y: float) -> List[tuple]:
+    """Draw one page box, its labels and its page number."""
+    ops = []
+    page_type = item.kind
+    dashed = page_type == "placeholder"
+    ops.append(("rect", x, y, PAGE_WIDTH, PAGE_HEIGHT, _page_fill(item), None, False))
+
+    if page_type == "mixed":
+        units = item.get("fractional_units") or [
+            {**ad.to_bson(), "type": "ad"} for ad in item.fractional_ads
+        ]
+        stacked = 0.0
+        for unit in units:
+            if not isinstance(unit, dict):
+                continue
+            ux, uy, uw, uh = _unit_rect(unit, stacked)
+            if not unit.get("position"):
+                stacked += uh
+            rect = (x + ux * PAGE_WIDTH, y + uy * PAGE_HEIGHT)
+            size = (uw * PAGE_WIDTH, uh * PAGE_HEIGHT)
+            color = UNIT_COLORS.get(unit.get("type"), UNIT_COLORS["ad"])
+            ops.append(("rect", *rect, *size, color, BORDER_COLOR, False))
+            name = _fit_text(str(unit.get("name") or ""), 5, size[0] - 4)
+            if name and size[1] >= 8:
+                ops.append(
+                    (
+                        "text",
+                        rect[0] + size[0] / 2,
+                        rect[1] + size[1] / 2 + 2,
+                        5,
+                        name,
+                        TEXT_COLOR,
+                        "center",
+                        False,
+                    )
+                )
+    else:
+        section = _fit_text(str(item.section or ""), 6, PAGE_WIDTH - 6)
+        name = _fit_text(str(item.name or ""), 7, PAGE_WIDTH - 6)
+        color = MUTED_COLOR if dashed else TEXT_COLOR
+        if section:
+            ops.append(
+                ("text", x + PAGE_WIDTH / 2, y + 11, 6, section, color, "center", True)
+            )
+        if name:
+            ops.append(
+                (
+                    "text",
+                    x + PAGE_WIDTH / 2,
+                    y + PAGE_HEIGHT / 2 + 3,
+                    7,
+                    name,
+                    color,
+                    "center",
+                    False,
+                )
+            )
+
+    ops.append(("rect", x, y, PAGE_WIDTH, PAGE_HEIGHT, None, BORDER_COLOR, dashed))
+    if item.form_break:
+        ops.append(("rect", x, y - 3, PAGE_WIDTH, 3, FORM_BREAK_COLOR, None, False))
+    ops.append(
+        (
+            "text",
+            x + PAGE_WIDTH / 2,
+            y + PAGE_HEIGHT + 11,
+            7,
+            str(item.get("page_number", "")),
+            MUTED_COLOR,
+            "center",
+            True,
+        )
+    )
+    return ops
+
+
+def proof_sheets(
+    layout_doc: Dict[str, Any], single_sheet: bool = False
+) -> List[Tuple[float, List[tuple]]]:
+    """Lay a flatplan out as spreads and build the display list of each sheet.
+
+    Coordinates are in points from the top-left corner of the sheet. Display
+    list entries are ``("rect", x, y, w, h, fill, stroke, dashed)`` and
+    ``("text", x, baseline, size, text, color, align, bold)``.
+
+    Args:
+        layout_doc: The layout document, including its pages
+        single_sheet: Put every row on one sheet (for PNG) instead of
+            splitting the plan over A4 sheets
+
+    Returns:
+        A list of ``(sheet_height, display_list)`` tuples
+    """
+    items = parse_pages(layout_display_items(layout_doc))
+    per_row = 2 * _spreads_per_row()
+    rows = [items[i : i + per_row] for i in range(0, len(items), per_row)] or [[]]
+    rows_per_sheet = len(rows) if single_sheet else _rows_per_sheet()
+
+    title = " - ".join(
+        str(value)
+        for value in (layout_doc.get("publication_name"), layout_doc.get("issue_name"))
+        if value
+    )
+    real_pages = len(items) - (1 if items and items[0].is_page_zero else 0)
+    sheet_count = (len(rows) + rows_per_sheet - 1) // rows_per_sheet
+
+    sheets = []
+    for sheet_index in range(sheet_count):
+        sheet_rows = rows[
+            sheet_index * rows_per_sheet : (sheet_index + 1) * rows_per_sheet
+        ]
+        height = (
+            SHEET_HEIGHT
+            if not single_sheet
+            else 2 * MARGIN
+            + HEADER_HEIGHT
+            + len(sheet_rows) * (PAGE_HEIGHT + ROW_GAP)
+            - ROW_GAP
+        )
+        subtitle = f"{real_pages} pages"
+        if sheet_count > 1:
+            subtitle += f" - sheet {sheet_index + 1} of {sheet_count}"
+        ops = [
+            ("rect", 0, 0, SHEET_WIDTH, height, WHITE, None, False),
+            (
+                "text",
+                MARGIN,
+                MARGIN + 12,
+                14,
+                _fit_text(title or "Flatplan", 14, 560),
+                TEXT_COLOR,
+                "left",
+                True,
+            ),
+            (
+                "text",
+                SHEET_WIDTH - MARGIN,
+                MARGIN + 12,
+                8,
+                subtitle,
+                MUTED_COLOR,
+                "right",
+                False,
+            ),
+        ]
+        for row_index, row in enumerate(sheet_rows):
+            y = MARGIN + HEADER_HEIGHT + row_index * (PAGE_HEIGHT + ROW_GAP)
+            for column, item in enumerate(row):
+                # Page 0 keeps its slot so page 1 starts on a right-hand page,
+                # but is not drawn (as in the spread grid)
+                if item.is_page_zero and item.kind == "placeholder":
+                    continue
+                x = MARGIN + column * PAGE_WIDTH + (column // 2) * SPREAD_GAP
+                ops.extend(_page_ops(item, x, y))
+        sheets.append((height, ops))
+    return sheets
+
+
+# ---------------------------------------------------------------------------
+# PDF
+# ---------------------------------------------------------------------------
+
+
+def _pdf_color(color: Color) -> str:
+    return " ".join(f"{channel / 255:.3f}" for channel in color)
+
+
+def _pdf_text(text: str) -> str:
+    """Encode text as a PDF literal string in WinAnsiEncoding."""
+    raw = text.encode("cp1252", errors="replace").decode("latin-1")
+    return "(" + raw.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+
+def _pdf_content(height: float, ops: List[tuple]) -> bytes:
+    """Translate a display list into a PDF content stream."""
+    lines = []
+    for op in ops:
+        if op[0] == "rect":
+            _, x, y, w, h, fill, stroke, dashed = op
+            rect = f"{x:.2f} {height - y - h:.2f} {w:.2f} {h:.2f} re"
+            if fill:
+                lines.append(f"{_pdf_color(fill)} rg {rect} f")
+            if stroke:
+                dash = "[3 2] 0 d" if dashed else "[] 0 d"
+                lines.append(f"{_pdf_color(stroke)} RG 0.75 w {dash} {rect} S")
+        else:
+            _, x, y, size, text, color, align, bold = op
+            # Centre and right alignment use the same width estimate as _fit_text
+            width = len(text) * size * 0.55
+            if align == "center":
+                x -= width / 2
+            elif align == "right":
+                x -= width
+            font = "F2" if bold else "F1"
+            lines.append(
+                f"BT /{font} {size} Tf {_pdf_color(color)} rg "
+                f"{x:.2f} {height - y:.2f} Td {_pdf_text(text)} Tj ET"
+            )
+    return "\n".join(lines).encode("latin-1")
+
+
+def render_pdf(layout_doc: Dict[str, Any]) -> bytes:
+    """Render a flatplan proof as a vector PDF with one A4 sheet per block of rows.
+
+    Args:
+        layout_doc: The layout document, including its pages
+
+    Returns:
+        The PDF file
+    """
+    sheets = proof_sheets(layout_doc)
+
+    # Objects: 1 catalog, 2 page tree, 3-4 fonts, 5 info, then a page and a
+    # content stream per sheet
+    objects: List[bytes] = [b"", b"", b"", b"", b""]
+    page_refs = []
+    for height, ops in sheets:
+        content = zlib.compress(_pdf_content(height, ops))
+        objects.append(
+            b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)
+            + content
+            + b"\nendstream"
+        )
+        content_ref = len(objects)
+        objects.append(
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {SHEET_WIDTH} {height:.0f}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> "
+                f"/Contents {content_ref} 0 R >>"
+            ).encode("latin-1")
+        )
+        page_refs.append(f"{len(objects)} 0 R")
+
+    title = " - ".join(
+        str(value)
+        for value in (layout_doc.get("publication_name"), layout_doc.get("issue_name"))
+        if value
+    )
+    created = datetime.now(timezone.utc).strftime("D:%Y%m%d%H%M%SZ")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = (
+        f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+    ).encode("latin-1")
+    for index, font in ((2, "Helvetica"), (3, "Helvetica-Bold")):
+        objects[index] = (
+            f"<< /Type /Font /Subtype /Type1 /BaseFont /{font} "
+            f"/Encoding /WinAnsiEncoding >>"
+        ).encode("latin-1")
+    objects[4] = (
+        f"<< /Title {_pdf_text(title or 'Flatplan')} /Creator (Flatplan App) "
+        f"/CreationDate ({created}) >>"
+    ).encode("latin-1")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += (
+        b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+        % (len(objects) + 1, xref)
+    )
+    return bytes(output)
+
+
+# ---------------------------------------------------------------------------
+# PNG
+# ---------------------------------------------------------------------------
+
+# A 3x5 bitmap font; each glyph is five rows of three pixels. Lowercase
+# letters are drawn as capitals and unknown characters as "?".
+GLYPHS = {
+    " ": "000000000000000",
+    "0": "111101101101111",
+    "1": "010110010010111",
+    "2": "111001111100111",
+    "3": "111001111001111",
+    "4": "101101111001001",
+    "5": "111100111001111",
+    "6": "111100111101111",
+    "7": "111001001001001",
+    "8": "111101111101111",
+    "9": "111101111001111",
+    "A": "010101111101101",
+    "B": "110101110101110",
+    "C": "011100100100011",
+    "D": "110101101101110",
+    "E": "111100110100111",
+    "F": "111100110100100",
+    "G": "011100101101011",
+    "H": "101101111101101",
+    "I": "111010010010111",
+    "J": "001001001101010",
+    "K": "101101110101101",
+    "L": "100100100100111",
+    "M": "101111111101101",
+    "N": "110101101101101",
+    "O": "010101101101010",
+    "P": "110101110100100",
+    "Q": "010101101110011",
+    "R": "110101110101101",
+    "S": "011100010001110",
+    "T": "111010010010010",
+    "U": "101101101101111",
+    "V": "101101101101010",
+    "W": "101101111111101",
+    "X": "101101010101101",
+    "Y": "101101010010010",
+    "Z": "111001010100111",
+    "-": "000000111000000",
+    ".": "000000000000010",
+    ",": "000000000010100",
+    "/": "001001010100100",
+    "&": "010101010101011",
+    "'": "010010000000000",
+    "(": "001010010010001",
+    ")": "100010010010100",
+    ":": "000010000010000",
+    "?": "111001010000010",
+    "!": "010010010000010",
+    "+": "000010111010000",
+    "#": "101111101111101",
+}
+
+# Typographic punctuation drawn with the nearest glyph
+GLYPH_SUBSTITUTES = str.maketrans(
+    {"\u2013": "-", "\u2014": "-", "\u2018": "'", "\u2019": "'", "\u2026": "."}
+)
+
+
+class _Canvas:
+    """An RGB raster with just enough drawing operations for proofs."""
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.pixels = bytearray(b"\xff" * (width * height * 3))
+
+    def fill(self, x: int, y: int, w: int, h: int, color: Color) -> None:
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(self.width, x + w), min(self.height, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return
+        run = bytes(color) * (x1 - x0)
+        for row in range(y0, y1):
+            start = (row * self.width + x0) * 3
+            self.pixels[start : start + len(run)] = run
+
+    def stroke(
+        self, x: int, y: int, w: int, h: int, color: Color, dashed: bool
+    ) -> None:
+        if not dashed:
+            self.fill(x, y, w, 1, color)
+            self.fill(x, y + h - 1, w, 1, color)
+            self.fill(x, y, 1, h, color)
+            self.fill(x + w - 1, y, 1, h, color)
+            return
+        for offset in range(0, w, 6):
+            self.fill(x + offset, y, 3, 1, color)
+            self.fill(x + offset, y + h - 1, 3, 1, color)
+        for offset in range(0, h, 6):
+            self.fill(x, y + offset, 1, 3, color)
+            self.fill(x + w - 1, y + offset, 1, 3, color)
+
+    def text(
+        self, x: int, y: int, scale: int, text: str, color: Color, align: str
+    ) -> None:
+        """Draw text with its top-left corner (after alignment) at (x, y)."""
+        advance = 4 * scale
+        width = len(text) * advance - scale
+        if align == "center":
+            x -= width // 2
+        elif align == "right":
+            x -= width
+        text = text.upper().translate(GLYPH_SUBSTITUTES)
+        for index, char in enumerate(text):
+            glyph = GLYPHS.get(char, GLYPHS["?"])
+            for bit, value in enumerate(glyph):
+                if value == "1":
+                    self.fill(
+                        x + index * advance + (bit % 3) * scale,
+                        y + (bit // 3) * scale,
+                        scale,
+                        scale,
+                        color,
+                    )
+
+    def png(self) -> bytes:
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return (
+                struct.pack(">I", len(data))
+                + kind
+                + data
+                + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+            )
+
+        stride = self.width * 3
+        raw = b"".join(
+            b"\x00" + bytes(self.pixels[row * stride : (row + 1) * stride])
+            for row in range(self.height)
+        )
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b"")
+        )
+
+
+def render_png(layout_doc: Dict[str, Any], scale: float = 2.0) -> bytes:
+    """Render a flatplan proof as a single PNG image.
+
+    Args:
+        layout_doc: The layout document, including its pages
+        scale: Pixels per point
+
+    Returns:
+        The PNG file
+    """
+    height, ops = proof_sheets(layout_doc, single_sheet=True)[0]
+    canvas = _Canvas(int(SHEET_WIDTH * scale), int(height * scale))
+
+    def px(value: float) -> int:
+        return int(round(value * scale))
+
+    for op in ops:
+        if op[0] == "rect":
+            _, x, y, w, h, fill, stroke, dashed = op
+            if fill:
+                canvas.fill(px(x), px(y), px(w), px(h), fill)
+            if stroke:
+                canvas.stroke(px(x), px(y), px(w), px(h), stroke, dashed)
+        else:
+            _, x, y, size, text, color, align, bold = op
+            # Glyphs are 5 units tall; size them to about the cap height
+            glyph_scale = max(1, px(size * 0.7) // 5)
+            canvas.text(px(x), px(y) - 5 * glyph_scale, glyph_scale, text, color, align)
+    return canvas.png()
+
+
+def render_proof(
+    layout_doc: Dict[str, Any], proof_format: str, png_scale: Optional[float] = None
+) -> bytes:
+    """Render a flatplan proof in the requested format.
+
+    Args:
+        layout_doc: The layout document, including its pages
+        proof_format: "pdf" or "png"
+        png_scale: Pixels per point for PNG proofs
+
+    Returns:
+        The rendered file
+    """
+    if proof_format == "png":
+        return render_png(layout_doc, png_scale or 2.0)
+    return render_pdf(layout_doc)
@@ -0,0 +1,271 @@
+"""Cross-issue trend reports for a publication.
+
+Each layout (issue) gets a small rollup document in ``publication_rollups``
+with its ad/editorial page counts per section and per advertiser. A rollup
+records the ``modified_date`` and ``revision`` of the layout it was built
+from and is rebuilt when either changes, so a report only reads page arrays
+for issues edited since the last report and otherwise works from rollups.
+"""
+
+from datetime import datetime
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+from extensions import layouts, publication_rollups
+from models.page import DEFAULT_SECTION, parse_pages
+from utils.layout_clones import layout_pages
+
+# Bump when the rollup structure changes so old rollups are rebuilt
+# (2: pages are read through models.page, like the layout analytics)
+ROLLUP_VERSION = 2
+
+# Layout fields needed to decide whether an issue's rollup is current
+ISSUE_PROJECTION = {
+    "issue_name": 1,
+    "publication_date": 1,
+    "modified_date": 1,
+    "revision": 1,
+}
+
+COUNTERS = ("ad_pages", "editorial_pages", "fractional_ads")
+
+
+def _empty_counts() -> Dict[str, float]:
+    """Create a zeroed set of rollup counters."""
+    return {counter: 0 for counter in COUNTERS}
+
+
+def _add_counts(target: Dict[str, float], source: Dict[str, float]) -> None:
+    """Add one set of rollup counters to another."""
+    for counter in COUNTERS:
+        target[counter] = target.get(counter, 0) + source.get(counter, 0)
+
+
+def _count(group: Dict[str, Dict[str, float]], name: str, **amounts: float) -> None:
+    """Add amounts to the counters of a named section or advertiser."""
+    _add_counts(group.setdefault(name, _empty_counts()), amounts)
+
+
+def _label(value: Any, default: str) -> str:
+    """Turn a stored name into a report label."""
+    label = str(value).strip() if value is not None else ""
+    return label or default
+
+
+def build_issue_rollup(layout_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the rollup document for a single layout.
+
+    Full ad pages count towards the page's section and advertiser (the page
+    name). Fractional ads on mixed pages count their size towards their own
+    section and advertiser; the rest of a mixed page counts as editorial.
+
+    Args:
+        layout_doc: The layout document, including its pages
+
+    Returns:
+        The rollup document to store in ``publication_rollups``
+    """
+    sections: Dict[str, Dict[str, float]] = {}
+    advertisers: Dict[str, Dict[str, float]] = {}
+    pages = 0
+
+    for page in parse_pages(layout_pages(layout_doc)):
+        if page.is_page_zero:
+            continue
+        pages += 1
+
+        page_type = page.kind
+        section = _label(page.section, DEFAULT_SECTION)
+
+        if page_type == "edit":
+            _count(sections, section, editorial_pages=1)
+        elif page_type == "ad":
+            _count(sections, section, ad_pages=1)
+            _count(advertisers, _label(page.name, "Unnamed"), ad_pages=1)
+        elif page_type == "mixed":
+            ad_space = 0.0
+            for ad in page.fractional_ads:
+                size = ad.value
+                ad_space += size
+                ad_section = _label(ad.section, DEFAULT_SECTION)
+                _count(sections, ad_section, ad_pages=size, fractional_ads=1)
+                advertiser = _label(ad.name, "Unnamed")
+                _count(advertisers, advertiser, ad_pages=size, fractional_ads=1)
+            _count(sections, section, editorial_pages=max(0, 1 - ad_space))
+
+    totals = {"pages": pages, **_empty_counts()}
+    for counts in sections.values():
+        _add_counts(totals, counts)
+
+    return {
+        "_id": layout_doc["_id"],
+        "version": ROLLUP_VERSION,
+        "account_id": layout_doc.get("account_id"),
+        "publication_name": layout_doc.get("publication_name"),
+        "issue_name": layout_doc.get("issue_name"),
+        "publication_date": layout_doc.get("publication_date"),
+        "modified_date": layout_doc.get("modified_date"),
+        "revision": layout_doc.get("revision", 0),
+        "totals": totals,
+        "sections": [{"name": name, **counts} for name, counts in sections.items()],
+        "advertisers": [
+            {"name": name, **counts} for name, counts in advertisers.items()
+        ],
+    }
+
+
+def _is_fresh(rollup: Optional[Dict[str, Any]], issue: Dict[str, Any]) -> bool:
+    """Check whether a stored rollup still describes an issue."""
+    return (
+        rollup is not None
+        and rollup.get("version") == ROLLUP_VERSION
+        and rollup.get("modified_date") == issue.get("modified_date")
+        and rollup.get("revision", 0) == issue.get("revision", 0)
+        and rollup.get("publication_date") == issue.get("publication_date")
+        and rollup.get("issue_name") == issue.get("issue_name")
+    )
+
+
+def load_issue_rollups(user_id: str, publication_name: str) -> List[Dict[str, Any]]:
+    """Load the rollups of every issue of a publication, rebuilding stale ones.
+
+    Args:
+        user_id: The ID of the account
+        publication_name: The publication to report on
+
+    Returns:
+        One rollup per layout of the publication
+    """
+    issues = list(
+        layouts.find(
+            {"account_id": ObjectId(user_id), "publication_name": publication_name},
+            ISSUE_PROJECTION,
+        )
+    )
+    if not issues:
+        return []
+
+    rollups = {
+        rollup["_id"]: rollup
+        for rollup in publication_rollups.find(
+            {"_id": {"$in": [issue["_id"] for issue in issues]}}
+        )
+    }
+
+    stale = [
+        issue["_id"]
+        for issue in issues
+        if not _is_fresh(rollups.get(issue["_id"]), issue)
+    ]
+    if stale:
+        writes = []
+        for layout_doc in layouts.find({"_id": {"$in": stale}}):
+            rollup = build_issue_rollup(layout_doc)
+            rollups[rollup["_id"]] = rollup
+            writes.append(ReplaceOne({"_id": rollup["_id"]}, rollup, upsert=True))
+        if writes:
+            publication_rollups.bulk_write(writes, ordered=False)
+
+    return [rollups[issue["_id"]] for issue in issues if issue["_id"] in rollups]
+
+
+def issue_year(rollup: Dict[str, Any]) -> str:
+    """Work out which year an issue belongs to for year-over-year reports.
+
+    Args:
+        rollup: The issue's rollup document
+
+    Returns:
+        The four-digit year of the publication date, or "Undated"
+    """
+    publication_date = rollup.get("publication_date")
+    if isinstance(publication_date, datetime):
+        return str(publication_date.year)
+    if isinstance(publication_date, str) and publication_date[:4].isdigit():
+        return publication_date[:4]
+    return "Undated"
+
+
+def _sort_key(rollup: Dict[str, Any]) -> Tuple[str, str]:
+    """Order issues by publication date, then by name."""
+    publication_date = rollup.get("publication_date")
+    if isinstance(publication_date, datetime):
+        publication_date = publication_date.strftime("%Y-%m-%d")
+    return (str(publication_date or ""), str(rollup.get("issue_name") or ""))
+
+
+def _rounded(counts: Dict[str, float]) -> Dict[str, float]:
+    """Round report counters for display."""
+    return {
+        key: round(value, 2) if isinstance(value, float) else value
+        for key, value in counts.items()
+    }
+
+
+def _merge_rows(rollups: Iterable[Dict[str, Any]], field: str) -> List[Dict[str, Any]]:
+    """Merge the section or advertiser rows of several issues, with per-year totals."""
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    for rollup in rollups:
+        year = issue_year(rollup)
+        for entry in rollup.get(field, []):
+            row = rows.setdefault(
+                entry["name"],
+                {"name": entry["name"], "issues": 0, **_empty_counts(), "years": {}},
+            )
+            row["issues"] += 1
+            _add_counts(row, entry)
+            _add_counts(row["years"].setdefault(year, _empty_counts()), entry)
+
+    merged = []
+    for row in rows.values():
+        row["years"] = {
+            year: _rounded(counts) for year, counts in row["years"].items()
+        }
+        merged.append(_rounded(row))
+    merged.sort(
+        key=lambda row: (-row["ad_pages"], -row["editorial_pages"], row["name"])
+    )
+    return merged
+
+
+def publication_trends(user_id: str, publication_name: str) -> Dict[str, Any]:
+    """Build the trend report for every issue of a publication.
+
+    Args:
+        user_id: The ID of the account
+        publication_name: The publication to report on
+
+    Returns:
+        A dictionary with per-issue totals, per-year totals, and section and
+        advertiser rows (each with per-year breakdowns)
+    """
+    rollups = sorted(load_issue_rollups(user_id, publication_name), key=_sort_key)
+
+    years: Dict[str, Dict[str, Any]] = {}
+    for rollup in rollups:
+        year = years.setdefault(
+            issue_year(rollup), {"issues": 0, "pages": 0, **_empty_counts()}
+        )
+        year["issues"] += 1
+        year["pages"] += rollup["totals"]["pages"]
+        _add_counts(year, rollup["totals"])
+
+    return {
+        "publication_name": publication_name,
+        "issues": [
+            {
+                "layout_id": str(rollup["_id"]),
+                "issue_name": rollup.get("issue_name"),
+                "publication_date": rollup.get("publication_date"),
+                "year": issue_year(rollup),
+                **_rounded(rollup["totals"]),
+            }
+            for rollup in rollups
+        ],
+        "years": {year: _rounded(counts) for year, counts in sorted(years.items())},
+        "sections": _merge_rows(rollups, "sections"),
+        "advertisers": _merge_rows(rollups, "advertisers"),
+    }
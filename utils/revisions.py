@@ -0,0 +1,110 @@
+"""Layout revision helpers for optimistic concurrency control.
+
+Every write to a layout increments its ``revision`` field. Clients send the
+revision they loaded (as an ``If-Match`` header or a form field) and writes
+only apply when it still matches, so a stale save fails instead of silently
+overwriting someone else's work.
+"""
+
+from typing import Dict, Any, Optional
+
+from bson import ObjectId
+
+from extensions import layouts
+
+# Error returned by layout writers when the expected revision is out of date
+REVISION_CONFLICT = "Layout has been modified since it was loaded"
+
+
+def revision_query(revision: int) -> Dict[str, Any]:
+    """Build a query fragment matching a specific layout revision.
+
+    Layouts saved before revisions were introduced have no ``revision`` field
+    and are treated as revision 0.
+
+    Args:
+        revision: The expected revision number
+
+    Returns:
+        A query fragment to merge into a layout filter
+    """
+    if revision == 0:
+        return {"revision": {"$in": [0, None]}}
+    return {"revision": revision}
+
+
+def layout_query(
+    layout_id: str, user_id: str, expected_revision: Optional[int] = None
+) -> Dict[str, Any]:
+    """Build the filter for a write to a user's layout.
+
+    Args:
+        layout_id: The ID of the layout to update
+        user_id: The ID of the user who owns the layout
+        expected_revision: The revision the client loaded, or None to skip the check
+
+    Returns:
+        A MongoDB filter document
+    """
+    query = {"_id": ObjectId(layout_id), "account_id": ObjectId(user_id)}
+    if expected_revision is not None:
+        query.update(revision_query(expected_revision))
+    return query
+
+
+def current_revision(layout_id: str, user_id: str) -> Optional[int]:
+    """Look up the stored revision of a user's layout.
+
+    Args:
+        layout_id: The ID of the layout
+        user_id: The ID of the user who owns the layout
+
+    Returns:
+        The current revision number, or None if the layout does not exist
+    """
+    layout_doc = layouts.find_one(layout_query(layout_id, user_id), {"revision": 1})
+    if not layout_doc:
+        return None
+    return layout_doc.get("revision", 0)
+
+
+def revision_etag(revision: int) -> str:
+    """Format a revision number as an entity tag value (without quotes).
+
+    Args:
+        revision: The revision number
+
+    Returns:
+        The ETag value for the revision
+    """
+    return str(revision)
+
+
+def parse_revision(value: Optional[str]) -> Optional[int]:
+    """Parse a revision from an ``If-Match`` header or form field.
+
+    Accepts plain numbers as well as quoted and weak entity tags. ``*`` and
+    empty values mean "no precondition".
+
+    Args:
+        value: The raw header or form value
+
+    Returns:
+        The revision number, or None if no precondition was given
+
+    Raises:
+        ValueError: If the value is not a valid revision
+    """
+    if value is None:
+        return None
+
+    value = value.split(",")[0].strip()
+    if not value or value == "*":
+        return None
+
+    if value.startswith("W/"):
+        value = value[2:]
+    revision = int(value.strip('"'))
+    if revision < 0:
+        raise ValueError("Revision must not be negative")
+    return revision
@@ -0,0 +1,116 @@
+"""In-process cache for the Flask-Login user loader.
+
+Flask-Login loads the current user on every authenticated request. Caching
+the loaded ``User`` for a short time avoids a ``users.find_one`` round-trip
+per request; writers that change a user document call ``invalidate`` so the
+next request sees the change.
+
+The cache lives in each worker process and ``invalidate`` only clears the
+calling process's entry: other workers keep serving the user they loaded
+until it expires, so ``USER_CACHE_TTL`` is how long a change to a user
+(a new password, a deleted account) can take to reach every worker. It
+defaults to a few seconds: long enough to serve the requests a page load
+makes from one lookup, short enough that a change reaches every worker
+almost at once.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+
+class UserCache:
+    """A thread-safe LRU cache whose entries expire after a fixed time."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 5.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def configure(self, maxsize: int, ttl: float) -> None:
+        """Change the cache limits and drop every entry.
+
+        Args:
+            maxsize: The maximum number of users kept (0 disables the cache)
+            ttl: How long an entry may be served, in seconds (0 disables the cache)
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self.ttl = ttl
+            self._entries.clear()
+
+    def get(self, user_id: str) -> Optional[Any]:
+        """Look up a cached user.
+
+        Args:
+            user_id: The user's ID
+
+        Returns:
+            The cached user, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, user_id: str, user: Any) -> None:
+        """Cache a user, evicting the least recently used entries if full.
+
+        Args:
+            user_id: The user's ID
+            user: The loaded user
+        """
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop a user from the cache after their document changed.
+
+        Only this process's cache is cleared; other workers see the change
+        once their entry expires.
+
+        Args:
+            user_id: The user's ID
+        """
+        with self._lock:
+            self._entries.pop(str(user_id), None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cache usage counters.
+
+        Returns:
+            A dictionary with hits, misses, evictions, the hit rate and the current size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+
+# Shared by the user loader and the auth routes
+user_cache = UserCache()